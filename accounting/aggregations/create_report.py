@@ -11,7 +11,7 @@ from pathlib import Path
 from pprint import pprint
 
 from query import run_query
-from functions import send_email 
+from functions import send_email, get_es_serializer
 from report_helpers import (
     Aggregation, 
     add_runtime_script, 
@@ -50,6 +50,8 @@ ELASTICSEARCH_ARGS = {
     "--es-use-https": {"action": "store_true"},
     "--es-ca-certs": {},
     "--es-timeout" : {"default" : 120, "type" : int, "help" : "defaults to 120 secs"},
+    "--es-serializer" : {"default" : "auto", "choices" : ["auto", "orjson", "msgspec", "json"],
+                         "help" : "JSON library for ES requests - defaults to 'auto' (orjson or msgspec if installed)"},
     "--es-config-file": {
         "type": Path,
         "help": "JSON file containing an object that sets above ES options",
@@ -141,6 +143,7 @@ def get_client(args: dict) -> elasticsearch.Elasticsearch:
  
         es_opts.update({"http_auth" : (args["es_user"], passwd_str)})
 
+    es_opts.update(get_es_serializer(args.get("es_serializer", "auto")))
     client = elasticsearch.Elasticsearch(**es_opts)
    
     return client
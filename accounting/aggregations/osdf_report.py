@@ -8,7 +8,7 @@ from operator import itemgetter
 from datetime import datetime, timedelta
 from pathlib import Path
 
-from functions import send_email, get_osdf_director_servers, get_topology_resource_data
+from functions import send_email, get_osdf_director_servers, get_topology_resource_data, get_es_serializer
 
 import elasticsearch
 from elasticsearch_dsl import Search, A, Q
@@ -33,6 +33,7 @@ ELASTICSEARCH_ARGS = {
     "--es-password-file": {"type": Path},
     "--es-use-https": {"action": "store_true"},
     "--es-ca-certs": {},
+    "--es-serializer": {"default": "auto", "choices": ["auto", "orjson", "msgspec", "json"]},
     "--es-config-file": {
         "type": Path,
         "help": "JSON file containing an object that sets above ES options",
@@ -93,6 +94,7 @@ def connect(
         es_use_https=False,
         es_ca_certs=None,
         es_url_prefix=None,
+        es_serializer="auto",
         **kwargs,
     ) -> elasticsearch.Elasticsearch:
     # Returns Elasticsearch client
@@ -134,7 +136,7 @@ def connect(
         es_client["verify_certs"] = True
         es_client.update(kwargs)
 
-    return elasticsearch.Elasticsearch([es_client])
+    return elasticsearch.Elasticsearch([es_client], **get_es_serializer(es_serializer))
 
 
 def get_endpoint_types(
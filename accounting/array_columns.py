@@ -0,0 +1,88 @@
+import logging
+from accounting.columns import Column, Category, ChainedColumn
+
+try:
+    import numpy as np
+except ModuleNotFoundError:
+    np = None
+
+
+# Aggregates with fewer jobs are computed with the Python backend,
+# where the per-call overhead of NumPy outweighs the vectorized loops
+ARRAY_MIN_JOBS = 256
+
+
+def get_compute_backend(backend="python"):
+    # Returns the backend used to compute custom columns,
+    # "auto" picks numpy if it is installed
+    if backend in {"auto", "numpy"} and np is not None:
+        return "numpy"
+    if backend == "numpy":
+        logging.getLogger("accounting").warning("numpy is not installed, computing columns in Python")
+    return "python"
+
+
+def to_array(values):
+    """Returns the values of a column as a float64 array with NaN
+    for missing (None) values. Raises TypeError or ValueError
+    if the column holds anything but numbers, bools and None."""
+    if isinstance(values, Category):
+        raise TypeError("Category columns can't be converted to arrays")
+    if isinstance(values, ChainedColumn):
+        return np.concatenate([to_array(column) for column in values.columns] or [np.empty(0)])
+    if isinstance(values, Column) and values.values is not None and type(values.values) is not list:
+        dtype = np.int64 if values.values.typecode == "q" else np.float64
+        array = np.frombuffer(values.values, dtype=dtype).astype(np.float64)
+        if values.missing is not None:
+            array[np.frombuffer(values.missing, dtype=np.uint8).astype(bool)] = np.nan
+        return array
+    array = np.fromiter(
+        (np.nan if value is None else value for value in values),
+        dtype=np.float64,
+        count=len(values),
+    )
+    return array
+
+
+class ArrayColumns(dict):
+    """Dict of attribute name -> array of an aggregate's stored column,
+    converted on first use so each column is converted only once"""
+
+    def __init__(self, data):
+        super().__init__()
+        self.data = data
+
+    def __missing__(self, attr):
+        array = to_array(self.data.get(attr, ()))
+        if len(array) == 0 and len(self.data) > 0:
+            # Missing attrs read as None for every job
+            array = np.full(num_jobs(self.data), np.nan)
+        self[attr] = array
+        return array
+
+
+def num_jobs(data):
+    """Returns the number of jobs stored in an aggregate's data"""
+    return max((len(values) for values in data.values() if isinstance(values, (list, Column, Category, ChainedColumn))), default=0)
+
+
+def is_true(array):
+    """Returns a bool mask of the values that are truthy and not missing"""
+    return (array != 0) & ~np.isnan(array)
+
+
+def nansum(array):
+    """Returns the sum of the non-missing values as a Python float"""
+    return float(np.nansum(array))
+
+
+def not_missing(array):
+    """Returns the non-missing values"""
+    return array[~np.isnan(array)]
+
+
+def order_stats(values, indices):
+    """Returns the values at the given indices of sorted(values),
+    partitioning values around those indices instead of sorting"""
+    partitioned = np.partition(values, sorted(set(indices)))
+    return [float(partitioned[index]) for index in indices]
@@ -0,0 +1,146 @@
+NUMERIC_MAPPING_TYPES = frozenset({
+    "long", "integer", "short", "byte", "unsigned_long",
+    "double", "float", "half_float", "scaled_float",
+})
+
+
+def to_int(value):
+    """Returns value as an int if it is a string like "3600.0",
+    or None if it can't be parsed. Numbers are left as stored."""
+    if not isinstance(value, str):
+        return value
+    try:
+        return int(float(value))
+    except ValueError:
+        return None
+
+
+def to_float(value):
+    """Returns value as a float if it is a string,
+    or None if it can't be parsed. Numbers are left as stored."""
+    if not isinstance(value, str):
+        return value
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+CONVERTERS = {int: to_int, float: to_float}
+
+
+class Attr:
+    """Job ad attribute with a canonical name, other names (aliases)
+    that it is stored under in some indices, and the type that
+    its string values are parsed as (None to keep values as stored)"""
+
+    def __init__(self, name, aliases=(), type=None):
+        self.name = name
+        self.aliases = tuple(aliases)
+        self.type = type
+
+    @property
+    def numeric(self):
+        return self.type in {int, float}
+
+
+class AttrNormalizer:
+    """Sets the canonical attributes of a job ad in place, from the
+    first of the canonical name or aliases that has a value, parsed
+    as the attribute's type if it is a string. Aliases are left as they are."""
+
+    def __init__(self, attrs):
+        self.attrs = frozenset(attr.name for attr in attrs)
+        self.specs = tuple(
+            (attr.name, attr.aliases, CONVERTERS.get(attr.type))
+            for attr in attrs
+        )
+
+    def __call__(self, ad):
+        for (name, aliases, convert) in self.specs:
+            value = ad.get(name)
+            if value is None:
+                for alias in aliases:
+                    value = ad.get(alias)
+                    if value is not None:
+                        break
+                else:
+                    continue
+            if convert is not None:
+                value = convert(value)
+            ad[name] = value
+        return ad
+
+
+class AttrSchema:
+    """Canonical names, aliases and types of job ad attributes"""
+
+    def __init__(self, attrs):
+        self.attrs = {attr.name: attr for attr in attrs}
+
+    def get_attrs(self, source_attrs=None):
+        """Returns the schema's attributes that are named (by canonical name
+        or alias) in source_attrs, or all of them if source_attrs is None"""
+        if source_attrs is None:
+            return list(self.attrs.values())
+        source_attrs = set(source_attrs)
+        return [
+            attr for attr in self.attrs.values()
+            if attr.name in source_attrs or not source_attrs.isdisjoint(attr.aliases)
+        ]
+
+    def get_names(self, source_attrs):
+        """Returns source_attrs plus the canonical names and aliases
+        of the schema's attributes named in source_attrs, so that
+        every name an attribute is normalized from gets fetched"""
+        names = set(source_attrs)
+        for attr in self.get_attrs(source_attrs):
+            names.add(attr.name)
+            names.update(attr.aliases)
+        return sorted(names)
+
+    def compile(self, source_attrs=None):
+        """Returns an AttrNormalizer for the attributes
+        named in source_attrs (or all attributes)"""
+        return AttrNormalizer(self.get_attrs(source_attrs))
+
+    def get_mapping_drift(self, field_mappings, source_attrs=None):
+        """Returns (field, mapping type, indices) for each name (canonical
+        or alias) of a numeric attribute that an index maps as something
+        other than a number, given the response of
+        Elasticsearch.indices.get_field_mapping()"""
+        numeric_attrs = set(self.numeric_names(source_attrs))
+        drift = {}
+        for (index, index_mappings) in field_mappings.items():
+            for (field, field_mapping) in index_mappings.get("mappings", {}).items():
+                if field not in numeric_attrs:
+                    continue
+                for mapping in field_mapping.get("mapping", {}).values():
+                    mapping_type = mapping.get("type")
+                    if mapping_type not in NUMERIC_MAPPING_TYPES:
+                        drift.setdefault((field, mapping_type), []).append(index)
+        return [(attr, mapping_type, sorted(indices)) for ((attr, mapping_type), indices) in sorted(drift.items(), key=str)]
+
+    def numeric_names(self, source_attrs=None):
+        """Returns the canonical names and aliases of the numeric attributes"""
+        names = set()
+        for attr in self.get_attrs(source_attrs):
+            if attr.numeric:
+                names.add(attr.name)
+                names.update(attr.aliases)
+        return sorted(names)
+
+
+# Attributes that some indices store under lowercase names
+# and/or as strings, e.g. the CHTC and PATh schedd histories
+JOB_AD_SCHEMA = AttrSchema([
+    Attr("GlobalJobId", aliases=["globaljobid"]),
+    Attr("ScheddName", aliases=["scheddname"]),
+    Attr("ProjectName", aliases=["projectname"]),
+    Attr("LastRemoteHost", aliases=["lastremotehost"]),
+    Attr("MATCH_EXP_JOBGLIDEIN_ResourceName", aliases=["match_exp_jobglidein_resourcename"]),
+    Attr("LastRemoteWallClockTime", aliases=["lastremotewallclocktime"], type=int),
+    Attr("ActivationDuration", aliases=["activationduration"], type=int),
+    Attr("ActivationSetupDuration", aliases=["activationsetupduration"], type=int),
+    Attr("NumHolds", aliases=["numholds"], type=int),
+])
@@ -0,0 +1,654 @@
+import statistics as stats
+from collections import Counter
+from accounting.columns import mode, count_distinct, value_counts
+from accounting.array_columns import np, ArrayColumns, is_true, not_missing
+from accounting.quantiles import QuantileSketch
+from accounting.distinct import merge_distinct
+
+
+MISSING = -999  # stands in for an empty list of values, like BaseFilter.clean()
+
+
+def clean(values):
+    """Returns the non-None values"""
+    return [x for x in values if x is not None]
+
+
+class Field:
+    """Derived per-job value, computed as func(*values)
+    from the values of the given attrs (or other Fields).
+
+    array_func computes the same values for all jobs at once
+    from float arrays of the attrs (NaN for None), and is needed
+    to compute the specs with NumPy."""
+
+    def __init__(self, name, func, *attrs, array_func=None):
+        self.name = name
+        self.func = func
+        self.attrs = attrs
+        self.array_func = array_func
+
+
+class Metric:
+    """Column computed from the non-None values of field
+    for the jobs where the where field is true.
+
+    fill stands in for an empty list of values, columns with fewer
+    than min_values values are set to empty, and the reduced value
+    is divided by divide (if set).
+
+    Mergeable metrics can also be finished from the merged summaries
+    of disjoint lists of values (e.g. the TOTAL of several aggregates)
+    instead of from the values themselves."""
+
+    fill = None
+    empty = None
+    min_values = 0
+    sort = False
+    use_column = False
+    mergeable = False
+
+    def __init__(self, column, field=None, where=None, divide=None, reduce=None, **kwargs):
+        self.column = column
+        self.field = field
+        self.where = where
+        self.divide = divide
+        if reduce is not None:
+            self.reduce = reduce
+            self.mergeable = False
+        for (attr, value) in kwargs.items():
+            if not hasattr(type(self), attr):
+                raise TypeError(f"{type(self).__name__} got an unexpected keyword argument '{attr}'")
+            setattr(self, attr, value)
+
+    def reduce(self, values):
+        raise NotImplementedError
+
+    def reduce_array(self, values):
+        raise NotImplementedError
+
+    def finish(self, values):
+        if len(values) == 0 and self.fill is not None:
+            values = [self.fill]
+        if len(values) < self.min_values:
+            return self.empty
+        value = self.reduce(values)
+        if self.divide is not None:
+            value = value / self.divide
+        return value
+
+    def finish_array(self, values):
+        # Same as finish(), from a NumPy array of the non-None values
+        if len(values) == 0:
+            return self.finish([])
+        if len(values) < self.min_values:
+            return self.empty
+        value = self.reduce_array(values)
+        if self.divide is not None:
+            value = value / self.divide
+        return value
+
+    def summarize(self, values):
+        # Returns a mergeable summary of the values
+        raise NotImplementedError
+
+    def summarize_array(self, values):
+        # Same as summarize(), from a NumPy array of the non-None values
+        return self.summarize(values.tolist())
+
+    def merge(self, summary, other):
+        # Returns the merged summary of two disjoint lists of values
+        raise NotImplementedError
+
+    def finish_summary(self, summary):
+        # Same as finish(), from the (merged) summary of the values
+        raise NotImplementedError
+
+
+class Sum(Metric):
+    mergeable = True
+
+    def reduce(self, values):
+        return sum(values)
+
+    def reduce_array(self, values):
+        return float(values.sum())
+
+    def summarize(self, values):
+        return self.reduce(values)
+
+    def summarize_array(self, values):
+        return self.reduce_array(values)
+
+    def merge(self, summary, other):
+        return summary + other
+
+    def finish_summary(self, summary):
+        return self.finish([summary])
+
+
+class Count(Metric):
+    # Counts jobs with a non-None field (or any jobs if no field is given)
+    mergeable = True
+
+    def reduce(self, values):
+        return len(values)
+
+    def reduce_array(self, values):
+        return len(values)
+
+    def summarize(self, values):
+        return len(values)
+
+    def merge(self, summary, other):
+        return summary + other
+
+    def finish_summary(self, summary):
+        if summary < self.min_values:
+            return self.empty
+        if self.divide is not None:
+            return summary / self.divide
+        return summary
+
+
+class Max(Metric):
+    # Summarized by the max value (None if there are no values),
+    # so only mergeable with at most 1 min_values
+    fill = MISSING
+    mergeable = True
+
+    def reduce(self, values):
+        return max(values)
+
+    def reduce_array(self, values):
+        return float(values.max())
+
+    def summarize(self, values):
+        return max(values, default=None)
+
+    def summarize_array(self, values):
+        return float(values.max()) if len(values) > 0 else None
+
+    def merge(self, summary, other):
+        if summary is None or other is None:
+            return other if summary is None else summary
+        return max(summary, other)
+
+    def finish_summary(self, summary):
+        return self.finish([] if summary is None else [summary])
+
+
+class Median(Metric):
+    fill = MISSING
+
+    def reduce(self, values):
+        return stats.median(values)
+
+    def reduce_array(self, values):
+        return float(np.median(values))
+
+
+class Mean(Metric):
+    # Summarized by the sum and number of values
+    # (not mergeable with a custom reduce)
+    empty = ""
+    min_values = 1
+    mergeable = True
+
+    def reduce(self, values):
+        return sum(values) / len(values)
+
+    def reduce_array(self, values):
+        return float(values.mean())
+
+    def summarize(self, values):
+        return (sum(values), len(values))
+
+    def summarize_array(self, values):
+        return (float(values.sum()), len(values))
+
+    def merge(self, summary, other):
+        return (summary[0] + other[0], summary[1] + other[1])
+
+    def finish_summary(self, summary):
+        (total, count) = summary
+        if count < self.min_values:
+            return self.empty
+        value = total / count
+        if self.divide is not None:
+            value = value / self.divide
+        return value
+
+
+class Stdev(Metric):
+    empty = 0
+    min_values = 2
+
+    def reduce(self, values):
+        return stats.stdev(values)
+
+    def reduce_array(self, values):
+        return float(values.std(ddof=1))
+
+
+class Percentile(Metric):
+    # Value at index int(q*len(values)) of the sorted values
+    empty = 0
+    min_values = 1
+    sort = True
+
+    def __init__(self, column, field=None, q=0.5, **kwargs):
+        super().__init__(column, field, **kwargs)
+        self.q = q
+
+    def reduce(self, values):
+        return values[min(int(self.q * len(values)), len(values) - 1)]
+
+    def reduce_array(self, values):
+        # Partitions around the index instead of sorting
+        index = min(int(self.q * len(values)), len(values) - 1)
+        return float(np.partition(values, index)[index])
+
+
+class Mode(Metric):
+    # Most common non-None value, from the whole column
+    # (summarized by its value counts)
+    use_column = True
+    mergeable = True
+
+    def finish(self, values):
+        return mode(values)
+
+    def summarize(self, values):
+        return Counter(value_counts(values))
+
+    def merge(self, summary, other):
+        summary.update(other)
+        return summary
+
+    def finish_summary(self, summary):
+        return self.finish(summary)
+
+
+class Distinct(Mode):
+    # Number of distinct values, from the whole column
+    # (summarized by its value counts)
+
+    def finish(self, values):
+        return count_distinct(values)
+
+
+class DistinctCount(Metric):
+    # Number of distinct values, from the column of distinct counts
+    # (e.g. HyperLogLogs) kept by track_distinct()
+    use_column = True
+    mergeable = True
+
+    def finish(self, values):
+        return self.finish_summary(self.summarize(values))
+
+    def summarize(self, values):
+        return merge_distinct(values)
+
+    def merge(self, summary, other):
+        if summary is None or other is None:
+            return other if summary is None else summary
+        return summary.merge(other)
+
+    def finish_summary(self, summary):
+        return 0 if summary is None else len(summary)
+
+
+class Ratio:
+    """Column computed as scale * numerator / denominator from two
+    other columns, or empty if the denominator is not positive"""
+
+    def __init__(self, column, numerator, denominator, scale=None, empty=0):
+        self.column = column
+        self.numerator = numerator
+        self.denominator = denominator
+        self.scale = scale
+        self.empty = empty
+
+    def finish(self, row):
+        if not row[self.denominator] > 0:
+            return self.empty
+        if self.scale is not None:
+            return self.scale * row[self.numerator] / row[self.denominator]
+        return row[self.numerator] / row[self.denominator]
+
+
+class Reducer:
+    """Custom one-pass reducer for columns that do not fit the other
+    specs. update() is called for every job with the values of attrs
+    (stored attrs or Fields), and finish() adds any number of
+    columns to the row. Mergeable reducers can merge the states of
+    disjoint sets of jobs."""
+
+    attrs = ()
+    mergeable = False
+
+    def start(self):
+        raise NotImplementedError
+
+    def update(self, state, *values):
+        raise NotImplementedError
+
+    def merge(self, state, other):
+        # Returns the merged state of two disjoint sets of jobs
+        raise NotImplementedError
+
+    def finish(self, state, row):
+        raise NotImplementedError
+
+
+class Quantiles(Reducer):
+    """Quantile, median, mean and stdev columns of the non-None values
+    of field, computed from a QuantileSummary returned by summary()
+    (by default an estimating QuantileSketch) in bounded memory
+    instead of from a sorted list of the values. columns maps each
+    column to its stat, one of the QuantileSummary.stat() stats, e.g.
+    {"Min Hrs": 0, "Med Hrs": "median", "Std Hrs": "stdev"}.
+    Empty columns are 0."""
+
+    mergeable = True
+
+    def __init__(self, columns, field, divide=None, summary=QuantileSketch):
+        self.columns = columns
+        self.attrs = (field,)
+        self.divide = divide
+        self.summary = summary
+
+    def start(self):
+        return self.summary()
+
+    def update(self, summary, value):
+        if value is not None:
+            summary.add(value)
+
+    def merge(self, summary, other):
+        return summary.merge(other)
+
+    def finish(self, summary, row):
+        values = summary.get_stats(list(self.columns.values()))
+        for (column, value) in zip(self.columns, values):
+            if self.divide is not None and len(summary) > 0:
+                value = value / self.divide
+            row[column] = value
+
+
+class ColumnSpecs:
+    """Compiles a list of Fields, Metrics, Ratios and Reducers into one
+    fused pass over the jobs of an aggregate.
+
+    The pass is generated as a single Python loop over the stored
+    columns that computes each needed Field once per job, appends to
+    one list of values per distinct (field, where) pair and feeds the
+    Reducers. Metrics over stored attrs without a where skip the loop
+    and read the stored column directly. Results are the same as the
+    equivalent sum(), max(), stats.median() etc. over the cleaned
+    lists of values.
+
+    With use_arrays=True (and NumPy installed), the Fields and where
+    masks are computed from arrays of the stored columns instead, and
+    the loop only runs for the Reducers. Sums and means may then differ
+    from the loop's in the last bits, since NumPy adds floats pairwise.
+
+    The row of the union of several aggregates (e.g. the TOTAL row) can
+    be computed by compute_total() from the merged summaries of their
+    rows, which only reads the stored columns for the Metrics and
+    Reducers that can't be merged (e.g. medians)."""
+
+    def __init__(self, specs):
+        self.fields = {spec.name: spec for spec in specs if isinstance(spec, Field)}
+        self.metrics = [spec for spec in specs if isinstance(spec, Metric)]
+        self.ratios = [spec for spec in specs if isinstance(spec, Ratio)]
+        self.reducers = [spec for spec in specs if isinstance(spec, Reducer)]
+
+        # Values collected in the loop vs. read straight from the stored columns
+        self.loop_keys = []
+        self.column_keys = []
+        for metric in self.metrics:
+            if metric.use_column:
+                continue
+            key = (metric.field, metric.where)
+            if key in self.loop_keys or key in self.column_keys:
+                continue
+            if metric.where is None and metric.field is not None and metric.field not in self.fields:
+                self.column_keys.append(key)
+            else:
+                self.loop_keys.append(key)
+
+        # Fields (in dependency order) and stored attrs read in the loop
+        self.loop_fields = []
+        self.attrs = []
+        for (field, where) in self.loop_keys:
+            for name in (field, where):
+                if name is not None:
+                    self.add_loop_name(name, self.loop_fields, self.attrs)
+        for reducer in self.reducers:
+            for name in reducer.attrs:
+                self.add_loop_name(name, self.loop_fields, self.attrs)
+
+        self.source = self.get_loop_source(self.loop_fields, self.attrs, self.loop_keys, self.reducers)
+        self.loop = self.compile_loop(self.source)
+
+        # With arrays, the Fields of the loop keys are computed by their
+        # array_funcs and the loop only computes the Reducers' values
+        self.array_fields = []
+        for (field, where) in self.loop_keys:
+            for name in (field, where):
+                if name is not None:
+                    self.add_loop_name(name, self.array_fields, [])
+        self.supports_arrays = np is not None and all(field.array_func is not None for field in self.array_fields)
+        self.reducer_fields = []
+        self.reducer_attrs = []
+        for reducer in self.reducers:
+            for name in reducer.attrs:
+                self.add_loop_name(name, self.reducer_fields, self.reducer_attrs)
+        self.reducer_loop = self.compile_loop(self.get_loop_source(self.reducer_fields, self.reducer_attrs, [], self.reducers))
+
+        # Specs of the columns of a compute_total() that can't be merged
+        self.total_specs = None
+
+    def add_loop_name(self, name, loop_fields, attrs):
+        if name in self.fields:
+            field = self.fields[name]
+            if field in loop_fields:
+                return
+            for attr in field.attrs:
+                self.add_loop_name(attr, loop_fields, attrs)
+            loop_fields.append(field)
+        elif name not in attrs:
+            attrs.append(name)
+
+    def compile_loop(self, source):
+        namespace = {}
+        exec(compile(source, "<column specs>", "exec"), namespace)
+        return namespace["loop"]
+
+    def get_loop_source(self, loop_fields, attrs, loop_keys, reducers):
+        # Returns the source of the fused loop, which only refers to
+        # attrs, Fields, lists and Reducers by generated variable names
+        names = {attr: f"a{n}" for (n, attr) in enumerate(attrs)}
+        names.update({field.name: f"f{n}" for (n, field) in enumerate(loop_fields)})
+        lines = [
+            "def loop(columns, funcs, lists, updates, states):",
+        ]
+        for n in range(len(loop_fields)):
+            lines.append(f"    func{n} = funcs[{n}]")
+        for n in range(len(loop_keys)):
+            lines.append(f"    append{n} = lists[{n}].append")
+        for n in range(len(reducers)):
+            lines.append(f"    update{n} = updates[{n}]")
+            lines.append(f"    state{n} = states[{n}]")
+        if len(attrs) == 0:
+            lines.append("    return")
+            return "\n".join(lines) + "\n"
+        lines.append(f"    for ({', '.join(names[attr] for attr in attrs)},) in zip(*columns):")
+        for (n, field) in enumerate(loop_fields):
+            lines.append(f"        {names[field.name]} = func{n}({', '.join(names[attr] for attr in field.attrs)})")
+        for (n, (field, where)) in enumerate(loop_keys):
+            if field is None:
+                lines.append(f"        if {names[where]}:")
+                lines.append(f"            append{n}(True)")
+            elif where is None:
+                lines.append(f"        if {names[field]} is not None:")
+                lines.append(f"            append{n}({names[field]})")
+            else:
+                lines.append(f"        if {names[where]} and {names[field]} is not None:")
+                lines.append(f"            append{n}({names[field]})")
+        for (n, reducer) in enumerate(reducers):
+            lines.append(f"        update{n}(state{n}, {', '.join(names[attr] for attr in reducer.attrs)})")
+        return "\n".join(lines) + "\n"
+
+    def compute(self, data, use_arrays=False, summary=None):
+        # Returns a dict of column name -> value for one aggregate,
+        # computed from arrays if use_arrays and the specs support it,
+        # or from lists if any column can't be converted to an array.
+        # If a summary dict is given, it is filled with the summaries
+        # of the mergeable Metrics and states of the mergeable Reducers.
+        (row, states) = self.compute_metrics(data, use_arrays, summary)
+        if summary is not None:
+            for (n, (reducer, state)) in enumerate(zip(self.reducers, states)):
+                if reducer.mergeable:
+                    summary[n] = state
+        return self.finish(row, states)
+
+    def compute_metrics(self, data, use_arrays=False, summary=None):
+        # Returns the Metrics' columns and the Reducers' states
+        if use_arrays and self.supports_arrays:
+            try:
+                return self.compute_arrays(data, summary)
+            except (TypeError, ValueError):
+                pass
+
+        row = {}
+        collected = {key: [] for key in self.loop_keys}
+        states = [reducer.start() for reducer in self.reducers]
+
+        self.loop(
+            [data[attr] for attr in self.attrs],
+            [field.func for field in self.loop_fields],
+            [collected[key] for key in self.loop_keys],
+            [reducer.update for reducer in self.reducers],
+            states,
+        )
+
+        for (field, where) in self.column_keys:
+            collected[(field, where)] = clean(data[field])
+
+        sorted_values = {}
+        for metric in self.metrics:
+            if metric.use_column:
+                values = data[metric.field]
+            else:
+                key = (metric.field, metric.where)
+                values = collected[key]
+                if metric.sort:
+                    if key not in sorted_values:
+                        sorted_values[key] = sorted(values)
+                    values = sorted_values[key]
+            row[metric.column] = metric.finish(values)
+            if summary is not None and metric.mergeable:
+                summary[metric.column] = metric.summarize(values)
+
+        return (row, states)
+
+    def compute_arrays(self, data, summary=None):
+        # Same as compute_metrics(), with the Fields, where masks and
+        # loop key Metrics computed by NumPy from arrays of the stored columns
+        arrays = ArrayColumns(data)
+        for field in self.array_fields:
+            arrays[field.name] = np.asarray(field.array_func(*[arrays[attr] for attr in field.attrs]), dtype=np.float64)
+
+        collected = {}
+        for (field, where) in self.loop_keys:
+            if field is None:
+                values = np.ones(np.count_nonzero(is_true(arrays[where])))
+            elif where is None:
+                values = not_missing(arrays[field])
+            else:
+                values = arrays[field][is_true(arrays[where])]
+                values = not_missing(values)
+            collected[(field, where)] = values
+
+        # The Reducers still see every job's values
+        states = [reducer.start() for reducer in self.reducers]
+        self.reducer_loop(
+            [data[attr] for attr in self.reducer_attrs],
+            [field.func for field in self.reducer_fields],
+            [],
+            [reducer.update for reducer in self.reducers],
+            states,
+        )
+
+        # Metrics over stored attrs without a where read the stored
+        # columns as lists, since they may hold strings
+        row = {}
+        column_values = {}
+        for metric in self.metrics:
+            if metric.use_column:
+                values = data[metric.field]
+                row[metric.column] = metric.finish(values)
+            else:
+                key = (metric.field, metric.where)
+                if key in collected:
+                    values = collected[key]
+                    row[metric.column] = metric.finish_array(values)
+                    if summary is not None and metric.mergeable:
+                        summary[metric.column] = metric.summarize_array(values)
+                    continue
+                if key not in column_values:
+                    column_values[key] = clean(data[metric.field])
+                values = column_values[key]
+                row[metric.column] = metric.finish(values)
+            if summary is not None and metric.mergeable:
+                summary[metric.column] = metric.summarize(values)
+
+        return (row, states)
+
+    def merge_summaries(self, summary, other):
+        # Returns the merged compute() summaries of two disjoint sets of jobs
+        if len(summary) == 0:
+            return other
+        for metric in self.metrics:
+            if metric.mergeable:
+                summary[metric.column] = metric.merge(summary[metric.column], other[metric.column])
+        for (n, reducer) in enumerate(self.reducers):
+            if reducer.mergeable:
+                summary[n] = reducer.merge(summary[n], other[n])
+        return summary
+
+    def compute_total(self, summary, data, use_arrays=False):
+        # Returns the same row as compute() for the union of several
+        # aggregates, finishing the mergeable columns from the merged
+        # summaries of the aggregates and computing only the rest from
+        # data (e.g. a TotalColumns view of the aggregates' columns)
+        if self.total_specs is None:
+            self.total_specs = ColumnSpecs(
+                list(self.fields.values())
+                + [metric for metric in self.metrics if not metric.mergeable]
+                + [reducer for reducer in self.reducers if not reducer.mergeable]
+            )
+        (total_row, total_states) = self.total_specs.compute_metrics(data, use_arrays)
+
+        row = {}
+        for metric in self.metrics:
+            if metric.mergeable:
+                row[metric.column] = metric.finish_summary(summary[metric.column])
+            else:
+                row[metric.column] = total_row[metric.column]
+        total_states = iter(total_states)
+        states = [summary[n] if reducer.mergeable else next(total_states) for (n, reducer) in enumerate(self.reducers)]
+        return self.finish(row, states)
+
+    def finish(self, row, states):
+        # Adds the Reducers' and Ratios' columns to the row
+        for (reducer, state) in zip(self.reducers, states):
+            reducer.finish(state, row)
+
+        for ratio in self.ratios:
+            row[ratio.column] = ratio.finish(row)
+
+        return row
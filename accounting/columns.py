@@ -0,0 +1,404 @@
+from array import array
+from itertools import chain
+from collections import Counter
+from collections.abc import Mapping, MutableSequence, Sequence
+
+
+TYPECODES = {
+    int: "q",
+    float: "d",
+}
+INT_MIN = -2**63
+INT_MAX = 2**63 - 1
+
+
+class Column(MutableSequence):
+    """List-like column of job attribute values
+
+    Values are kept in a typed array while they are all ints or all
+    floats, with a bytearray mask marking missing (None) values. The
+    column falls back to a plain list as soon as any other value (or a
+    mix of ints and floats) is appended, so reads always give back the
+    same values a list would have held."""
+
+    __slots__ = ("values", "missing")
+
+    def __init__(self, values=()):
+        self.values = None  # array("q"), array("d"), or list
+        self.missing = None  # bytearray, allocated on the first None
+        self.extend(values)
+
+    def tolist(self):
+        # Returns the values as a new plain list
+        values = self.values
+        if values is None:
+            return []
+        if type(values) is list:
+            return values.copy()
+        if self.missing is None:
+            return values.tolist()
+        return [None if is_missing else value for (value, is_missing) in zip(values.tolist(), self.missing)]
+
+    def to_object_list(self):
+        # Switches the storage over to a plain list
+        if type(self.values) is not list:
+            self.values = self.tolist()
+            self.missing = None
+
+    def append(self, value):
+        values = self.values
+        if type(values) is list:
+            values.append(value)
+            return
+
+        if value is None:
+            if values is None:
+                self.values = values = array("q")
+            if self.missing is None:
+                self.missing = bytearray(len(values))
+            values.append(0)
+            self.missing.append(1)
+            return
+
+        typecode = TYPECODES.get(type(value))
+        if typecode == "q" and not INT_MIN <= value <= INT_MAX:
+            typecode = None
+        if typecode is None:
+            self.to_object_list()
+            self.values.append(value)
+            return
+
+        if values is None:
+            self.values = values = array(typecode)
+        elif values.typecode != typecode:
+            if self.missing is not None and all(self.missing):
+                # Only missing values so far, so retype the array
+                self.values = values = array(typecode, [0] * len(values))
+            else:
+                self.to_object_list()
+                self.values.append(value)
+                return
+
+        values.append(value)
+        if self.missing is not None:
+            self.missing.append(0)
+
+    def extend(self, values):
+        if isinstance(values, Column):
+            values = values.tolist()
+        if type(self.values) is list:
+            self.values.extend(values)
+            return
+        for value in values:
+            self.append(value)
+
+    def __iadd__(self, values):
+        self.extend(values)
+        return self
+
+    def __add__(self, values):
+        return self.tolist() + list(values)
+
+    def __radd__(self, values):
+        return list(values) + self.tolist()
+
+    def __len__(self):
+        return 0 if self.values is None else len(self.values)
+
+    def __iter__(self):
+        if type(self.values) is list:
+            return iter(self.values)
+        return iter(self.tolist())
+
+    def __getitem__(self, key):
+        values = self.values
+        if type(values) is list:
+            return values[key]
+        if values is None or self.missing is not None or isinstance(key, slice):
+            return self.tolist()[key]
+        return values[key]
+
+    def __setitem__(self, key, value):
+        self.to_object_list()
+        self.values[key] = value
+
+    def __delitem__(self, key):
+        self.to_object_list()
+        del self.values[key]
+
+    def insert(self, index, value):
+        self.to_object_list()
+        self.values.insert(index, value)
+
+    def sort(self, *args, **kwargs):
+        self.to_object_list()
+        self.values.sort(*args, **kwargs)
+
+    def count(self, value):
+        return self.tolist().count(value)
+
+    def index(self, value, *args):
+        return self.tolist().index(value, *args)
+
+    def __contains__(self, value):
+        return value in self.tolist()
+
+    def __eq__(self, other):
+        if isinstance(other, Column):
+            other = other.tolist()
+        return self.tolist() == other
+
+    def __repr__(self):
+        return repr(self.tolist())
+
+    def __getstate__(self):
+        return (self.values, self.missing)
+
+    def __setstate__(self, state):
+        (self.values, self.missing) = state
+
+
+class Category(MutableSequence):
+    """List-like column of repeated values (e.g. User or ScheddName)
+
+    Each distinct value is stored once and the column keeps a small
+    integer code per job plus a running count per distinct value, so
+    modes and distinct counts come from the counts instead of rescanning
+    the column. Values must be hashable."""
+
+    __slots__ = ("codes", "categories", "category_codes", "counts")
+
+    def __init__(self, values=()):
+        self.codes = array("I")
+        self.categories = []
+        self.category_codes = {}
+        self.counts = []
+        self.extend(values)
+
+    def get_code(self, value):
+        # Returns the code for value, adding value as a new category if needed
+        code = self.category_codes.get(value)
+        if code is None:
+            code = len(self.categories)
+            self.categories.append(value)
+            self.category_codes[value] = code
+            self.counts.append(0)
+        return code
+
+    def value_counts(self):
+        # Returns a dict of value -> count in first seen order
+        return {value: count for (value, count) in zip(self.categories, self.counts) if count > 0}
+
+    def tolist(self):
+        # Returns the values as a new plain list
+        categories = self.categories
+        return [categories[code] for code in self.codes]
+
+    def append(self, value):
+        code = self.get_code(value)
+        self.codes.append(code)
+        self.counts[code] += 1
+
+    def extend(self, values):
+        if isinstance(values, Category):
+            codes = [self.get_code(value) for value in values.categories]
+            for (code, count) in zip(codes, values.counts):
+                self.counts[code] += count
+            self.codes.extend(codes[code] for code in values.codes)
+            return
+        for value in values:
+            self.append(value)
+
+    def __iadd__(self, values):
+        self.extend(values)
+        return self
+
+    def __add__(self, values):
+        return self.tolist() + list(values)
+
+    def __radd__(self, values):
+        return list(values) + self.tolist()
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __iter__(self):
+        return map(self.categories.__getitem__, self.codes)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.tolist()[key]
+        return self.categories[self.codes[key]]
+
+    def __setitem__(self, key, value):
+        if isinstance(key, slice):
+            values = self.tolist()
+            values[key] = value
+            self.__init__(values)
+            return
+        self.counts[self.codes[key]] -= 1
+        code = self.get_code(value)
+        self.codes[key] = code
+        self.counts[code] += 1
+
+    def __delitem__(self, key):
+        if isinstance(key, slice):
+            values = self.tolist()
+            del values[key]
+            self.__init__(values)
+            return
+        self.counts[self.codes[key]] -= 1
+        del self.codes[key]
+
+    def insert(self, index, value):
+        code = self.get_code(value)
+        self.codes.insert(index, code)
+        self.counts[code] += 1
+
+    def count(self, value):
+        code = self.category_codes.get(value)
+        return 0 if code is None else self.counts[code]
+
+    def __contains__(self, value):
+        return self.count(value) > 0
+
+    def __eq__(self, other):
+        if isinstance(other, (Column, Category)):
+            other = other.tolist()
+        return self.tolist() == other
+
+    def __repr__(self):
+        return repr(self.tolist())
+
+    def __getstate__(self):
+        return (self.codes, self.categories, self.counts)
+
+    def __setstate__(self, state):
+        (self.codes, self.categories, self.counts) = state
+        self.category_codes = {value: code for (code, value) in enumerate(self.categories)}
+
+
+class ColumnDict(dict):
+    """Dict of attribute name -> column that creates missing columns
+    on first use, like defaultdict(column_type), except that attributes
+    in categorical_attrs get a Category column"""
+
+    def __init__(self, column_type=list, categorical_attrs=frozenset(), *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.column_type = column_type
+        self.categorical_attrs = categorical_attrs
+
+    def __missing__(self, attr):
+        if attr in self.categorical_attrs:
+            column = Category()
+        else:
+            column = self.column_type()
+        self[attr] = column
+        return column
+
+    def __reduce__(self):
+        return (type(self), (self.column_type, self.categorical_attrs), None, None, iter(self.items()))
+
+
+class ChainedColumn(Sequence):
+    """Read-only view of several columns that reads like their
+    concatenation, without copying their values"""
+
+    __slots__ = ("columns",)
+
+    def __init__(self, columns=()):
+        self.columns = list(columns)
+
+    def value_counts(self):
+        # Returns a dict of value -> count in first seen order,
+        # summed from the value counts of each column
+        counts = Counter()
+        for column in self.columns:
+            counts.update(value_counts(column))
+        return counts
+
+    def tolist(self):
+        # Returns the values as a new plain list
+        return list(self)
+
+    def __len__(self):
+        return sum(len(column) for column in self.columns)
+
+    def __iter__(self):
+        return chain.from_iterable(self.columns)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.tolist()[key]
+        if key < 0:
+            key += len(self)
+        for column in self.columns:
+            if 0 <= key < len(column):
+                return column[key]
+            key -= len(column)
+        raise IndexError("column index out of range")
+
+    def __repr__(self):
+        return repr(self.tolist())
+
+
+class TotalColumns(Mapping):
+    """Read-only dict of attribute name -> column of the jobs of
+    several aggregates (e.g. the TOTAL of an aggregation level),
+    where each column is a ChainedColumn of the aggregates' columns.
+    Attributes that no aggregate has read as empty columns."""
+
+    def __init__(self, aggregates=()):
+        self.aggregates = list(aggregates)
+
+    def __getitem__(self, attr):
+        return ChainedColumn(data[attr] for data in self.aggregates if attr in data)
+
+    def __contains__(self, attr):
+        return any(attr in data for data in self.aggregates)
+
+    def __iter__(self):
+        return iter(dict.fromkeys(attr for data in self.aggregates for attr in data))
+
+    def __len__(self):
+        return sum(1 for attr in self)
+
+
+def value_counts(values):
+    """Returns dict of value -> count, using the running counts of
+    Category columns instead of rescanning them (a Counter is taken
+    as the value counts of a column and returned as is)"""
+    if isinstance(values, Counter):
+        return values
+    if isinstance(values, (Category, ChainedColumn)):
+        return values.value_counts()
+    return Counter(values)
+
+
+def mode(values, default="UNKNOWN"):
+    """Returns the most common non-None value (first seen wins ties)"""
+    counts = value_counts(values)
+    return max((value for value in counts if value is not None), key=counts.get, default=default)
+
+
+def count_distinct(values):
+    """Returns the number of distinct values (None included)"""
+    return len(value_counts(values))
+
+
+def merge_values(values, partial_values):
+    """Returns values merged with the partial_values of the same field
+    from a later part of a scan, updating values in place if possible:
+    lists and columns are concatenated, dicts are merged key by key
+    and numbers are summed"""
+    if isinstance(partial_values, dict):
+        for (key, value) in partial_values.items():
+            if key in values:
+                values[key] = merge_values(values[key], value)
+            else:
+                values[key] = value
+        return values
+    if isinstance(values, (int, float)):
+        return values + partial_values
+    values += partial_values
+    return values
@@ -0,0 +1,33 @@
+from functools import lru_cache
+
+
+@lru_cache(maxsize=1024)
+def parse_condor_version(condor_version):
+    """Returns the version of a CondorVersion string like
+    "$CondorVersion: 10.2.0 Jan 01 2023 $" as a tuple of ints,
+    or None if the string can't be parsed"""
+    try:
+        return tuple(int(x) for x in condor_version.split()[1].split("."))
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def track_max_condor_version(versions, condor_version):
+    """Keeps only the highest parsed CondorVersion seen in versions,
+    a column holding a single version tuple, instead of appending
+    every job's CondorVersion string"""
+    if not isinstance(condor_version, str):
+        return
+    version = parse_condor_version(condor_version)
+    if version is None:
+        return
+    if len(versions) == 0:
+        versions.append(version)
+    elif version > versions[0]:
+        versions[0] = version
+
+
+def max_condor_version(versions):
+    """Returns the highest version tracked in versions, which holds
+    several versions once merged (e.g. for TOTAL rows), or None"""
+    return max(versions, default=None)
@@ -48,13 +48,19 @@ def parse_args(args_in=sys.argv[1:]):
     )
     parser.add_argument(
         "--filter",
-        default=os.environ.get("FILTER", "BaseFilter"),
-        help=f"Filter class, one of [{', '.join(FILTERS)}] (default: %(default)s)",
+        metavar="FILTER",
+        dest="filters",
+        action="append",
+        help=f"Filter class, one of [{', '.join(FILTERS)}] (default: FILTER={os.environ.get('FILTER', 'BaseFilter')}), "
+            "can be specified multiple times along with --formatter to send several reports from a single scan",
     )
     parser.add_argument(
         "--formatter",
-        default=os.environ.get("FORMATTER", "BaseFormatter"),
-        help=f"Formatter class, one of [{', '.join(FORMATTERS)}] (default: %(default)s)",
+        metavar="FORMATTER",
+        dest="formatters",
+        action="append",
+        help=f"Formatter class, one of [{', '.join(FORMATTERS)}] (default: FORMATTER={os.environ.get('FORMATTER', 'BaseFormatter')}), "
+            "give one --formatter per --filter",
     )
     parser.add_argument(
         "--es_index",
@@ -88,6 +94,136 @@ def parse_args(args_in=sys.argv[1:]):
         default=os.environ.get("ES_CA_CERTS"),
         help="Elasticsearch custom CA certs",
     )
+    parser.add_argument(
+        "--es_serializer",
+        default=os.environ.get("ES_SERIALIZER", "auto"),
+        choices=["auto", "orjson", "msgspec", "json"],
+        help="JSON library used to (de)serialize Elasticsearch requests, auto uses orjson or msgspec if installed (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--scan_workers",
+        type=int,
+        default=int(os.environ.get("SCAN_WORKERS", 1)),
+        help="Number of sliced scrolls to run in parallel per index (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--index_workers",
+        type=int,
+        default=int(os.environ.get("INDEX_WORKERS", 1)),
+        help="Number of indices to scan in parallel (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--filter_workers",
+        type=int,
+        default=int(os.environ.get("FILTER_WORKERS", 1)),
+        help="Number of processes to run the filter methods in, 1 to filter in the scanning process (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--no_index_pruning",
+        default=False,
+        action="store_true",
+        help="Scan all indices instead of only those whose RecordTimes overlap the report period",
+    )
+    parser.add_argument(
+        "--no_query_planning",
+        default=False,
+        action="store_true",
+        help="Do not look up values for filters to narrow their queries with (e.g. OSPool schedds) before scanning",
+    )
+    parser.add_argument(
+        "--prefetch_pages",
+        type=int,
+        default=int(os.environ.get("PREFETCH_PAGES", 0)),
+        help="Number of result pages to fetch ahead while filtering, 0 to disable (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--use_pit",
+        default=False,
+        action="store_true",
+        help="Scan indices using a point in time and search_after instead of a scroll, retrying failed pages",
+    )
+    parser.add_argument(
+        "--trim_responses",
+        default=False,
+        action="store_true",
+        help="Use filter_path to drop hit metadata that the filters do not read from Elasticsearch responses",
+    )
+    parser.add_argument(
+        "--use_docvalue_fields",
+        default=False,
+        action="store_true",
+        help="Read job ad attributes from doc values instead of the _source, for filters that support it",
+    )
+    parser.add_argument(
+        "--dedupe",
+        default=os.environ.get("DEDUPE"),
+        choices=["exact", "bloom"],
+        help="Drop job ads with a GlobalJobId and RecordTime already seen in the scan, "
+            "remembering them exactly or in a Bloom filter (default: do not dedupe)",
+    )
+    parser.add_argument(
+        "--dedupe_capacity",
+        type=int,
+        default=int(os.environ.get("DEDUPE_CAPACITY", 20_000_000)),
+        help="Number of job ads to remember when deduping (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--dedupe_error_rate",
+        type=float,
+        default=float(os.environ.get("DEDUPE_ERROR_RATE", 0.001)),
+        help="False positive rate of the Bloom filter used by --dedupe bloom (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--fetch_all_attrs",
+        default=False,
+        action="store_true",
+        help="Fetch entire job ads instead of only the attributes read by the filter",
+    )
+    parser.add_argument(
+        "--columnar_data",
+        default=False,
+        action="store_true",
+        help="Store filtered numeric values in typed arrays instead of lists to save memory",
+    )
+    parser.add_argument(
+        "--compute_backend",
+        default=os.environ.get("COMPUTE_BACKEND", "python"),
+        choices=["auto", "numpy", "python"],
+        help="Library used to compute columns of large aggregates, auto uses numpy if installed (default: COMPUTE_BACKEND=%(default)s)",
+    )
+    parser.add_argument(
+        "--quantile_accuracy",
+        type=float,
+        default=os.environ.get("QUANTILE_ACCURACY"),
+        help="Estimate the Hrs percentile columns from mergeable sketches within this fraction of the exact rank, "
+            "instead of sorting every job's time (default: exact, or 0.01 for monthly reports)",
+    )
+    parser.add_argument(
+        "--percentile_spill_values",
+        type=int,
+        default=os.environ.get("PERCENTILE_SPILL_VALUES"),
+        help="Compute exact Hrs percentile columns, keeping at most this many values per aggregate in memory "
+            "and spilling the rest to sorted runs in temp files (overrides --quantile_accuracy)",
+    )
+    parser.add_argument(
+        "--spill_dir",
+        default=os.environ.get("SPILL_DIR"),
+        help="Directory for temp files spilled by --percentile_spill_values (default: system temp dir)",
+    )
+    parser.add_argument(
+        "--distinct_counts",
+        default=os.environ.get("DISTINCT_COUNTS"),
+        choices=["exact", "hll"],
+        help="Count Num Uniq Job Ids by distinct GlobalJobId and Num Users by distinct User, "
+            "exactly or in mergeable HyperLogLog sketches (default: count job ads and users as before)",
+    )
+    parser.add_argument(
+        "--hll_precision",
+        type=int,
+        default=os.environ.get("HLL_PRECISION"),
+        help="Use 2**HLL_PRECISION registers per HyperLogLog for --distinct_counts hll, "
+            "about 1.04/sqrt(2**HLL_PRECISION) relative error (default: 14)",
+    )
     parser.add_argument(
         "--daily",
         dest="report_period",
@@ -180,20 +316,33 @@ def parse_args(args_in=sys.argv[1:]):
     args = parser.parse_args(args_in)
 
     # Get filter and formatter classes
+    if args.filters is None:
+        args.filters = [os.environ.get("FILTER", "BaseFilter")]
+    if args.formatters is None:
+        args.formatters = [os.environ.get("FORMATTER", "BaseFormatter")]
     fail = False
-    try:
-        args.filter = getattr(_filters, args.filter)
-    except AttributeError:
-        print(f"ERROR: {args.filter} is not a valid filter", file=sys.stderr)
-        fail = True
-    try:
-        args.formatter = getattr(_formatters, args.formatter)
-    except AttributeError:
-        print(f"ERROR: {args.formatter} is not a valid formatter", file=sys.stderr)
+    if len(args.filters) != len(args.formatters):
+        print(f"ERROR: Got {len(args.filters)} filters but {len(args.formatters)} formatters, give one --formatter per --filter", file=sys.stderr)
         fail = True
+    for (n, filter_name) in enumerate(args.filters):
+        try:
+            args.filters[n] = getattr(_filters, filter_name)
+        except AttributeError:
+            print(f"ERROR: {filter_name} is not a valid filter", file=sys.stderr)
+            fail = True
+    for (n, formatter_name) in enumerate(args.formatters):
+        try:
+            args.formatters[n] = getattr(_formatters, formatter_name)
+        except AttributeError:
+            print(f"ERROR: {formatter_name} is not a valid formatter", file=sys.stderr)
+            fail = True
     if fail:
         sys.exit(1)
 
+    # The first report's filter and formatter
+    args.filter = args.filters[0]
+    args.formatter = args.formatters[0]
+
     # Set reporting period
     args.report_period = os.environ.get("REPORT_PERIOD", args.report_period)
     if None not in (args.start_ts, args.end_ts,):
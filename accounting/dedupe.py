@@ -0,0 +1,79 @@
+import math
+import threading
+from hashlib import blake2b
+
+
+class ExactDeduper:
+    """Remembers up to capacity keys exactly"""
+
+    def __init__(self, capacity=20_000_000, **kwargs):
+        self.capacity = capacity
+        self.keys = set()
+        self.dropped = 0
+        self.full = False
+        self.lock = threading.Lock()
+
+    def is_duplicate(self, key):
+        # Returns True if key has been seen before, otherwise remembers it
+        with self.lock:
+            if key in self.keys:
+                self.dropped += 1
+                return True
+            if len(self.keys) < self.capacity:
+                self.keys.add(key)
+            else:
+                self.full = True
+            return False
+
+
+class BloomDeduper:
+    """Remembers keys in a Bloom filter sized for capacity keys,
+    so memory stays fixed at the cost of dropping a fraction
+    (about error_rate) of unique keys as false duplicates"""
+
+    def __init__(self, capacity=20_000_000, error_rate=0.001, **kwargs):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2)**2)))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.num_keys = 0
+        self.dropped = 0
+        self.full = False
+        self.lock = threading.Lock()
+
+    def is_duplicate(self, key):
+        # Returns True if key has (probably) been seen before, otherwise remembers it.
+        # Bit positions come from double hashing a single 128-bit digest.
+        digest = blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        bits = self.bits
+        num_bits = self.num_bits
+        seen = True
+        with self.lock:
+            for n in range(self.num_hashes):
+                pos = (h1 + n * h2) % num_bits
+                mask = 1 << (pos & 7)
+                if not bits[pos >> 3] & mask:
+                    bits[pos >> 3] |= mask
+                    seen = False
+            if seen:
+                self.dropped += 1
+                return True
+            self.num_keys += 1
+            self.full = self.num_keys > self.capacity
+            return False
+
+
+DEDUPERS = {
+    "exact": ExactDeduper,
+    "bloom": BloomDeduper,
+}
+
+
+def get_deduper(dedupe=None, **kwargs):
+    """Returns a deduper of the given kind, or None if dedupe is not set"""
+    if dedupe is None:
+        return None
+    return DEDUPERS[dedupe](**kwargs)
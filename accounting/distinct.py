@@ -0,0 +1,158 @@
+import math
+from hashlib import blake2b
+
+
+DEFAULT_HLL_PRECISION = 14
+
+
+def hash64(value):
+    """Returns a 64-bit hash of a value's string form that is the same
+    in every process (unlike hash() of a str), so that summaries
+    from separate scans and stored partial data can be merged"""
+    return int.from_bytes(blake2b(str(value).encode(), digest_size=8).digest(), "little")
+
+
+class ExactDistinctCount:
+    """Counts the distinct values added to it exactly,
+    by remembering every value"""
+
+    def __init__(self, **kwargs):
+        self.values = set()
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, value):
+        self.values.add(value)
+
+    def update(self, values):
+        self.values.update(values)
+
+    def merge(self, other):
+        # Merges other (a count of any other values) into this count in place
+        self.values |= other.values
+        return self
+
+    def copy(self):
+        count = type(self)()
+        count.values = self.values.copy()
+        return count
+
+
+class HyperLogLog:
+    """Mergeable HyperLogLog estimate of the number of distinct values
+    added to it, within about 1.04 / sqrt(2**precision) (0.8% at the
+    default precision) in 2**precision bytes of registers.
+
+    Each value is hashed to 64 bits, the first precision bits pick a
+    register and the register keeps the highest number of leading
+    zeros (plus one) seen in the rest of the bits. Counts of up to
+    2**precision // 16 values keep their hashes instead of registers,
+    so small counts are exact (barring 64-bit hash collisions).
+    Counts of any two sets of values can be merged into a count of
+    their union, e.g. across aggregates, scans and days."""
+
+    def __init__(self, precision=DEFAULT_HLL_PRECISION, **kwargs):
+        self.precision = precision
+        self.num_registers = 2**precision
+        self.max_hashes = self.num_registers // 16
+        self.hashes = set()
+        self.registers = None
+
+    def __len__(self):
+        if self.registers is None:
+            return len(self.hashes)
+        return self.estimate()
+
+    def add(self, value):
+        self.add_hash(hash64(value))
+
+    def update(self, values):
+        for value in values:
+            self.add_hash(hash64(value))
+
+    def add_hash(self, value_hash):
+        if self.registers is None:
+            self.hashes.add(value_hash)
+            if len(self.hashes) > self.max_hashes:
+                self.to_registers()
+            return
+        rest_bits = 64 - self.precision
+        register = value_hash >> rest_bits
+        rank = rest_bits - (value_hash & ((1 << rest_bits) - 1)).bit_length() + 1
+        if rank > self.registers[register]:
+            self.registers[register] = rank
+
+    def to_registers(self):
+        # Switches from keeping the hashes over to the registers
+        self.registers = bytearray(self.num_registers)
+        for value_hash in self.hashes:
+            self.add_hash(value_hash)
+        self.hashes = set()
+
+    def merge(self, other):
+        # Merges other (a count of any other values, with the same
+        # precision) into this count in place
+        if other.precision != self.precision:
+            raise ValueError(f"Can't merge HyperLogLogs of precision {self.precision} and {other.precision}")
+        if other.registers is None:
+            for value_hash in other.hashes:
+                self.add_hash(value_hash)
+            return self
+        if self.registers is None:
+            self.to_registers()
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def copy(self):
+        count = type(self)(self.precision)
+        count.hashes = self.hashes.copy()
+        if self.registers is not None:
+            count.registers = self.registers.copy()
+        return count
+
+    def estimate(self):
+        # Returns the HyperLogLog estimate from the registers, using
+        # linear counting of the empty registers for small estimates
+        m = self.num_registers
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0**-register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros > 0:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+
+DISTINCT_COUNTS = {
+    "exact": ExactDistinctCount,
+    "hll": HyperLogLog,
+}
+
+
+def get_distinct_count(distinct_counts="exact", **kwargs):
+    """Returns an empty distinct count of the given kind"""
+    return DISTINCT_COUNTS[distinct_counts](**kwargs)
+
+
+def track_distinct(counts, value, make_count):
+    """Adds value to the distinct count kept as the single item of
+    the counts column (started by make_count() if needed),
+    instead of appending every job's value"""
+    if value is None:
+        return
+    if len(counts) == 0:
+        counts.append(make_count())
+    counts[0].add(value)
+
+
+def merge_distinct(counts):
+    """Returns a new distinct count of the union of the distinct counts
+    in a column, which holds several counts once merged (e.g. for TOTAL
+    rows), or None if the column is empty"""
+    merged = None
+    for count in counts:
+        if merged is None:
+            merged = count.copy()
+        else:
+            merged.merge(count)
+    return merged
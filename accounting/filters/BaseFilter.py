@@ -1,19 +1,153 @@
 import logging
 import statistics as stats
-from collections import defaultdict
+from collections import defaultdict, deque
 from functools import partial
 from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import itertools
+import multiprocessing
+import threading
+import queue
+import time
+import pickle
+from pathlib import Path
 from elasticsearch import Elasticsearch
 import elasticsearch.helpers
 import importlib
+from accounting.functions import get_es_serializer
+from accounting.dedupe import get_deduper
+from accounting.attr_schema import JOB_AD_SCHEMA
+from accounting.columns import Column, ColumnDict, TotalColumns, merge_values, value_counts, mode, count_distinct
+from accounting.array_columns import ARRAY_MIN_JOBS, get_compute_backend, num_jobs
+from accounting.job_times import get_job_times, get_job_times_array
+from accounting.quantiles import DEFAULT_QUANTILE_ACCURACY, QuantileSketch, ExternalQuantiles
+from accounting.distinct import DEFAULT_HLL_PRECISION, get_distinct_count
+
+
+DEFAULT_FILTER_ATTRS = [
+    "RemoteWallClockTime",
+    "CommittedTime",
+    "RequestCpus",
+    "RequestMemory",
+    "MemoryUsage",
+    "BytesSent",
+    "BytesRecvd",
+]
+
+
+class SourceAttrChecker(dict):
+    # Job ad dict that warns once per attribute when a filter
+    # reads an attribute that it did not declare in get_source_attrs()
+
+    def __init__(self, source, declared_attrs, undeclared_attrs, logger):
+        super().__init__(source)
+        self.declared_attrs = declared_attrs
+        self.undeclared_attrs = undeclared_attrs
+        self.logger = logger
+
+    def check(self, attr):
+        if attr not in self.declared_attrs and attr not in self.undeclared_attrs:
+            self.undeclared_attrs.add(attr)
+            self.logger.warning(f"Filter read undeclared job ad attribute {attr}, add it to get_source_attrs()")
+
+    def get(self, attr, default=None):
+        self.check(attr)
+        return super().get(attr, default)
+
+    def __getitem__(self, attr):
+        self.check(attr)
+        return super().__getitem__(attr)
+
+    def __contains__(self, attr):
+        self.check(attr)
+        return super().__contains__(attr)
+
+
+class JobRecord:
+    # Values derived from a job ad, computed once per doc
+    # by get_job_record() and shared by all of the filter methods
+    __slots__ = (
+        "num_dag_nodes",
+        "num_ckpt_jobs",
+        "bad_wall_clock_time",
+        "num_bad_job_starts",
+        "job_units",
+        "is_ospool_job",
+        "resource",
+        "institution_id",
+        "institution",
+    )
+
+    def __init__(self):
+        self.num_dag_nodes = 0
+        self.num_ckpt_jobs = 0
+        self.bad_wall_clock_time = 0
+        self.num_bad_job_starts = 0
+        self.job_units = None
+        self.is_ospool_job = None
+        self.resource = None
+        self.institution_id = None
+        self.institution = None
+
+
+# Filter used by filter_shard() in worker processes
+WORKER_FILTER = None
+
+
+def init_filter_worker(filtr):
+    """Sets the filter used by filter_shard() in this worker process"""
+    global WORKER_FILTER
+    WORKER_FILTER = filtr
+
+
+def filter_shard(docs):
+    """Returns new partial filtered data from docs,
+    filtered in a worker process"""
+    partial_data = WORKER_FILTER.get_empty_filtered_data()
+    WORKER_FILTER.apply_filters(partial_data, docs)
+    return partial_data
 
 
 class BaseFilter:
     name = "job history"
+    supports_partial_merge = True
+    use_job_records = False
+    build_totals = True
+    filter_shard_size = 2000
+    attr_schema = JOB_AD_SCHEMA
+    categorical_attrs = frozenset()
+    default_quantile_accuracy = None
 
     def __init__(self, skip_init=False, **kwargs):
         self.sort_col = "All CPU Hours"
         self.logger = logging.getLogger("accounting.filter")
+        self.fetch_all_attrs = kwargs.get("fetch_all_attrs", False)
+        self.use_docvalue_fields = kwargs.get("use_docvalue_fields", False)
+        self.trim_responses = kwargs.get("trim_responses", False)
+        self.dedupe = kwargs.get("dedupe")
+        self.dedupe_capacity = kwargs.get("dedupe_capacity") or 20_000_000
+        self.dedupe_error_rate = kwargs.get("dedupe_error_rate") or 0.001
+        self.deduper = None
+        self.docvalue_fields = None
+        self.check_source_attrs = self.logger.isEnabledFor(logging.DEBUG)
+        self.undeclared_attrs = set()
+        self.index_pruning = not kwargs.get("no_index_pruning", False)
+        self.query_planning = not kwargs.get("no_query_planning", False)
+        self.use_pit = kwargs.get("use_pit", False)
+        self.page_retries = 3
+        self.prefetch_pages = kwargs.get("prefetch_pages") or 0
+        self.prefetch_waits = {"consumer": 0, "producer": 0}
+        self.prefetch_waits_lock = threading.Lock()
+        self.index_time_ranges_pickle = Path("index-time-ranges.pkl")
+        self.column_type = Column if kwargs.get("columnar_data", False) else list
+        self.compute_backend = get_compute_backend(kwargs.get("compute_backend") or "python")
+        self.quantile_accuracy = kwargs.get("quantile_accuracy") or self.default_quantile_accuracy
+        self.percentile_spill_values = kwargs.get("percentile_spill_values")
+        self.spill_dir = kwargs.get("spill_dir")
+        self.distinct_counts = kwargs.get("distinct_counts")
+        self.hll_precision = kwargs.get("hll_precision") or DEFAULT_HLL_PRECISION
+        self.filter_workers = max(kwargs.get("filter_workers") or 1, 1)
+        self.filter_executor = None
         if skip_init:
             return
         self.client = self.connect(**kwargs)
@@ -58,7 +192,10 @@ class BaseFilter:
             es_client["use_ssl"] = True
             es_client["verify_certs"] = True
 
-        return Elasticsearch([es_client])
+        # Allow one pooled connection per concurrent scroll
+        maxsize = max(10, (kwargs.get("scan_workers") or 1) * (kwargs.get("index_workers") or 1))
+
+        return Elasticsearch([es_client], maxsize=maxsize, **get_es_serializer(kwargs.get("es_serializer", "auto")))
 
     def get_query(self, index, start_ts, end_ts, scroll=None, size=500):
         # Returns dict matching Elasticsearch.search() kwargs
@@ -97,8 +234,25 @@ class BaseFilter:
                 }
             }
         }
+
+        # Only fetch the job ad attributes that the filters read,
+        # plus every name that they are normalized from
+        source_attrs = self.get_source_attrs()
+        if source_attrs is not None and not self.fetch_all_attrs:
+            source_attrs = self.attr_schema.get_names(source_attrs)
+            if self.dedupe is not None:
+                source_attrs = source_attrs + ["GlobalJobId", "RecordTime"]
+            query["_source_includes"] = sorted(set(source_attrs))
+
         return query
 
+    def get_source_attrs(self):
+        # Returns a list of the job ad attributes read by the filter
+        # methods, which is used to limit the _source of each doc
+        # returned by Elasticsearch. Override this method when adding
+        # filters, or return None to fetch entire job ads.
+        return DEFAULT_FILTER_ATTRS + ["User"]
+
     def user_filter(self, data, doc):
         # Example filter that accumulates job attr values
         # into "data", aggregated by the User job attribute.
@@ -107,15 +261,7 @@ class BaseFilter:
         # add each filter method to the get_filters() method.
 
         # List of job ad attrs to accumulate
-        filter_attrs = [
-            "RemoteWallClockTime",
-            "CommittedTime",
-            "RequestCpus",
-            "RequestMemory",
-            "MemoryUsage",
-            "BytesSent",
-            "BytesRecvd",
-        ]
+        filter_attrs = DEFAULT_FILTER_ATTRS.copy()
 
         # Get input dict
         i = doc["_source"]
@@ -131,6 +277,33 @@ class BaseFilter:
         for attr in filter_attrs:
             o_user[attr].append(i.get(attr, None))
 
+    def get_job_record(self, i):
+        # Returns a JobRecord with the values derived from job ad i,
+        # filters that set use_job_records find it in doc["_job"]
+        job = JobRecord()
+
+        # Count number of DAGNode Jobs
+        if i.get("DAGNodeName") is not None:
+            job.num_dag_nodes = 1
+
+        # Count number of checkpointable jobs
+        if (
+                i.get("SuccessCheckpointExitBySignal", False) or
+                i.get("SuccessCheckpointExitCode") is not None
+            ):
+            job.num_ckpt_jobs = 1
+
+        # Compute badput fields
+        if (
+                i.get("NumJobStarts", 0) > 1 and
+                i.get("RemoteWallClockTime", 0) > 0 and
+                i.get("RemoteWallClockTime") != i.get("CommittedTime")
+            ):
+            job.bad_wall_clock_time = i["RemoteWallClockTime"] - i.get("CommittedTime", 0)
+            job.num_bad_job_starts = i["NumJobStarts"] - 1
+
+        return job
+
     def get_filters(self):
         # Returns a list of filter methods
         # This method should be overridden,
@@ -140,65 +313,665 @@ class BaseFilter:
         ]
         return filters
 
-    def scan_and_filter(self, es_index, start_ts, end_ts, build_totals=True, **kwargs):
-        # Returns a 3-level dictionary that contains data gathered from
-        # Elasticsearch and filtered through whatever methods have been
-        # defined in self.get_filters()
+    def get_docvalue_fields(self):
+        # Returns dict of job ad attribute -> doc values field
+        # ("Attr.keyword" for strings, "Attr.*" for nested ads)
+        # if all attributes read by the filter methods have doc values,
+        # or None if the filter needs the _source
+        return None
 
+    def get_empty_filtered_data(self):
         # Create a data structure for storing filtered data:
-        # 3-level defaultdict -> list
+        # 3-level defaultdict -> list (or Column with --columnar_data)
         # First level - Aggregation level (e.g. Schedd, User, Project)
         # Second level - Aggregation name (e.g. value of ScheddName, UserName, ProjectName)
         # Third level - Field name to be aggregated (e.g. RemoteWallClockTime, RequestCpus)
-        filtered_data = defaultdict(partial(defaultdict, partial(defaultdict, list)))
+        # Fields in categorical_attrs are stored in Category columns instead
+        return defaultdict(partial(defaultdict, partial(ColumnDict, self.column_type, self.categorical_attrs)))
+
+    def merge_partial_data(self, data, partial_data):
+        # Merges partial filtered data (e.g. from one scan slice)
+        # into data in place, as if the docs behind partial_data
+        # had been filtered after the docs behind data.
+        # Each field is merged by merge_field(). Filters whose
+        # filtered data is not laid out by aggregation level and name
+        # must override this method, or set supports_partial_merge = False.
+        for agg, agg_data in partial_data.items():
+            for agg_name, fields in agg_data.items():
+                o = data[agg][agg_name]
+                for field, values in fields.items():
+                    if field in o:
+                        o[field] = self.merge_field(field, o[field], values)
+                    else:
+                        o[field] = values
 
+    def merge_field(self, field, values, partial_values):
+        # Returns the values of a field merged with its partial values:
+        # lists are concatenated, dicts are merged key by key and
+        # numbers (e.g. from reduce_data() style filters) are summed.
+        # Override this method for fields that keep a max, min, etc.
+        return merge_values(values, partial_values)
+
+    def filter_docs(self, filtered_data, docs):
+        # Send each doc through the various filters,
+        # which mutate filtered_data in place,
+        # in worker processes if filter_workers > 1.
+        # Returns True if any docs were seen.
+        docs = iter(docs)
+        first_doc = next(docs, None)
+        if first_doc is None:
+            return False
+        docs = itertools.chain([first_doc], docs)
+        if self.deduper is not None:
+            docs = self.drop_duplicate_docs(docs)
+        if self.filter_executor is not None:
+            self.filter_docs_in_workers(filtered_data, docs)
+        else:
+            self.apply_filters(filtered_data, docs)
+        return True
+
+    def drop_duplicate_docs(self, docs):
+        # Skip job ads that have already been seen in this scan
+        for doc in docs:
+            job_id = doc["_source"].get("GlobalJobId")
+            if job_id is not None and self.deduper.is_duplicate(f"{job_id}#{doc['_source'].get('RecordTime')}"):
+                continue
+            yield doc
+
+    def apply_filters(self, filtered_data, docs):
+        # Runs the filter methods on each doc
+        filters = self.get_filters()
+        normalize = self.attr_schema.compile(self.get_source_attrs())
+        declared_attrs = None
+        if self.check_source_attrs and self.get_source_attrs() is not None:
+            declared_attrs = set(self.get_source_attrs()) | normalize.attrs
+        for doc in docs:
+            normalize(doc["_source"])
+            if declared_attrs is not None:
+                doc["_source"] = SourceAttrChecker(doc["_source"], declared_attrs, self.undeclared_attrs, self.logger)
+            if self.use_job_records:
+                doc["_job"] = self.get_job_record(doc["_source"])
+            for filtr in filters:
+                filtr(filtered_data, doc)
+
+    def filter_docs_in_workers(self, filtered_data, docs):
+        # Sends shards of filter_shard_size docs to the worker processes,
+        # which each filter a shard into their own partial filtered data,
+        # and merges the partial data in shard order so that the results
+        # are the same as filtering the docs in this process
+        futures = deque()
+        shard = []
+        for doc in docs:
+            shard.append(doc)
+            if len(shard) < self.filter_shard_size:
+                continue
+            futures.append(self.filter_executor.submit(filter_shard, shard))
+            shard = []
+
+            # Limit the number of shards held in memory
+            while len(futures) > 2 * self.filter_workers:
+                self.merge_partial_data(filtered_data, futures.popleft().result())
+        if len(shard) > 0:
+            futures.append(self.filter_executor.submit(filter_shard, shard))
+        while len(futures) > 0:
+            self.merge_partial_data(filtered_data, futures.popleft().result())
+
+    def scan_index(self, index, start_ts, end_ts, slice_id=None, slice_max=None, **kwargs):
+        # Yields docs from a single index, optionally from only
+        # one slice of a sliced scroll
+        query = self.get_query(
+            index=index,
+            start_ts=start_ts,
+            end_ts=end_ts,
+        )
+        body = query.pop("body")
+        if slice_max is not None and slice_max > 1:
+            body["slice"] = {"id": slice_id, "max": slice_max}
+
+        # Read attributes from doc values instead of the _source
+        if self.docvalue_fields is not None:
+            body["docvalue_fields"] = sorted(set(self.docvalue_fields.values()))
+            query.pop("_source_includes", None)
+            query["_source"] = False
+
+        if self.use_pit:
+            docs = self.scan_index_pit(body=body, **query)
+        elif self.trim_responses:
+            docs = self.scan_index_scroll(body=body, **query)
+        else:
+            # Use the scan() helper function, which automatically scrolls results. Nice!
+            docs = elasticsearch.helpers.scan(
+                client=self.client,
+                query=body,
+                **query,
+            )
+        if self.docvalue_fields is not None:
+            docs = (self.docvalues_to_source(doc) for doc in docs)
+        if self.prefetch_pages > 0:
+            docs = self.prefetch_docs(docs, page_size=query["size"])
+        for doc in docs:
+            # Stop scrolling if the scan has been cancelled
+            if self.scan_cancelled.is_set():
+                return
+            yield doc
+
+    def docvalues_to_source(self, doc):
+        # Rebuilds doc["_source"] from the doc values in doc["fields"]
+        # so that filter methods can read it as usual
+        fields = doc.pop("fields", {})
+        source = {}
+        for (attr, field) in self.docvalue_fields.items():
+            if field.endswith(".*"):
+                prefix = field[:-1]
+                nested = {k[len(prefix):]: v[0] for (k, v) in fields.items() if k.startswith(prefix) and len(v) > 0}
+                if len(nested) > 0:
+                    source[attr] = nested
+            elif field in fields:
+                values = fields[field]
+                source[attr] = values[0] if len(values) == 1 else values
+        doc["_source"] = source
+        return doc
+
+    def prefetch_docs(self, docs, page_size):
+        # Yields docs while a background thread fetches up to
+        # self.prefetch_pages pages ahead, so that Elasticsearch
+        # round trips overlap with running the filters
+        pages = queue.Queue(maxsize=self.prefetch_pages)
+        stop = threading.Event()
+        waits = {"consumer": 0, "producer": 0}
+
+        def put(item):
+            if pages.full():
+                waits["producer"] += 1
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def fetch():
+            try:
+                page = []
+                for doc in docs:
+                    page.append(doc)
+                    if len(page) >= page_size:
+                        if not put(page):
+                            return
+                        page = []
+                if page:
+                    put(page)
+                put(None)
+            except Exception as err:
+                put(err)
+            finally:
+                docs.close()
+
+        fetcher = threading.Thread(target=fetch, daemon=True)
+        fetcher.start()
+        try:
+            while True:
+                if pages.empty():
+                    waits["consumer"] += 1
+                page = pages.get()
+                if page is None:
+                    break
+                if isinstance(page, Exception):
+                    raise page
+                yield from page
+        finally:
+            stop.set()
+            fetcher.join()
+            with self.prefetch_waits_lock:
+                for (side, count) in waits.items():
+                    self.prefetch_waits[side] += count
+            self.logger.debug(f"Prefetching waited on Elasticsearch {waits['consumer']} times and on filtering {waits['producer']} times.")
+
+    def get_filter_path(self, pit=False):
+        # Returns the filter_path that trims search responses
+        # down to what the scan and the filter methods read
+        filter_path = ["_shards"]
+        if pit:
+            filter_path += ["pit_id", "hits.hits.sort"]
+        else:
+            filter_path += ["_scroll_id"]
+        if self.docvalue_fields is not None:
+            filter_path.append("hits.hits.fields")
+        else:
+            filter_path.append("hits.hits._source")
+        return ",".join(filter_path)
+
+    def check_shards(self, response, scroll_id=None):
+        # Raise like elasticsearch.helpers.scan() if some shards failed
+        shards = response.get("_shards", {})
+        if shards.get("successful", 0) + shards.get("skipped", 0) < shards.get("total", 0):
+            raise elasticsearch.helpers.ScanError(
+                scroll_id,
+                f"Scroll request has only succeeded on {shards.get('successful', 0)} (+{shards.get('skipped', 0)} skipped) shards out of {shards['total']}.",
+            )
+
+    def scan_index_scroll(self, index, body, scroll, **kwargs):
+        # Same as elasticsearch.helpers.scan(), but uses filter_path
+        # so that each hit only carries the _source (or fields)
+        filter_path = self.get_filter_path()
+        response = self.client.search(index=index, body=body, scroll=scroll, filter_path=filter_path, **kwargs)
+        scroll_id = response.get("_scroll_id")
+        try:
+            while scroll_id is not None:
+                self.check_shards(response, scroll_id)
+                hits = response.get("hits", {}).get("hits", [])
+                if len(hits) == 0:
+                    break
+                yield from hits
+                response = self.client.scroll(
+                    body={"scroll_id": scroll_id, "scroll": scroll},
+                    filter_path=filter_path,
+                )
+                scroll_id = response.get("_scroll_id", scroll_id)
+        finally:
+            if scroll_id is not None:
+                self.client.clear_scroll(body={"scroll_id": [scroll_id]}, ignore=(404,))
+
+    def search_with_retries(self, **kwargs):
+        # Retries a single search request after a connection timeout,
+        # so a transient failure costs one page instead of the whole scan
+        for tries in range(self.page_retries):
+            try:
+                return self.client.search(**kwargs)
+            except elasticsearch.exceptions.ConnectionTimeout:
+                self.logger.info(f"Elasticsearch connection timed out, retrying page (try {tries+1})")
+                time.sleep(4**(tries+1))
+        return self.client.search(**kwargs)
+
+    def scan_index_pit(self, index, body, scroll, size, sort=None, **kwargs):
+        # Yields docs from an index using a point in time and search_after,
+        # keeping the sort key of the last page so that a failed page
+        # request can be resumed without restarting the scan
+        keep_alive = scroll
+        pit_id = self.client.open_point_in_time(index=index, keep_alive=keep_alive)["id"]
+        body = dict(body)
+        body["sort"] = [{"_shard_doc": "asc"}]
+        search_kwargs = {k: kwargs[k] for k in ["_source", "_source_includes"] if k in kwargs}
+        if self.trim_responses:
+            search_kwargs["filter_path"] = self.get_filter_path(pit=True)
+        try:
+            while True:
+                body["pit"] = {"id": pit_id, "keep_alive": keep_alive}
+                response = self.search_with_retries(
+                    body=body,
+                    size=size,
+                    track_total_hits=False,
+                    **search_kwargs,
+                )
+                pit_id = response.get("pit_id", pit_id)
+                self.check_shards(response)
+                hits = response.get("hits", {}).get("hits", [])
+                if len(hits) == 0:
+                    break
+                yield from hits
+
+                # Only move the cursor after the page has been filtered
+                body["search_after"] = hits[-1]["sort"]
+        finally:
+            try:
+                self.client.close_point_in_time(body={"id": pit_id})
+            except elasticsearch.exceptions.TransportError:
+                self.logger.debug(f"Could not close point in time for {index}")
+
+    def scan_slice(self, index, start_ts, end_ts, slice_id, slice_max, **kwargs):
+        # Scans one slice of an index into its own partial filtered data
+        partial_data = self.get_empty_filtered_data()
+        docs = self.scan_index(index, start_ts, end_ts, slice_id=slice_id, slice_max=slice_max, **kwargs)
+        got_data = self.filter_docs(partial_data, docs)
+        self.logger.debug(f"Finished slice {slice_id+1}/{slice_max} of {index}.")
+        return (partial_data, got_data)
+
+    def scan_index_sliced(self, filtered_data, index, start_ts, end_ts, **kwargs):
+        # Splits the scan of an index into one sliced scroll per worker,
+        # then merges the partial data in slice order so that
+        # results do not depend on which worker finished first
+        futures = [
+            self.slice_executor.submit(self.scan_slice, index, start_ts, end_ts, slice_id, self.scan_workers, **kwargs)
+            for slice_id in range(self.scan_workers)
+        ]
+        got_index_data = False
+        for future in futures:
+            (partial_data, got_data) = future.result()
+            if got_data:
+                got_index_data = True
+                self.merge_partial_data(filtered_data, partial_data)
+        return got_index_data
+
+    def scan_index_into(self, filtered_data, index, start_ts, end_ts, **kwargs):
+        # Scans an index into filtered_data, returns True if any docs were seen
+        self.logger.debug(f"Querying {index}.")
+        if self.slice_executor is not None:
+            return self.scan_index_sliced(filtered_data, index, start_ts, end_ts, **kwargs)
+        docs = self.scan_index(index, start_ts, end_ts, **kwargs)
+        return self.filter_docs(filtered_data, docs)
+
+    def scan_index_partial(self, index, start_ts, end_ts, **kwargs):
+        # Scans an index into its own partial filtered data
+        partial_data = self.get_empty_filtered_data()
+        got_data = self.scan_index_into(partial_data, index, start_ts, end_ts, **kwargs)
+        return (partial_data, got_data)
+
+    def get_indices(self, es_index, **kwargs):
         # Get list of indices so we can use one at a time
         indices = list(self.client.indices.get_alias(index=es_index).keys())
         indices.sort(reverse=True)
         indices.insert(0, indices.pop())  # make sure the first index gets checked first
-        self.logger.debug(f"Querying at most {len(indices)} indices matching {es_index}.")
-        got_initial_data = False  # only stop after we've seen data
+        return indices
 
-        for index in indices:
+    def get_read_only_indices(self, indices):
+        # Returns the subset of indices that no longer accept writes
+        settings = self.client.indices.get_settings(index=",".join(indices), name="index.blocks.write")
+        read_only_indices = set()
+        for index, index_settings in settings.items():
+            blocks = index_settings.get("settings", {}).get("index", {}).get("blocks", {})
+            if str(blocks.get("write", False)).lower() == "true":
+                read_only_indices.add(index)
+        return read_only_indices
 
-            query = self.get_query(
-                index=index,
-                start_ts=start_ts,
-                end_ts=end_ts,
-            )
+    def get_index_time_ranges(self, indices):
+        # Returns a dict of index -> (min RecordTime, max RecordTime),
+        # or index -> None for indices that contain no RecordTimes.
+        # Ranges of read-only indices can't change, so they are cached on disk.
+        index_time_ranges = {}
+        if self.index_time_ranges_pickle.exists():
+            try:
+                index_time_ranges = pickle.load(open(self.index_time_ranges_pickle, "rb"))
+            except IOError:
+                pass
+        index_time_ranges = {index: index_time_ranges[index] for index in indices if index in index_time_ranges}
 
-            # Use the scan() helper function, which automatically scrolls results. Nice!
-            self.logger.debug(f"Querying {index}.")
-            got_index_data = False
-            for doc in elasticsearch.helpers.scan(
-                    client=self.client,
-                    query=query.pop("body"),
-                    **query,
-                    ):
-                got_initial_data = True
-                got_index_data = True
+        uncached_indices = [index for index in indices if index not in index_time_ranges]
+        if len(uncached_indices) == 0:
+            return index_time_ranges
+        self.logger.debug(f"Getting RecordTime ranges for {len(uncached_indices)} uncached indices.")
+
+        # Get min and max RecordTime of each index in one request
+        response = self.client.search(
+            index=",".join(uncached_indices),
+            size=0,
+            body={
+                "aggs": {
+                    "indices": {
+                        "terms": {"field": "_index", "size": len(uncached_indices)},
+                        "aggs": {
+                            "min_record_time": {"min": {"field": "RecordTime"}},
+                            "max_record_time": {"max": {"field": "RecordTime"}},
+                        },
+                    },
+                },
+            },
+        )
+        new_time_ranges = {index: None for index in uncached_indices}
+        for bucket in response["aggregations"]["indices"]["buckets"]:
+            if bucket["min_record_time"].get("value") is None:
+                continue
+            time_range = []
+            for agg in ["min_record_time", "max_record_time"]:
+                value = bucket[agg]["value"]
+                if "value_as_string" in bucket[agg]:  # date fields are returned in ms
+                    value = value / 1000
+                time_range.append(value)
+            new_time_ranges[bucket["key"]] = tuple(time_range)
+        index_time_ranges.update(new_time_ranges)
+
+        # Update the pickle with ranges from read-only indices
+        read_only_indices = self.get_read_only_indices(uncached_indices)
+        if len(read_only_indices) > 0:
+            self.logger.debug(f"Caching RecordTime ranges for {len(read_only_indices)} read-only indices.")
+            old_index_time_ranges = {}
+            if self.index_time_ranges_pickle.exists():
+                try:
+                    old_index_time_ranges = pickle.load(open(self.index_time_ranges_pickle, "rb"))
+                except IOError:
+                    pass
+            for index in read_only_indices:
+                old_index_time_ranges[index] = new_time_ranges[index]
+            with open(self.index_time_ranges_pickle, "wb") as f:
+                pickle.dump(old_index_time_ranges, f)
+
+        return index_time_ranges
+
+    def get_schedd_names(self, indices, start_ts, end_ts, size=10_000, must_not=None):
+        # Returns the ScheddNames of the job ads in [start_ts, end_ts)
+        # that match none of the must_not queries,
+        # or None if there are more than size of them
+        response = self.client.search(
+            index=",".join(indices),
+            size=0,
+            body={
+                "query": {
+                    "bool": {
+                        "filter": [
+                            {"range": {
+                                "RecordTime": {
+                                    "gte": start_ts,
+                                    "lt": end_ts,
+                                }
+                            }},
+                        ],
+                        "must_not": must_not or [],
+                    }
+                },
+                "aggs": {
+                    "schedds": {
+                        "terms": {"field": "ScheddName.keyword", "size": size},
+                    },
+                },
+            },
+        )
+        schedds = response["aggregations"]["schedds"]
+        if schedds.get("sum_other_doc_count", 0) > 0:
+            return None
+        return [bucket["key"] for bucket in schedds["buckets"]]
+
+    def check_attr_mappings(self, indices):
+        # Warns about numeric job ad attributes that are mapped as
+        # something else (e.g. text) in some indices, whose values
+        # then have to be parsed from strings
+        numeric_attrs = self.attr_schema.numeric_names(self.get_source_attrs())
+        if len(numeric_attrs) == 0:
+            return
+        try:
+            field_mappings = self.client.indices.get_field_mapping(fields=numeric_attrs, index=",".join(indices))
+        except elasticsearch.exceptions.TransportError as err:
+            self.logger.debug(f"Could not get mappings of numeric attributes: {err}")
+            return
+        for (field, mapping_type, drifted_indices) in self.attr_schema.get_mapping_drift(field_mappings, self.get_source_attrs()):
+            self.logger.warning(f"{field} is mapped as {mapping_type} instead of a number in {len(drifted_indices)} indices (e.g. {drifted_indices[0]}), parsing its values from strings")
+
+    def plan_query(self, indices, start_ts, end_ts):
+        # Called once before scanning indices so that filters can look up
+        # anything that get_query() needs from Elasticsearch (or elsewhere)
+        pass
+
+    def prune_indices(self, indices, start_ts, end_ts):
+        # Returns only the indices with RecordTimes in [start_ts, end_ts),
+        # or None if the RecordTime ranges could not be determined
+        try:
+            index_time_ranges = self.get_index_time_ranges(indices)
+        except elasticsearch.exceptions.TransportError as err:
+            self.logger.warning(f"Could not get RecordTime ranges of indices, scanning all indices: {err}")
+            return None
+        pruned_indices = []
+        for index in indices:
+            time_range = index_time_ranges.get(index)
+            if time_range is None:
+                continue
+            (min_record_time, max_record_time) = time_range
+            if min_record_time < end_ts and max_record_time >= start_ts:
+                pruned_indices.append(index)
+        self.logger.debug(f"Pruned {len(indices) - len(pruned_indices)} indices outside of the requested time range.")
+        return pruned_indices
 
-                # Send the doc through the various filters,
-                # which mutate filtered_data in place
-                for filtr in self.get_filters():
-                    filtr(filtered_data, doc)
+    def scan_indices(self, filtered_data, indices, start_ts, end_ts, early_exit=True, **kwargs):
+        # Scans one index at a time, in order
+        got_initial_data = False  # only stop after we've seen data
+        for index in indices:
+            got_index_data = self.scan_index_into(filtered_data, index, start_ts, end_ts, **kwargs)
+            got_initial_data = got_initial_data or got_index_data
 
             # Break early if not finding more results
-            if got_initial_data and not got_index_data:
+            if early_exit and got_initial_data and not got_index_data:
                 self.logger.debug(f"Exiting scan early since no docs were found")
                 break
 
-        # Build totals
+    def scan_indices_concurrently(self, filtered_data, indices, start_ts, end_ts, index_workers, early_exit=True, **kwargs):
+        # Scans up to index_workers indices at once, but merges their data
+        # in index order and stops at the same index as scan_indices(),
+        # so the results are identical to scanning one index at a time
+        got_initial_data = False  # only stop after we've seen data
+        futures = {}
+        next_index = 0
+        with ThreadPoolExecutor(max_workers=index_workers) as index_executor:
+            try:
+                for (i, index) in enumerate(indices):
+
+                    # Keep up to index_workers indices in flight
+                    while next_index < len(indices) and next_index < i + index_workers:
+                        futures[next_index] = index_executor.submit(
+                            self.scan_index_partial, indices[next_index], start_ts, end_ts, **kwargs)
+                        next_index += 1
+
+                    (partial_data, got_index_data) = futures.pop(i).result()
+                    if got_index_data:
+                        got_initial_data = True
+                        self.merge_partial_data(filtered_data, partial_data)
+
+                    # Break early if not finding more results
+                    elif early_exit and got_initial_data:
+                        self.logger.debug(f"Exiting scan early since no docs were found in {index}, cancelling {len(futures)} outstanding indices")
+                        break
+            finally:
+                # Stop any outstanding scans
+                self.scan_cancelled.set()
+                for future in futures.values():
+                    future.cancel()
+
+    def scan_and_filter(self, es_index, start_ts, end_ts, build_totals=None, scan_workers=1, index_workers=1, **kwargs):
+        # Returns a 3-level dictionary that contains data gathered from
+        # Elasticsearch and filtered through whatever methods have been
+        # defined in self.get_filters()
+        if build_totals is None:
+            build_totals = self.build_totals
+        filtered_data = self.get_empty_filtered_data()
+
+        self.scan_cancelled = threading.Event()
+        self.scan_workers = max(scan_workers or 1, 1)
+        index_workers = max(index_workers or 1, 1)
+        if (self.scan_workers > 1 or index_workers > 1) and not self.supports_partial_merge:
+            self.logger.warning(f"{self.__class__.__name__} does not support merging partial data, scanning serially")
+            self.scan_workers = index_workers = 1
+        self.slice_executor = None
+        if self.scan_workers > 1:
+            self.logger.debug(f"Using {self.scan_workers} sliced scrolls per index.")
+            self.slice_executor = ThreadPoolExecutor(max_workers=self.scan_workers * index_workers)
+
+        self.docvalue_fields = None
+        if self.use_docvalue_fields and not self.fetch_all_attrs:
+            self.docvalue_fields = self.get_docvalue_fields()
+            if self.docvalue_fields is None:
+                self.logger.warning(f"{self.__class__.__name__} does not support doc values fields, reading _source")
+            elif self.get_source_attrs() is not None:
+                missing_attrs = set(self.get_source_attrs()) - set(self.docvalue_fields)
+                if len(missing_attrs) > 0:
+                    self.logger.warning(f"{self.__class__.__name__} reads attributes without doc values fields: {', '.join(sorted(missing_attrs))}")
+                # Attributes are normalized from their aliases too, which
+                # have to be fetched for the output not to depend on
+                # whether doc values fields are used. Aliases of keyword
+                # attributes use their own keyword fields, but numeric
+                # aliases may be mapped as text in some indices.
+                self.docvalue_fields = dict(self.docvalue_fields)
+                for attr in self.attr_schema.get_attrs(self.get_source_attrs()):
+                    if self.docvalue_fields.get(attr.name) == f"{attr.name}.keyword":
+                        for alias in attr.aliases:
+                            self.docvalue_fields.setdefault(alias, f"{alias}.keyword")
+                missing_aliases = set(self.attr_schema.get_names(self.get_source_attrs())) - set(self.get_source_attrs()) - set(self.docvalue_fields)
+                if len(missing_aliases) > 0:
+                    self.logger.warning(f"{self.__class__.__name__} has no doc values fields for attribute aliases {', '.join(sorted(missing_aliases))}, reading _source")
+                    self.docvalue_fields = None
+            if self.docvalue_fields is not None and self.dedupe is not None:
+                self.docvalue_fields = dict(self.docvalue_fields)
+                self.docvalue_fields.update({"GlobalJobId": "GlobalJobId.keyword", "RecordTime": "RecordTime"})
+
+        self.deduper = get_deduper(self.dedupe, capacity=self.dedupe_capacity, error_rate=self.dedupe_error_rate)
+
+        indices = self.get_indices(es_index, start_ts=start_ts, end_ts=end_ts, **kwargs)
+
+        # Only visit indices that overlap the requested time range,
+        # which makes the early exit heuristic unnecessary
+        early_exit = True
+        if self.index_pruning and len(indices) > 0:
+            pruned_indices = self.prune_indices(indices, start_ts, end_ts)
+            if pruned_indices is not None:
+                indices = pruned_indices
+                early_exit = False
+        self.logger.debug(f"Querying at most {len(indices)} indices matching {es_index}.")
+
+        if len(indices) > 0:
+            self.check_attr_mappings(indices)
+        if self.query_planning and len(indices) > 0:
+            self.plan_query(indices, start_ts, end_ts)
+
+        self.filter_executor = None
+        if self.filter_workers > 1:
+            if self.supports_partial_merge:
+                self.filter_executor = self.start_filter_workers()
+            else:
+                self.logger.warning(f"{self.__class__.__name__} does not support merging partial data, filtering in one process")
+
+        try:
+            if index_workers > 1:
+                self.logger.debug(f"Scanning up to {index_workers} indices at once.")
+                self.scan_indices_concurrently(filtered_data, indices, start_ts, end_ts, index_workers, early_exit=early_exit, **kwargs)
+            else:
+                self.scan_indices(filtered_data, indices, start_ts, end_ts, early_exit=early_exit, **kwargs)
+        finally:
+            if self.slice_executor is not None:
+                self.slice_executor.shutdown(cancel_futures=True)
+                self.slice_executor = None
+            if self.filter_executor is not None:
+                self.filter_executor.shutdown(cancel_futures=True)
+                self.filter_executor = None
+        if self.deduper is not None:
+            self.logger.info(f"Dropped {self.deduper.dropped} duplicate job ads.")
+            if self.deduper.full:
+                self.logger.warning(f"Saw more than {self.dedupe_capacity} job ads, raise --dedupe_capacity to catch all duplicates.")
+        if self.prefetch_pages > 0:
+            self.logger.info(f"Filtering waited on Elasticsearch {self.prefetch_waits['consumer']} times, prefetching waited on filtering {self.prefetch_waits['producer']} times.")
+
         if build_totals:
-            for agg in filtered_data.keys():
-                total = defaultdict(list)
-                for agg_name in filtered_data[agg].keys():
-                    for field, data in filtered_data[agg][agg_name].items():
-                        total[field] += data
-                filtered_data[agg]["TOTAL"] = total
+            self.add_totals(filtered_data)
 
         return filtered_data
 
+    def start_filter_workers(self):
+        # Returns a pool of filter_workers processes that each hold a copy
+        # of this filter. The processes are forked (so that the filter
+        # does not need to be pickled) and are all started here, before
+        # the scan starts any threads.
+        self.logger.debug(f"Filtering docs in {self.filter_workers} worker processes.")
+        filter_executor = ProcessPoolExecutor(
+            max_workers=self.filter_workers,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=init_filter_worker,
+            initargs=(self,),
+        )
+        filter_executor.submit(int).result()
+        return filter_executor
+
+    def add_totals(self, filtered_data):
+        # Adds a TOTAL entry to each aggregation level of filtered_data,
+        # a TotalColumns view that reads each field as the concatenation
+        # of the aggregates' columns instead of a copy of their values
+        for agg in filtered_data.keys():
+            filtered_data[agg]["TOTAL"] = TotalColumns(filtered_data[agg].values())
+
     def get_filtered_data(self):
         return self.data
 
@@ -232,6 +1005,56 @@ class BaseFilter:
             cleaned = [-999]
         return cleaned
 
+    def value_counts(self, values):
+        # Returns dict of value -> count, using the running
+        # counts of Category columns instead of rescanning them
+        return value_counts(values)
+
+    def mode(self, values, default="UNKNOWN"):
+        # Returns the most common non-None value (first seen wins ties)
+        return mode(values, default=default)
+
+    def count_distinct(self, values):
+        # Returns the number of distinct values (None included)
+        return count_distinct(values)
+
+    def use_arrays(self, data):
+        # Returns True if an aggregate's columns should be
+        # computed from NumPy arrays instead of lists
+        return self.compute_backend == "numpy" and num_jobs(data) >= ARRAY_MIN_JOBS
+
+    def use_quantile_summaries(self):
+        # Returns True if percentile columns should be computed from
+        # QuantileSummaries instead of sorting lists of every value
+        return self.quantile_accuracy is not None or self.percentile_spill_values is not None
+
+    def make_quantiles(self):
+        # Returns an empty QuantileSummary for a percentile column:
+        # exact, spilling sorted runs of values to temp files past
+        # percentile_spill_values values, if set, else a QuantileSketch
+        if self.percentile_spill_values is not None:
+            return ExternalQuantiles(self.percentile_spill_values, self.spill_dir)
+        return QuantileSketch(self.quantile_accuracy or DEFAULT_QUANTILE_ACCURACY)
+
+    def make_distinct_count(self):
+        # Returns an empty distinct count for the distinct job id and user
+        # columns, kept exactly or as a HyperLogLog with --distinct_counts
+        return get_distinct_count(self.distinct_counts or "exact", precision=self.hll_precision)
+
+    def compute_job_times(self, data, gpus=False):
+        # Returns the goodput, badput and total CPU (and GPU) time,
+        # number of short jobs and long job time stats of an aggregate,
+        # vectorized with NumPy for large aggregates if enabled.
+        # Columns that can't be converted to arrays fall back to lists.
+        # The time stats come from a QuantileSummary if enabled.
+        make_quantiles = self.make_quantiles if self.use_quantile_summaries() else None
+        if self.use_arrays(data):
+            try:
+                return get_job_times_array(data, gpus=gpus, make_quantiles=make_quantiles)
+            except (TypeError, ValueError) as err:
+                self.logger.debug(f"Could not compute job times from arrays, using lists: {err}")
+        return get_job_times(data, gpus=gpus, make_quantiles=make_quantiles)
+
     def compute_custom_columns(self, data, *args, **kwargs):
         # Example method for computing columns.
         # Override this method to compute custom column values.
@@ -293,9 +1116,11 @@ class BaseFilter:
         # Get the names of the columns in order
         columns_sorted = [col for (n, col) in sorted(columns.items())]
 
-        # Loop over aggregated data and store computed data in rows
+        # Loop over aggregated data and store computed data in rows,
+        # with the TOTAL view last so that compute_custom_columns()
+        # can build it from summaries of the other aggregates' rows
         rows = []
-        for agg_name, d in data[agg].items():
+        for agg_name, d in sorted(data[agg].items(), key=lambda item: isinstance(item[1], TotalColumns)):
             row = {}
 
             # It's possible to have no job data stored
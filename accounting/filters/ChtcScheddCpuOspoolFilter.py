@@ -6,7 +6,10 @@ from datetime import date
 from pathlib import Path
 from ast import literal_eval
 from .BaseFilter import BaseFilter
+from accounting.condor_version import track_max_condor_version, max_condor_version
+from accounting.ospool_query import OspoolQueryMixin
 from accounting.functions import get_job_units
+from accounting.transfer_stats import parse_transfer_stats
 
 
 DEFAULT_COLUMNS = {
@@ -98,17 +101,15 @@ DEFAULT_FILTER_ATTRS = [
     "SingularityImage",
     "ActivationDuration",
     "ActivationSetupDuration",
-    "CondorVersion",
-    "lastremotewallclocktime",
+    "LastRemoteWallClockTime",
     "transferinputstats",
     "transferoutputstats",
-    "activationduration",
-    "activationsetupduration",
 ]
 
 
-class ChtcScheddCpuOspoolFilter(BaseFilter):
+class ChtcScheddCpuOspoolFilter(OspoolQueryMixin, BaseFilter):
     name = "CHTC schedd OSPool usage job history"
+    categorical_attrs = frozenset({"ProjectName", "ScheddName", "User"})
 
     def __init__(self, **kwargs):
         self.collector_hosts = {"cm-1.ospool.osg-htc.org", "cm-2.ospool.osg-htc.org", "flock.opensciencegrid.org"}
@@ -224,7 +225,7 @@ class ChtcScheddCpuOspoolFilter(BaseFilter):
                 }
             }
         })
-        return query
+        return self.add_ospool_query(query)
 
     def schedd_filter(self, data, doc):
 
@@ -269,7 +270,7 @@ class ChtcScheddCpuOspoolFilter(BaseFilter):
                 i.get("RemoteWallClockTime", 0) > 0 and
                 i.get("RemoteWallClockTime") != i.get("CommittedTime", 0)
             ):
-            o["_BadWallClockTime"].append(i["RemoteWallClockTime"] - int(float(i.get("lastremotewallclocktime", i.get("CommittedTime", 0)))))
+            o["_BadWallClockTime"].append(i["RemoteWallClockTime"] - i.get("LastRemoteWallClockTime", i.get("CommittedTime", 0)))
             o["_NumBadJobStarts"].append(i["NumJobStarts"] - 1)
         else:
             o["_BadWallClockTime"].append(0)
@@ -285,15 +286,12 @@ class ChtcScheddCpuOspoolFilter(BaseFilter):
         else:
             o["NumJobUnits"].append(None)
 
+        # Keep the highest CondorVersion instead of every job's version string
+        track_max_condor_version(o["_MaxCondorVersion"], i.get("CondorVersion"))
+
         # Add attr values to the output dict, use None if missing
         for attr in filter_attrs:
-            if attr in {"lastremotewallclocktime", "activationduration", "activationsetupduration"}:
-                try:
-                    o[attr].append(int(float(i.get(attr))))
-                except TypeError:
-                    o[attr].append(None)
-            else:
-                o[attr].append(i.get(attr, None))
+            o[attr].append(i.get(attr, None))
 
     def user_filter(self, data, doc):
 
@@ -340,7 +338,7 @@ class ChtcScheddCpuOspoolFilter(BaseFilter):
                 i.get("RemoteWallClockTime", 0) > 0 and
                 i.get("RemoteWallClockTime") != i.get("CommittedTime", 0)
             ):
-            o["_BadWallClockTime"].append(i["RemoteWallClockTime"] - int(float(i.get("lastremotewallclocktime", i.get("CommittedTime", 0)))))
+            o["_BadWallClockTime"].append(i["RemoteWallClockTime"] - i.get("LastRemoteWallClockTime", i.get("CommittedTime", 0)))
             o["_NumBadJobStarts"].append(i["NumJobStarts"] - 1)
         else:
             o["_BadWallClockTime"].append(0)
@@ -356,16 +354,14 @@ class ChtcScheddCpuOspoolFilter(BaseFilter):
         else:
             o["NumJobUnits"].append(None)
 
+        # Keep the highest CondorVersion instead of every job's version string
+        track_max_condor_version(o["_MaxCondorVersion"], i.get("CondorVersion"))
+
         # Add attr values to the output dict, use None if missing
         for attr in filter_attrs:
             # Use UNKNOWN for missing or blank ScheddName
             if attr in {"ScheddName", "ProjectName"}:
-                o[attr].append(i.get(attr, i.get(attr.lower(), "UNKNOWN")) or "UNKNOWN")
-            elif attr in {"lastremotewallclocktime", "activationduration", "activationsetupduration"}:
-                try:
-                    o[attr].append(int(float(i.get(attr))))
-                except TypeError:
-                    o[attr].append(None)
+                o[attr].append(i.get(attr, "UNKNOWN") or "UNKNOWN")
             else:
                 o[attr].append(i.get(attr, None))
 
@@ -376,7 +372,7 @@ class ChtcScheddCpuOspoolFilter(BaseFilter):
         i = doc["_source"]
 
         # Get output dict for this project
-        project = i.get("ProjectName", i.get("projectname", "UNKNOWN")) or "UNKNOWN"
+        project = i.get("ProjectName", "UNKNOWN") or "UNKNOWN"
         o = data["Projects"][project]
 
         # Filter out jobs that did not run in the OS pool
@@ -414,7 +410,7 @@ class ChtcScheddCpuOspoolFilter(BaseFilter):
                 i.get("RemoteWallClockTime", 0) > 0 and
                 i.get("RemoteWallClockTime") != i.get("CommittedTime", 0)
             ):
-            o["_BadWallClockTime"].append(i["RemoteWallClockTime"] - int(float(i.get("lastremotewallclocktime", i.get("CommittedTime", 0)))))
+            o["_BadWallClockTime"].append(i["RemoteWallClockTime"] - i.get("LastRemoteWallClockTime", i.get("CommittedTime", 0)))
             o["_NumBadJobStarts"].append(i["NumJobStarts"] - 1)
         else:
             o["_BadWallClockTime"].append(0)
@@ -430,15 +426,28 @@ class ChtcScheddCpuOspoolFilter(BaseFilter):
         else:
             o["NumJobUnits"].append(None)
 
+        # Keep the highest CondorVersion instead of every job's version string
+        track_max_condor_version(o["_MaxCondorVersion"], i.get("CondorVersion"))
+
         # Add attr values to the output dict, use None if missing
         for attr in filter_attrs:
-            if attr in {"lastremotewallclocktime", "activationduration", "activationsetupduration"}:
-                try:
-                    o[attr].append(int(float(i.get(attr))))
-                except TypeError:
-                    o[attr].append(None)
-            else:
-                o[attr].append(i.get(attr, None))
+            o[attr].append(i.get(attr, None))
+
+
+    def get_source_attrs(self):
+        # Job ad attributes read by the filter methods
+        return DEFAULT_FILTER_ATTRS + [
+            "CondorVersion",
+            "DAGNodeName",
+            "Is_resumable",
+            "LastRemotePool",
+            "ProjectName",
+            "ScheddName",
+            "SuccessCheckpointExitBySignal",
+            "SuccessCheckpointExitCode",
+            "User",
+            "WhenToTransferOutput",
+        ]
 
 
     def get_filters(self):
@@ -474,7 +483,7 @@ class ChtcScheddCpuOspoolFilter(BaseFilter):
         badput_cpu_time = []
         total_cpu_time = []
         for (last_wallclock_time, committed_time, badput_time, total_time, cpus) in zip(
-                data["lastremotewallclocktime"],
+                data["LastRemoteWallClockTime"],
                 data["CommittedTime"],
                 data["_BadWallClockTime"],
                 data["RemoteWallClockTime"],
@@ -508,7 +517,7 @@ class ChtcScheddCpuOspoolFilter(BaseFilter):
         # Short jobs are jobs that ran for < 1 minute
         is_short_job = []
         for (last_wallclock_time, committed_time, record_date, start_date) in zip(
-                data["lastremotewallclocktime"],
+                data["LastRemoteWallClockTime"],
                 data["CommittedTime"],
                 data["RecordTime"],
                 data["JobCurrentStartDate"]):
@@ -528,7 +537,7 @@ class ChtcScheddCpuOspoolFilter(BaseFilter):
         long_times_sorted = []
         for (is_short, last_wallclock_time, committed_time, job_status) in zip(
                 is_short_job,
-                data["lastremotewallclocktime"],
+                data["LastRemoteWallClockTime"],
                 data["CommittedTime"],
                 data["JobStatus"]):
             #goodput_time = last_wallclock_time or committed_time
@@ -563,8 +572,6 @@ class ChtcScheddCpuOspoolFilter(BaseFilter):
                 data["BytesSent"],
             ):
 
-            input_files_count = 0
-            input_files_bytes = 0
             if input_stats is None:
                 input_files_total_count.append(None)
                 input_files_total_job_starts.append(None)
@@ -577,26 +584,15 @@ class ChtcScheddCpuOspoolFilter(BaseFilter):
                     input_files_total_count.append(None)
                     input_files_total_job_starts.append(None)
                     continue
-                got_cedar_bytes = False
-                for attr in input_stats:
-                    if attr.casefold() in {"stashfilescounttotal", "osdffilescounttotal"}:
-                        osdf_files_count += input_stats[attr]
-                    if attr.casefold() in {"stashsizebytestotal", "osdfsizebytestotal"}:
-                        osdf_bytes_total += input_stats[attr]
-                    if attr.casefold().endswith("FilesCountTotal".casefold()):
-                        input_files_count += input_stats[attr]
-                    elif attr.casefold().endswith("SizeBytesTotal".casefold()):
-                        input_files_bytes += input_stats[attr]
-                        if attr.casefold() == "CedarSizeBytesTotal".casefold():
-                            got_cedar_bytes = True
+                (input_files_count, input_files_bytes, osdf_files, osdf_bytes, got_cedar_bytes) = parse_transfer_stats(input_stats)
+                osdf_files_count += osdf_files
+                osdf_bytes_total += osdf_bytes
                 if not got_cedar_bytes:
                     input_files_bytes += input_cedar_bytes
                 input_files_total_count.append(input_files_count)
                 input_files_total_bytes.append(input_files_bytes)
                 input_files_total_job_starts.append(job_starts)
 
-            output_files_count = 0
-            output_files_bytes = 0
             if output_stats is None:
                 output_files_total_count.append(None)
                 output_files_total_job_stops.append(None)
@@ -609,18 +605,9 @@ class ChtcScheddCpuOspoolFilter(BaseFilter):
                     output_files_total_count.append(None)
                     output_files_total_job_stops.append(None)
                     continue
-                got_cedar_bytes = False
-                for attr in output_stats:
-                    if attr.casefold() in {"stashfilescounttotal", "osdffilescounttotal"}:
-                        osdf_files_count += output_stats[attr]
-                    if attr.casefold() in {"stashsizebytestotal", "osdfsizebytestotal"}:
-                        osdf_bytes_total += output_stats[attr]
-                    if attr.casefold().endswith("FilesCountTotal".casefold()):
-                        output_files_count += output_stats[attr]
-                    elif attr.casefold().endswith("SizeBytesTotal".casefold()):
-                        output_files_bytes += output_stats[attr]
-                        if attr.casefold() == "CedarSizeBytesTotal".casefold():
-                            got_cedar_bytes = True
+                (output_files_count, output_files_bytes, osdf_files, osdf_bytes, got_cedar_bytes) = parse_transfer_stats(output_stats)
+                osdf_files_count += osdf_files
+                osdf_bytes_total += osdf_bytes
                 if not got_cedar_bytes:
                     output_files_bytes += output_cedar_bytes
                 output_files_total_count.append(output_files_count)
@@ -633,8 +620,8 @@ class ChtcScheddCpuOspoolFilter(BaseFilter):
         for (start_date, current_start_date, activation_duration, setup_duration) in zip(
                 data["JobStartDate"],
                 data["JobCurrentStartDate"],
-                data["activationduration"],
-                data["activationsetupduration"]):
+                data["ActivationDuration"],
+                data["ActivationSetupDuration"]):
             start_date = current_start_date or start_date
             if None in [start_date, activation_duration, setup_duration]:
                 continue
@@ -736,12 +723,8 @@ class ChtcScheddCpuOspoolFilter(BaseFilter):
                 row["Total Files Xferd"] = row.get("Total Files Xferd", 0) + output_files
 
         if osdf_files_count == 0 or osdf_bytes_total == 0:
-            condor_versions_set = set(data["CondorVersion"])
-            condor_versions_set.discard(None)
-            condor_versions_tuples_list = []
-            for version in condor_versions_set:
-                condor_versions_tuples_list.append(tuple([int(x) for x in version.split()[1].split(".")]))
-            if all(condor_version_tuple < (9, 7, 0) for condor_version_tuple in condor_versions_tuples_list):
+            condor_version = max_condor_version(data["_MaxCondorVersion"])
+            if condor_version is None or condor_version < (9, 7, 0):
                 row["OSDF Files Xferd"] = row["% OSDF Files"] = row["% OSDF Bytes"] = "-"
             else:
                 row["OSDF Files Xferd"] = row["% OSDF Files"] = row["% OSDF Bytes"] = 0                    
@@ -799,18 +782,9 @@ class ChtcScheddCpuOspoolFilter(BaseFilter):
 
         # Compute mode for Schedd columns in the Users table
         if agg == "Users":
-            projects = self.clean(data["ProjectName"])
-            if len(projects) > 0:
-                row["Most Used Project"] = max(set(projects), key=projects.count)
-            else:
-                row["Most Used Project"] = "UNKNOWN"
-
-            schedds = self.clean(data["ScheddName"])
-            if len(schedds) > 0:
-                row["Most Used Schedd"] = max(set(schedds), key=schedds.count)
-            else:
-                row["Most Used Schedd"] = "UNKNOWN"
+            row["Most Used Project"] = self.mode(data["ProjectName"])
+            row["Most Used Schedd"] = self.mode(data["ScheddName"])
         if agg == "Projects":
-            row["Num Users"] = len(set(data["User"]))
+            row["Num Users"] = self.count_distinct(data["User"])
 
         return row
@@ -9,9 +9,11 @@ import elasticsearch.helpers
 from functools import lru_cache
 from pathlib import Path
 from .BaseFilter import BaseFilter
+from accounting.ospool_query import OspoolQueryMixin
 from accounting.functions import get_job_units
-
-MAX_INT = 2**62
+from accounting.transfer_stats import parse_transfer_stats
+from accounting.quantiles import DEFAULT_QUANTILE_ACCURACY
+from accounting.job_times import get_time_stats_summary
 
 DEFAULT_COLUMNS = {
     10: "Num Uniq Job Ids",
@@ -39,8 +41,13 @@ DEFAULT_COLUMNS = {
     105: "Mean Setup Secs",
 
     110: "Min Hrs",
-    140: "Mean Hrs",
+    120: "25% Hrs",
+    130: "Med Hrs",
+    140: "75% Hrs",
+    145: "95% Hrs",
     150: "Max Hrs",
+    160: "Mean Hrs",
+    170: "Std Hrs",
 
     180: "Input Files / Exec Att",
 #    181: "Input MB / Exec Att",
@@ -72,8 +79,10 @@ DEFAULT_COLUMNS = {
 }
 
 
-class ChtcScheddCpuOspoolMonthlyFilter(BaseFilter):
+class ChtcScheddCpuOspoolMonthlyFilter(OspoolQueryMixin, BaseFilter):
     name = "CHTC schedd OSPool usage job history"
+    build_totals = False
+    default_quantile_accuracy = DEFAULT_QUANTILE_ACCURACY
 
     def __init__(self, **kwargs):
         self.collector_hosts = {"cm-1.ospool.osg-htc.org", "cm-2.ospool.osg-htc.org", "flock.opensciencegrid.org"}
@@ -169,7 +178,7 @@ class ChtcScheddCpuOspoolMonthlyFilter(BaseFilter):
                 }
             }
         })
-        return query
+        return self.add_ospool_query(query)
 
     def reduce_data(self, i, o, t, is_site=False):
 
@@ -180,14 +189,14 @@ class ChtcScheddCpuOspoolMonthlyFilter(BaseFilter):
         has_holds = i.get("NumHolds", 0) > 0
         is_over_rqst_disk = i.get("DiskUsage", 0) > i.get("RequestDisk", 1000)
         is_singularity_job = i.get("SingularityImage") is not None
-        has_activation_duration = i.get("activationduration") is not None
+        has_activation_duration = i.get("ActivationDuration") is not None
         if has_activation_duration:
-            activation_duration = i.get("activationduration")
+            activation_duration = i.get("ActivationDuration")
         else:
             activation_duration = 0
-        has_activation_setup_duration = i.get("activationsetupduration") is not None
+        has_activation_setup_duration = i.get("ActivationSetupDuration") is not None
         if has_activation_setup_duration:
-            activation_setup_duration = i.get("activationsetupduration")
+            activation_setup_duration = i.get("ActivationSetupDuration")
         else:
             activation_setup_duration = 0
         is_short = False
@@ -198,7 +207,7 @@ class ChtcScheddCpuOspoolMonthlyFilter(BaseFilter):
         osdf_bytes = 0
         job_units = 0
         if not is_removed:
-            goodput_time = int(float(i.get("lastremotewallclocktime", i.get("CommittedTime", 0))))
+            goodput_time = i.get("LastRemoteWallClockTime", i.get("CommittedTime", 0))
             if goodput_time > 0 and goodput_time < 60:
                 is_short = True
             elif None in [i.get("RecordTime"), i.get("JobCurrentStartDate")]:
@@ -209,7 +218,7 @@ class ChtcScheddCpuOspoolMonthlyFilter(BaseFilter):
             else:
                 is_long = True
         elif not is_removed:
-            goodput_time = int(float(i.get("lastremotewallclocktime", i.get("CommittedTime", 0))))
+            goodput_time = i.get("LastRemoteWallClockTime", i.get("CommittedTime", 0))
         job_units = get_job_units(
             cpus=i.get("RequestCpus", 1),
             memory_gb=i.get("RequestMemory", 1024)/1024,
@@ -245,28 +254,10 @@ class ChtcScheddCpuOspoolMonthlyFilter(BaseFilter):
             except SyntaxError:
                 output_file_stats = {}
 
-            for key, value in input_file_stats.items():
-                if key.casefold() in {"stashfilescounttotal", "osdffilescounttotal"}:
-                    osdf_files += value
-                if key.casefold() in {"stashsizebytestotal", "osdfsizebytestotal"}:
-                    osdf_bytes += value
-                if key.casefold().endswith("FilesCountTotal".casefold()):
-                    input_files += value
-                elif key.casefold().endswith("SizeBytesTotal".casefold()):
-                    input_bytes += value
-                    if key.casefold() == "CedarSizeBytesTotal".casefold():
-                        got_cedar_input_bytes = True
-            for key, value in output_file_stats.items():
-                if key.casefold() in {"stashfilescounttotal", "osdffilescounttotal"}:
-                    osdf_files += value
-                if key.casefold() in {"stashsizebytestotal", "osdfsizebytestotal"}:
-                    osdf_bytes += value
-                if key.casefold().endswith("FilesCountTotal".casefold()):
-                    output_files += value
-                elif key.casefold().endswith("SizeBytesTotal".casefold()):
-                    output_bytes += value
-                    if key.casefold() == "CedarSizeBytesTotal".casefold():
-                        got_cedar_output_bytes = True
+            (input_files, input_bytes, input_osdf_files, input_osdf_bytes, got_cedar_input_bytes) = parse_transfer_stats(input_file_stats)
+            (output_files, output_bytes, output_osdf_files, output_osdf_bytes, got_cedar_output_bytes) = parse_transfer_stats(output_file_stats)
+            osdf_files += input_osdf_files + output_osdf_files
+            osdf_bytes += input_osdf_bytes + output_osdf_bytes
             if not (got_cedar_input_bytes or got_cedar_output_bytes):
                 input_bytes += i.get("BytesRecvd", 0)
                 output_bytes += i.get("BytesSent", 0)
@@ -288,7 +279,6 @@ class ChtcScheddCpuOspoolMonthlyFilter(BaseFilter):
         sum_cols["ActivationSetupDurationJobs"] = int(has_activation_setup_duration)
         sum_cols["TotalActivationSetupDuration"] = int(activation_setup_duration)
 
-        sum_cols["TotalLongJobWallClockTime"] = long_job_wallclock_time
         sum_cols["GoodCpuTime"] = (goodput_time * max(i.get("RequestCpus", 1), 1))
         sum_cols["CpuTime"] = (i.get("RemoteWallClockTime", 0) * max(i.get("RequestCpus", 1), 1))
         sum_cols["BadCpuTime"] = ((i.get("RemoteWallClockTime", 0) - goodput_time) * max(i.get("RequestCpus", 1), 1))
@@ -312,7 +302,6 @@ class ChtcScheddCpuOspoolMonthlyFilter(BaseFilter):
             sum_cols["OSDFBytes"] = osdf_bytes
 
         max_cols = {}
-        max_cols["MaxLongJobWallClockTime"] = long_job_wallclock_time
         max_cols["MaxRequestMemory"] = i.get("RequestMemory", 0)
         max_cols["MaxMemoryUsage"] = i.get("MemoryUsage", 0)
         max_cols["MaxRequestDisk"] = i.get("RequestDisk", 0)
@@ -320,18 +309,42 @@ class ChtcScheddCpuOspoolMonthlyFilter(BaseFilter):
         max_cols["MaxRequestCpus"] = i.get("RequestCpus", 1)
         max_cols["MaxJobUnits"] = job_units
 
-        min_cols = {}
-        min_cols["MinLongJobWallClockTime"] = long_job_wallclock_time
-
         for col in sum_cols:
             o[col] = (o.get(col) or 0) + sum_cols[col]
             t[col] = (t.get(col) or 0) + sum_cols[col]
         for col in max_cols:
             o[col] = max([(o.get(col) or 0), max_cols[col]])
             t[col] = max([(t.get(col) or 0), max_cols[col]])
-        for col in min_cols:
-            o[col] = min([(o.get(col) or MAX_INT), min_cols[col]])
-            t[col] = min([(t.get(col) or MAX_INT), min_cols[col]])
+
+        # Summarize the long job times for the time percentiles
+        if is_long:
+            for d in [o, t]:
+                if d.get("LongJobTimes") is None:
+                    d["LongJobTimes"] = self.make_quantiles()
+                d["LongJobTimes"].add(long_job_wallclock_time)
+
+        # Count the distinct job ids with --distinct_counts
+        if self.distinct_counts is not None and i.get("GlobalJobId") is not None:
+            self.add_distinct(o, t, "JobIds", i["GlobalJobId"])
+
+    def add_distinct(self, o, t, col, value):
+        # Adds value to the distinct counts of col in o and t
+        for d in [o, t]:
+            if d.get(col) is None:
+                d[col] = self.make_distinct_count()
+            d[col].add(value)
+
+    def merge_field(self, field, values, partial_values):
+        # Merges the Max columns, the quantile summaries and the distinct counts like reduce_data()
+        # and takes the union of the Users dicts
+        if field.startswith("Max"):
+            return max([(values or 0), partial_values])
+        if field == "LongJobTimes" or (field in {"JobIds", "Users"} and self.distinct_counts is not None):
+            return values.merge(partial_values)
+        if field == "Users":
+            values.update(partial_values)
+            return values
+        return super().merge_field(field, values, partial_values)
 
     def schedd_filter(self, data, doc):
 
@@ -367,7 +380,7 @@ class ChtcScheddCpuOspoolMonthlyFilter(BaseFilter):
 
         counter_cols = {}
         counter_cols["ScheddNames"] = i.get("ScheddName", "UNKNOWN") or "UNKNOWN"
-        counter_cols["ProjectNames"] = i.get("ProjectName", i.get("projectname", "UNKNOWN")) or "UNKNOWN"
+        counter_cols["ProjectNames"] = i.get("ProjectName", "UNKNOWN") or "UNKNOWN"
 
         for col in counter_cols:
             if not col in output:
@@ -388,7 +401,7 @@ class ChtcScheddCpuOspoolMonthlyFilter(BaseFilter):
             return
 
         # Get output dict for this project
-        project = i.get("ProjectName", i.get("projectname", i.get("projectname", "UNKNOWN"))) or "UNKNOWN"
+        project = i.get("ProjectName", "UNKNOWN") or "UNKNOWN"
         output = data["Projects"][project]
         total = data["Projects"]["TOTAL"]
 
@@ -397,6 +410,10 @@ class ChtcScheddCpuOspoolMonthlyFilter(BaseFilter):
         dict_cols = {}
         dict_cols["Users"] = i.get("User", "UNKNOWN") or "UNKNOWN"
 
+        # Count the distinct users in distinct counts instead with --distinct_counts
+        if self.distinct_counts is not None:
+            self.add_distinct(output, total, "Users", dict_cols.pop("Users"))
+
         for col in dict_cols:
             output[col] = output.get(col) or {}
             output[col][dict_cols[col]] = 1
@@ -404,6 +421,45 @@ class ChtcScheddCpuOspoolMonthlyFilter(BaseFilter):
             total[col][dict_cols[col]] = 1
 
 
+    def get_source_attrs(self):
+        # Job ad attributes read by the filter methods
+        source_attrs = [
+            "ActivationDuration",
+            "ActivationSetupDuration",
+            "BytesRecvd",
+            "BytesSent",
+            "CommittedTime",
+            "DAGNodeName",
+            "DiskUsage",
+            "Is_resumable",
+            "JobCurrentStartDate",
+            "JobStatus",
+            "LastRemotePool",
+            "LastRemoteWallClockTime",
+            "MemoryUsage",
+            "NumHolds",
+            "NumJobStarts",
+            "NumShadowStarts",
+            "ProjectName",
+            "RecordTime",
+            "RemoteWallClockTime",
+            "RequestCpus",
+            "RequestDisk",
+            "RequestMemory",
+            "ScheddName",
+            "SingularityImage",
+            "SuccessCheckpointExitBySignal",
+            "SuccessCheckpointExitCode",
+            "transferinputstats",
+            "transferoutputstats",
+            "User",
+            "WhenToTransferOutput",
+        ]
+        if self.distinct_counts is not None:
+            source_attrs.append("GlobalJobId")
+        return source_attrs
+
+
     def get_filters(self):
         # Add all filter methods to a list
         filters = [
@@ -431,6 +487,8 @@ class ChtcScheddCpuOspoolMonthlyFilter(BaseFilter):
         # Compute columns
         row["All CPU Hours"]     = data["CpuTime"] / 3600
         row["Num Uniq Job Ids"]  = data["Jobs"]
+        if "JobIds" in data:
+            row["Num Uniq Job Ids"] = len(data["JobIds"])
         row["Good CPU Hours"]    = data["GoodCpuTime"] / 3600
         row["Job Unit Hours"]    = data["JobUnitTime"] / 3600
 
@@ -501,12 +559,8 @@ class ChtcScheddCpuOspoolMonthlyFilter(BaseFilter):
         else:
             row["CPU Hours / Bad Exec Att"] = 0
 
-        if data["LongJobs"] > 0:
-            row["Min Hrs"]  = data["MinLongJobWallClockTime"] / 3600
-            row["Max Hrs"]  = data["MaxLongJobWallClockTime"] / 3600
-            row["Mean Hrs"] = (data["TotalLongJobWallClockTime"] / data["LongJobs"]) / 3600
-        else:
-            row["Min Hrs"] = row["Max Hrs"] = row["Mean Hrs"] = 0
+        # Compute time percentiles and stats from the summary of long job times
+        row.update(get_time_stats_summary(data.get("LongJobTimes")))
 
         if data["ActivationDurationJobs"] > 0:
             row["Mean Actv Hrs"] = (data["TotalActivationDuration"] / data["ActivationDurationJobs"]) / 3600
@@ -535,9 +589,6 @@ class ChtcScheddCpuOspoolMonthlyFilter(BaseFilter):
 
         return row
 
-    def scan_and_filter(self, es_index, start_ts, end_ts, **kwargs):
-        return super().scan_and_filter(es_index, start_ts, end_ts, build_totals=False, **kwargs)
-
     def merge_filtered_data(self, data, agg):
         # Takes filtered data and an aggregation level (e.g. Users, Schedds,
         # Projects) and returns a list of tuples, with the first item
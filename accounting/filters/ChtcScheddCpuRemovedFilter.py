@@ -43,7 +43,7 @@ DEFAULT_FILTER_ATTRS = [
     "MemoryUsage",
     "NumJobStarts",
     "NumShadowStarts",
-    "numholds",
+    "NumHolds",
     "JobStatus",
     "EnteredCurrentStatus",
     "BytesSent",
@@ -53,6 +53,7 @@ DEFAULT_FILTER_ATTRS = [
 
 class ChtcScheddCpuRemovedFilter(BaseFilter):
     name = "CHTC schedd removed job history"
+    categorical_attrs = frozenset({"ProjectName", "ScheddName", "User"})
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -183,7 +184,7 @@ class ChtcScheddCpuRemovedFilter(BaseFilter):
         for attr in filter_attrs:
             # Use UNKNOWN for missing or blank ProjectName and ScheddName
             if attr in {"ScheddName", "ProjectName"}:
-                o[attr].append(i.get(attr, i.get(attr.lower(), "UNKNOWN")) or "UNKNOWN")
+                o[attr].append(i.get(attr, "UNKNOWN") or "UNKNOWN")
             else:
                 o[attr].append(i.get(attr, None))
 
@@ -193,7 +194,7 @@ class ChtcScheddCpuRemovedFilter(BaseFilter):
         i = doc["_source"]
 
         # Get output dict for this project
-        project = i.get("ProjectName", i.get("projectname", "UNKNOWN")) or "UNKNOWN"
+        project = i.get("ProjectName", "UNKNOWN") or "UNKNOWN"
         o = data["Projects"][project]
 
         # Filter out jobs that were not removed
@@ -233,6 +234,15 @@ class ChtcScheddCpuRemovedFilter(BaseFilter):
         for attr in filter_attrs:
             o[attr].append(i.get(attr, None))
 
+    def get_source_attrs(self):
+        # Job ad attributes read by the filter methods
+        return DEFAULT_FILTER_ATTRS + [
+            "DAGNodeName",
+            "ProjectName",
+            "ScheddName",
+            "User",
+        ]
+
     def get_filters(self):
         # Add all filter methods to a list
         filters = [
@@ -321,8 +331,8 @@ class ChtcScheddCpuRemovedFilter(BaseFilter):
         row["Good CPU Hours"]   = sum(self.clean(goodput_cpu_time)) / 3600
         row["Num Uniq Job Ids"] = sum(data['_NumJobs'])
         row["Rm'd Jobs w/o Shadw Start"]= sum([starts in [0, None] for starts in data["NumShadowStarts"]])
-        row["Num Job Holds"]    = sum([int(numholds) for numholds in self.clean(data["numholds"])])
-        row["Num Jobs w/1+ Holds"] = sum([holds > 0 for holds in [int(numholds) for numholds in self.clean(data["numholds"])]])
+        row["Num Job Holds"]    = sum(self.clean(data["NumHolds"]))
+        row["Num Jobs w/1+ Holds"] = sum([holds > 0 for holds in self.clean(data["NumHolds"])])
         row["Avg MB Sent"]      = stats.mean(self.clean(data["BytesSent"], allow_empty_list=False)) / 1e6
         row["Max MB Sent"]      = max(self.clean(data["BytesSent"], allow_empty_list=False)) / 1e6
         row["Avg MB Recv"]      = stats.mean(self.clean(data["BytesRecvd"], allow_empty_list=False)) / 1e6
@@ -360,18 +370,9 @@ class ChtcScheddCpuRemovedFilter(BaseFilter):
 
         # Compute mode for Project and Schedd columns in the Users table
         if agg == "Users":
-            projects = self.clean(data["ProjectName"])
-            if len(projects) > 0:
-                row["Most Used Project"] = max(set(projects), key=projects.count)
-            else:
-                row["Most Used Project"] = "UNKNOWN"
-
-            schedds = self.clean(data["ScheddName"])
-            if len(schedds) > 0:
-                row["Most Used Schedd"] = max(set(schedds), key=schedds.count)
-            else:
-                row["Most Used Schedd"] = "UNKNOWN"
+            row["Most Used Project"] = self.mode(data["ProjectName"])
+            row["Most Used Schedd"] = self.mode(data["ScheddName"])
         if agg == "Projects":
-            row["Num Users"] = len(set(data["User"]))
+            row["Num Users"] = self.count_distinct(data["User"])
 
         return row
@@ -32,6 +32,7 @@ DEFAULT_FILTER_ATTRS = [
 
 class ChtcScheddDSIGpuFilter(BaseFilter):
     name = "DSI GPU schedd job history"
+    categorical_attrs = frozenset({"User"})
 
 
     def __init__(self, **kwargs):
@@ -84,7 +85,7 @@ class ChtcScheddDSIGpuFilter(BaseFilter):
         i = doc["_source"]
 
         # Get output dict for this project
-        project = i.get("ProjectName", i.get("projectname", "UNKNOWN")) or "UNKNOWN"
+        project = i.get("ProjectName", "UNKNOWN") or "UNKNOWN"
         o = data["Projects"][project]
 
         # Add custom attrs to the list of attrs
@@ -117,10 +118,10 @@ class ChtcScheddDSIGpuFilter(BaseFilter):
         if (
                 i.get("NumJobStarts", 0) > 1 and
                 i.get("RemoteWallClockTime", 0) > 0 and
-                #i.get("RemoteWallClockTime") != int(float(i.get("lastremotewallclocktime", i.get("CommittedTime", 0))))
+                #i.get("RemoteWallClockTime") != i.get("LastRemoteWallClockTime", i.get("CommittedTime", 0))
                 i.get("RemoteWallClockTime") != i.get("CommittedTime", 0)
             ):
-            o["_BadWallClockTime"].append(i["RemoteWallClockTime"] - int(float(i.get("lastremotewallclocktime", i.get("CommittedTime", 0)))))
+            o["_BadWallClockTime"].append(i["RemoteWallClockTime"] - i.get("LastRemoteWallClockTime", i.get("CommittedTime", 0)))
             o["_NumBadJobStarts"].append(i["NumJobStarts"] - 1)
         else:
             o["_BadWallClockTime"].append(0)
@@ -128,13 +129,7 @@ class ChtcScheddDSIGpuFilter(BaseFilter):
 
         # Add attr values to the output dict, use None if missing
         for attr in filter_attrs:
-            if attr in {"lastremotewallclocktime", "activationduration", "activationsetupduration"}:
-                try:
-                    o[attr].append(int(float(i.get(attr))))
-                except TypeError:
-                    o[attr].append(None)
-            else:
-                o[attr].append(i.get(attr, None))
+            o[attr].append(i.get(attr, None))
 
 
     def machine_filter(self, data, doc):
@@ -166,6 +161,20 @@ class ChtcScheddDSIGpuFilter(BaseFilter):
         for attr in filter_attrs:
             o[attr].append(i.get(attr, None))
 
+    def get_source_attrs(self):
+        # Job ad attributes read by the filter methods
+        return DEFAULT_FILTER_ATTRS + [
+            "DAGNodeName",
+            "Is_resumable",
+            "LastRemoteWallClockTime",
+            "ProjectName",
+            "ScheddName",
+            "SuccessCheckpointExitBySignal",
+            "SuccessCheckpointExitCode",
+            "User",
+            "WhenToTransferOutput",
+        ]
+
     def get_filters(self):
         # Add all filter methods to a list
         filters = [
@@ -226,7 +235,7 @@ class ChtcScheddDSIGpuFilter(BaseFilter):
         row["Max Rqst Gpus"]    = max(self.clean(data["RequestGpus"], allow_empty_list=False))
 
         if agg == "Projects":
-            row["Num Users"] = len(set(data["User"]))
+            row["Num Users"] = self.count_distinct(data["User"])
 
         return row
 
@@ -250,6 +259,6 @@ class ChtcScheddDSIGpuFilter(BaseFilter):
         row["All GPU Hours"]    = sum(self.clean(goodput_gpu_time)) / 3600
         row["Num Uniq Job Ids"] = sum(data['_NumJobs'])
         row["Max Rqst Gpus"]    = max(self.clean(data["RequestGpus"], allow_empty_list=False))
-        row["Num Users"]        = len(set(data["User"]))
+        row["Num Users"]        = self.count_distinct(data["User"])
 
         return row
@@ -1,8 +1,10 @@
 import statistics as stats
 from pathlib import Path
 from ast import literal_eval
-from .BaseFilter import BaseFilter
+from .BaseFilter import BaseFilter, JobRecord
+from accounting.condor_version import track_max_condor_version, max_condor_version
 from accounting.functions import get_job_units
+from accounting.transfer_stats import parse_transfer_stats
 
 
 DEFAULT_COLUMNS = {
@@ -94,17 +96,16 @@ DEFAULT_FILTER_ATTRS = [
     "SingularityImage",
     "ActivationDuration",
     "ActivationSetupDuration",
-    "CondorVersion",
-    "lastremotewallclocktime",
+    "LastRemoteWallClockTime",
     "transferinputstats",
     "transferoutputstats",
-    "activationduration",
-    "activationsetupduration",
 ]
 
 
 class IgwnScheddCpuFilter(BaseFilter):
     name = "IGWN schedd job history"
+    use_job_records = True
+    categorical_attrs = frozenset({"ScheddName", "User"})
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -141,38 +142,23 @@ class IgwnScheddCpuFilter(BaseFilter):
         })
         return query
 
-    def schedd_filter(self, data, doc):
-
-        # Get input dict
-        i = doc["_source"]
-
-        # Get output dict for this schedd
-        schedd = i.get("ScheddName", "UNKNOWN") or "UNKNOWN"
-        o = data["Schedds"][schedd]
-
-        # Get list of attrs
-        filter_attrs = DEFAULT_FILTER_ATTRS.copy()
+    def get_job_record(self, i):
+        # Derive the values shared by all of the filter methods once per job ad
+        job = JobRecord()
 
         # Count number of DAGNode Jobs
         if i.get("DAGNodeName") is not None:
-            o["_NumDAGNodes"].append(1)
-        else:
-            o["_NumDAGNodes"].append(0)
-
-        # Count number of history ads (i.e. number of unique job ids)
-        o["_NumJobs"].append(1)
+            job.num_dag_nodes = 1
 
         # Count number of checkpointable jobs
-        if  (
+        if (
                 i.get("WhenToTransferOutput", "").upper() == "ON_EXIT_OR_EVICT" and
                 i.get("Is_resumable", False)
             ) or (
                 i.get("SuccessCheckpointExitBySignal", False) or
                 i.get("SuccessCheckpointExitCode") is not None
             ):
-            o["_NumCkptJobs"].append(1)
-        else:
-            o["_NumCkptJobs"].append(0)
+            job.num_ckpt_jobs = 1
 
         # Compute badput fields
         if (
@@ -180,36 +166,60 @@ class IgwnScheddCpuFilter(BaseFilter):
                 i.get("RemoteWallClockTime", 0) > 0 and
                 i.get("RemoteWallClockTime") != i.get("CommittedTime", 0)
             ):
-            o["_BadWallClockTime"].append(i["RemoteWallClockTime"] - int(float(i.get("lastremotewallclocktime", i.get("CommittedTime", 0)))))
-            o["_NumBadJobStarts"].append(i["NumJobStarts"] - 1)
-        else:
-            o["_BadWallClockTime"].append(0)
-            o["_NumBadJobStarts"].append(0)
+            job.bad_wall_clock_time = i["RemoteWallClockTime"] - i.get("LastRemoteWallClockTime", i.get("CommittedTime", 0))
+            job.num_bad_job_starts = i["NumJobStarts"] - 1
 
         # Compute job units
         if i.get("RemoteWallClockTime", 0) > 0:
-            o["NumJobUnits"].append(get_job_units(
+            job.job_units = get_job_units(
                 cpus=i.get("RequestCpus", 1),
                 memory_gb=i.get("RequestMemory", 1024)/1024,
                 disk_gb=i.get("RequestDisk", 1024**2)/1024**2,
-            ))
-        else:
-            o["NumJobUnits"].append(None)
+            )
+
+        return job
+
+    def schedd_filter(self, data, doc):
+
+        # Get input dict
+        i = doc["_source"]
+        job = doc["_job"]
+
+        # Get output dict for this schedd
+        schedd = i.get("ScheddName", "UNKNOWN") or "UNKNOWN"
+        o = data["Schedds"][schedd]
+
+        # Get list of attrs
+        filter_attrs = DEFAULT_FILTER_ATTRS.copy()
+
+        # Count number of DAGNode Jobs
+        o["_NumDAGNodes"].append(job.num_dag_nodes)
+
+        # Count number of history ads (i.e. number of unique job ids)
+        o["_NumJobs"].append(1)
+
+        # Count number of checkpointable jobs
+        o["_NumCkptJobs"].append(job.num_ckpt_jobs)
+
+        # Compute badput fields
+        o["_BadWallClockTime"].append(job.bad_wall_clock_time)
+        o["_NumBadJobStarts"].append(job.num_bad_job_starts)
+
+        # Compute job units
+        o["NumJobUnits"].append(job.job_units)
+
+        # Keep the highest CondorVersion instead of every job's version string
+        track_max_condor_version(o["_MaxCondorVersion"], i.get("CondorVersion"))
 
         # Add attr values to the output dict, use None if missing
         for attr in filter_attrs:
-            if attr in {"lastremotewallclocktime", "activationduration", "activationsetupduration"}:
-                try:
-                    o[attr].append(int(float(i.get(attr))))
-                except TypeError:
-                    o[attr].append(None)
-            else:
-                o[attr].append(i.get(attr, None))
+            o[attr].append(i.get(attr, None))
 
     def user_filter(self, data, doc):
 
         # Get input dict
         i = doc["_source"]
+        job = doc["_job"]
 
         # Get output dict for this user
         user = i.get("User", "UNKNOWN") or "UNKNOWN"
@@ -220,58 +230,29 @@ class IgwnScheddCpuFilter(BaseFilter):
         filter_attrs = filter_attrs + ["ScheddName", "ProjectName"]
 
         # Count number of DAGNode Jobs
-        if i.get("DAGNodeName") is not None:
-            o["_NumDAGNodes"].append(1)
-        else:
-            o["_NumDAGNodes"].append(0)
+        o["_NumDAGNodes"].append(job.num_dag_nodes)
 
         # Count number of history ads (i.e. number of unique job ids)
         o["_NumJobs"].append(1)
 
         # Count number of checkpointable jobs
-        if  (
-                i.get("WhenToTransferOutput", "").upper() == "ON_EXIT_OR_EVICT" and
-                i.get("Is_resumable", False)
-            ) or (
-                i.get("SuccessCheckpointExitBySignal", False) or
-                i.get("SuccessCheckpointExitCode") is not None
-            ):
-            o["_NumCkptJobs"].append(1)
-        else:
-            o["_NumCkptJobs"].append(0)
+        o["_NumCkptJobs"].append(job.num_ckpt_jobs)
 
         # Compute badput fields
-        if (
-                i.get("NumJobStarts", 0) > 1 and
-                i.get("RemoteWallClockTime", 0) > 0 and
-                i.get("RemoteWallClockTime") != i.get("CommittedTime", 0)
-            ):
-            o["_BadWallClockTime"].append(i["RemoteWallClockTime"] - int(float(i.get("lastremotewallclocktime", i.get("CommittedTime", 0)))))
-            o["_NumBadJobStarts"].append(i["NumJobStarts"] - 1)
-        else:
-            o["_BadWallClockTime"].append(0)
-            o["_NumBadJobStarts"].append(0)
+        o["_BadWallClockTime"].append(job.bad_wall_clock_time)
+        o["_NumBadJobStarts"].append(job.num_bad_job_starts)
 
         # Compute job units
-        if i.get("RemoteWallClockTime", 0) > 0:
-            o["NumJobUnits"].append(get_job_units(
-                cpus=i.get("RequestCpus", 1),
-                memory_gb=i.get("RequestMemory", 1024)/1024,
-                disk_gb=i.get("RequestDisk", 1024**2)/1024**2,
-            ))
-        else:
-            o["NumJobUnits"].append(None)
+        o["NumJobUnits"].append(job.job_units)
+
+        # Keep the highest CondorVersion instead of every job's version string
+        track_max_condor_version(o["_MaxCondorVersion"], i.get("CondorVersion"))
 
         # Add attr values to the output dict, use None if missing
         for attr in filter_attrs:
             # Use UNKNOWN for missing or blank ScheddName
             if attr in {"ScheddName", "ProjectName"}:
-                o[attr].append(i.get(attr, i.get(attr.lower(), "UNKNOWN")) or "UNKNOWN")
-            elif attr in {"lastremotewallclocktime", "activationduration", "activationsetupduration"}:
-                try:
-                    o[attr].append(int(float(i.get(attr))))
-                except TypeError:
-                    o[attr].append(None)
+                o[attr].append(i.get(attr, "UNKNOWN") or "UNKNOWN")
             else:
                 o[attr].append(i.get(attr, None))
 
@@ -280,9 +261,10 @@ class IgwnScheddCpuFilter(BaseFilter):
 
         # Get input dict
         i = doc["_source"]
+        job = doc["_job"]
 
         # Get output dict for this project
-        project = i.get("ProjectName", i.get("projectname", "UNKNOWN")) or "UNKNOWN"
+        project = i.get("ProjectName", "UNKNOWN") or "UNKNOWN"
         o = data["Projects"][project]
 
         # Add custom attrs to the list of attrs
@@ -290,57 +272,42 @@ class IgwnScheddCpuFilter(BaseFilter):
         filter_attrs = filter_attrs + ["User"]
 
         # Count number of DAGNode Jobs
-        if i.get("DAGNodeName") is not None:
-            o["_NumDAGNodes"].append(1)
-        else:
-            o["_NumDAGNodes"].append(0)
+        o["_NumDAGNodes"].append(job.num_dag_nodes)
 
         # Count number of history ads (i.e. number of unique job ids)
         o["_NumJobs"].append(1)
 
         # Count number of checkpointable jobs
-        if  (
-                i.get("WhenToTransferOutput", "").upper() == "ON_EXIT_OR_EVICT" and
-                i.get("Is_resumable", False)
-            ) or (
-                i.get("SuccessCheckpointExitBySignal", False) or
-                i.get("SuccessCheckpointExitCode") is not None
-            ):
-            o["_NumCkptJobs"].append(1)
-        else:
-            o["_NumCkptJobs"].append(0)
+        o["_NumCkptJobs"].append(job.num_ckpt_jobs)
 
         # Compute badput fields
-        if (
-                i.get("NumJobStarts", 0) > 1 and
-                i.get("RemoteWallClockTime", 0) > 0 and
-                i.get("RemoteWallClockTime") != i.get("CommittedTime", 0)
-            ):
-            o["_BadWallClockTime"].append(i["RemoteWallClockTime"] - int(float(i.get("lastremotewallclocktime", i.get("CommittedTime", 0)))))
-            o["_NumBadJobStarts"].append(i["NumJobStarts"] - 1)
-        else:
-            o["_BadWallClockTime"].append(0)
-            o["_NumBadJobStarts"].append(0)
+        o["_BadWallClockTime"].append(job.bad_wall_clock_time)
+        o["_NumBadJobStarts"].append(job.num_bad_job_starts)
 
         # Compute job units
-        if i.get("RemoteWallClockTime", 0) > 0:
-            o["NumJobUnits"].append(get_job_units(
-                cpus=i.get("RequestCpus", 1),
-                memory_gb=i.get("RequestMemory", 1024)/1024,
-                disk_gb=i.get("RequestDisk", 1024**2)/1024**2,
-            ))
-        else:
-            o["NumJobUnits"].append(None)
+        o["NumJobUnits"].append(job.job_units)
+
+        # Keep the highest CondorVersion instead of every job's version string
+        track_max_condor_version(o["_MaxCondorVersion"], i.get("CondorVersion"))
 
         # Add attr values to the output dict, use None if missing
         for attr in filter_attrs:
-            if attr in {"lastremotewallclocktime", "activationduration", "activationsetupduration"}:
-                try:
-                    o[attr].append(int(float(i.get(attr))))
-                except TypeError:
-                    o[attr].append(None)
-            else:
-                o[attr].append(i.get(attr, None))
+            o[attr].append(i.get(attr, None))
+
+
+    def get_source_attrs(self):
+        # Job ad attributes read by the filter methods
+        return DEFAULT_FILTER_ATTRS + [
+            "CondorVersion",
+            "DAGNodeName",
+            "Is_resumable",
+            "ProjectName",
+            "ScheddName",
+            "SuccessCheckpointExitBySignal",
+            "SuccessCheckpointExitCode",
+            "User",
+            "WhenToTransferOutput",
+        ]
 
 
     def get_filters(self):
@@ -370,32 +337,9 @@ class IgwnScheddCpuFilter(BaseFilter):
         # Output dictionary
         row = {}
 
-        # Compute goodput and total CPU hours columns
-        goodput_cpu_time = []
-        badput_cpu_time = []
-        total_cpu_time = []
-        for (last_wallclock_time, committed_time, badput_time, total_time, cpus) in zip(
-                data["lastremotewallclocktime"],
-                data["CommittedTime"],
-                data["_BadWallClockTime"],
-                data["RemoteWallClockTime"],
-                data["RequestCpus"]):
-            #goodput_time = last_wallclock_time or committed_time
-            goodput_time = committed_time
-            if cpus is not None:
-                cpus = max(cpus, 1)  # assume at least 1 CPU even if 0 CPUs were stored in Elasticsearch
-            if None in [goodput_time, cpus]:
-                goodput_cpu_time.append(None)
-            else:
-                goodput_cpu_time.append(goodput_time * cpus)
-            if None in [badput_time, cpus]:
-                badput_cpu_time.append(None)
-            else:
-                badput_cpu_time.append(badput_time * cpus)
-            if None in [total_time, cpus]:
-                total_cpu_time.append(None)
-            else:
-                total_cpu_time.append(total_time * cpus)
+        # Compute goodput, badput and total CPU time, short jobs
+        # and long job time stats
+        job_times = self.compute_job_times(data)
 
         # Don't count starts and shadows for jobs that don't/shouldn't have shadows
         num_exec_attempts = []
@@ -406,39 +350,6 @@ class IgwnScheddCpuFilter(BaseFilter):
             num_exec_attempts.append(job_starts)
             num_shadow_starts.append(shadow_starts)
 
-        # Short jobs are jobs that ran for < 1 minute
-        is_short_job = []
-        for (last_wallclock_time, committed_time, record_date, start_date) in zip(
-                data["lastremotewallclocktime"],
-                data["CommittedTime"],
-                data["RecordTime"],
-                data["JobCurrentStartDate"]):
-            #goodput_time = last_wallclock_time or committed_time
-            goodput_time = committed_time
-            if (goodput_time is not None) and (goodput_time > 0):
-                is_short_job.append(goodput_time < 60)
-            elif None in (record_date, start_date):
-                is_short_job.append(None)
-            else:
-                is_short_job.append((record_date - start_date) < 60)
-
-        # "Long" (i.e. "normal") jobs ran >= 1 minute
-        # We only want to use these when computing percentiles,
-        # so filter out short jobs and removed jobs,
-        # and sort them so we can easily grab the percentiles later
-        long_times_sorted = []
-        for (is_short, last_wallclock_time, committed_time, job_status) in zip(
-                is_short_job,
-                data["lastremotewallclocktime"],
-                data["CommittedTime"],
-                data["JobStatus"]):
-            #goodput_time = last_wallclock_time or committed_time
-            goodput_time = committed_time
-            if (is_short is False) and (job_status != 3):
-                long_times_sorted.append(goodput_time)
-        long_times_sorted = self.clean(long_times_sorted)
-        long_times_sorted.sort()
-
         # File transfer stats
         input_files_total_count = []
         input_files_total_bytes = []
@@ -464,8 +375,6 @@ class IgwnScheddCpuFilter(BaseFilter):
                 data["BytesSent"],
             ):
 
-            input_files_count = 0
-            input_files_bytes = 0
             if input_stats is None:
                 input_files_total_count.append(None)
                 input_files_total_job_starts.append(None)
@@ -478,26 +387,15 @@ class IgwnScheddCpuFilter(BaseFilter):
                     input_files_total_count.append(None)
                     input_files_total_job_starts.append(None)
                     continue
-                got_cedar_bytes = False
-                for attr in input_stats:
-                    if attr.casefold() in {"stashfilescounttotal", "osdffilescounttotal"}:
-                        osdf_files_count += input_stats[attr]
-                    if attr.casefold() in {"stashsizebytestotal", "osdfsizebytestotal"}:
-                        osdf_bytes_total += input_stats[attr]
-                    if attr.casefold().endswith("FilesCountTotal".casefold()):
-                        input_files_count += input_stats[attr]
-                    elif attr.casefold().endswith("SizeBytesTotal".casefold()):
-                        input_files_bytes += input_stats[attr]
-                        if attr.casefold() == "CedarSizeBytesTotal".casefold():
-                            got_cedar_bytes = True
+                (input_files_count, input_files_bytes, osdf_files, osdf_bytes, got_cedar_bytes) = parse_transfer_stats(input_stats)
+                osdf_files_count += osdf_files
+                osdf_bytes_total += osdf_bytes
                 if not got_cedar_bytes:
                     input_files_bytes += input_cedar_bytes
                 input_files_total_count.append(input_files_count)
                 input_files_total_bytes.append(input_files_bytes)
                 input_files_total_job_starts.append(job_starts)
 
-            output_files_count = 0
-            output_files_bytes = 0
             if output_stats is None:
                 output_files_total_count.append(None)
                 output_files_total_job_stops.append(None)
@@ -510,18 +408,9 @@ class IgwnScheddCpuFilter(BaseFilter):
                     output_files_total_count.append(None)
                     output_files_total_job_stops.append(None)
                     continue
-                got_cedar_bytes = False
-                for attr in output_stats:
-                    if attr.casefold() in {"stashfilescounttotal", "osdffilescounttotal"}:
-                        osdf_files_count += output_stats[attr]
-                    if attr.casefold() in {"stashsizebytestotal", "osdfsizebytestotal"}:
-                        osdf_bytes_total += output_stats[attr]
-                    if attr.casefold().endswith("FilesCountTotal".casefold()):
-                        output_files_count += output_stats[attr]
-                    elif attr.casefold().endswith("SizeBytesTotal".casefold()):
-                        output_files_bytes += output_stats[attr]
-                        if attr.casefold() == "CedarSizeBytesTotal".casefold():
-                            got_cedar_bytes = True
+                (output_files_count, output_files_bytes, osdf_files, osdf_bytes, got_cedar_bytes) = parse_transfer_stats(output_stats)
+                osdf_files_count += osdf_files
+                osdf_bytes_total += osdf_bytes
                 if not got_cedar_bytes:
                     output_files_bytes += output_cedar_bytes
                 output_files_total_count.append(output_files_count)
@@ -534,8 +423,8 @@ class IgwnScheddCpuFilter(BaseFilter):
         for (start_date, current_start_date, activation_duration, setup_duration) in zip(
                 data["JobStartDate"],
                 data["JobCurrentStartDate"],
-                data["activationduration"],
-                data["activationsetupduration"]):
+                data["ActivationDuration"],
+                data["ActivationSetupDuration"]):
             start_date = current_start_date or start_date
             if None in [start_date, activation_duration, setup_duration]:
                 continue
@@ -546,8 +435,8 @@ class IgwnScheddCpuFilter(BaseFilter):
                 setup_durations.append(setup_duration)
 
         # Compute columns
-        row["All CPU Hours"]    = sum(self.clean(total_cpu_time)) / 3600
-        row["Good CPU Hours"]   = sum(self.clean(goodput_cpu_time)) / 3600
+        row["All CPU Hours"]    = job_times["total_cpu_time"] / 3600
+        row["Good CPU Hours"]   = job_times["goodput_cpu_time"] / 3600
         row["Num Uniq Job Ids"] = sum(data['_NumJobs'])
         row["Num Jobs Over Rqst Disk"] = sum([(usage or 0) > (request or 1)
             for (usage, request) in zip(data["DiskUsage"], data["RequestDisk"])])
@@ -556,7 +445,7 @@ class IgwnScheddCpuFilter(BaseFilter):
         row["Num Job Holds"]    = sum(self.clean(data["NumHolds"]))
         row["Num Jobs w/1+ Holds"] = sum([holds > 0 for holds in self.clean(data["NumHolds"])])
         row["Num Jobs w/>1 Exec Att"] = sum([starts > 1 for starts in self.clean(data["NumJobStarts"])])
-        row["Num Short Jobs"]   = sum(self.clean(is_short_job))
+        row["Num Short Jobs"]   = job_times["num_short_jobs"]
         row["Max Rqst Mem MB"]  = max(self.clean(data['RequestMemory'], allow_empty_list=False))
         row["Med Used Mem MB"]  = stats.median(self.clean(data["MemoryUsage"], allow_empty_list=False))
         row["Max Used Mem MB"]  = max(self.clean(data["MemoryUsage"], allow_empty_list=False))
@@ -597,7 +486,7 @@ class IgwnScheddCpuFilter(BaseFilter):
         else:
             row["Exec Atts / Shadw Start"] = 0
         if sum(data["_NumBadJobStarts"]) > 0:
-            row["CPU Hours / Bad Exec Att"] = (sum(self.clean(badput_cpu_time)) / 3600) / sum(data["_NumBadJobStarts"])
+            row["CPU Hours / Bad Exec Att"] = (job_times["badput_cpu_time"] / 3600) / sum(data["_NumBadJobStarts"])
         else:
             row["CPU Hours / Bad Exec Att"] = 0
 
@@ -637,12 +526,8 @@ class IgwnScheddCpuFilter(BaseFilter):
                 row["Total Files Xferd"] = row.get("Total Files Xferd", 0) + output_files
 
         if osdf_files_count == 0 or osdf_bytes_total == 0:
-            condor_versions_set = set(data["CondorVersion"])
-            condor_versions_set.discard(None)
-            condor_versions_tuples_list = []
-            for version in condor_versions_set:
-                condor_versions_tuples_list.append(tuple([int(x) for x in version.split()[1].split(".")]))
-            if all(condor_version_tuple < (9, 7, 0) for condor_version_tuple in condor_versions_tuples_list):
+            condor_version = max_condor_version(data["_MaxCondorVersion"])
+            if condor_version is None or condor_version < (9, 7, 0):
                 row["OSDF Files Xferd"] = row["% OSDF Files"] = row["% OSDF Bytes"] = "-"
             else:
                 row["OSDF Files Xferd"] = row["% OSDF Files"] = row["% OSDF Bytes"] = 0                    
@@ -670,22 +555,7 @@ class IgwnScheddCpuFilter(BaseFilter):
             row["Mean Setup Secs"] = sum(setup_durations) / len(setup_durations)
 
         # Compute time percentiles and stats
-        if len(long_times_sorted) > 0:
-            row["Min Hrs"]  = long_times_sorted[ 0] / 3600
-            row["25% Hrs"]  = long_times_sorted[  len(long_times_sorted)//4] / 3600
-            row["Med Hrs"]  = stats.median(long_times_sorted) / 3600
-            row["75% Hrs"]  = long_times_sorted[3*len(long_times_sorted)//4] / 3600
-            row["95% Hrs"]  = long_times_sorted[int(0.95*len(long_times_sorted))] / 3600
-            row["Max Hrs"]  = long_times_sorted[-1] / 3600
-            row["Mean Hrs"] = stats.mean(long_times_sorted) / 3600
-        else:
-            for col in [f"{x} Hrs" for x in ["Min", "25%", "Med", "75%", "95%", "Max", "Mean"]]:
-                row[col] = 0
-        if len(long_times_sorted) > 1:
-            row["Std Hrs"] = stats.stdev(long_times_sorted) / 3600
-        else:
-            # There is no variance if there is only one value
-            row["Std Hrs"] = 0
+        row.update(job_times["time_stats"])
 
         # Compute job unit metrics
         row["Med Job Units"] = stats.median(self.clean(data["NumJobUnits"], allow_empty_list=False))
@@ -706,12 +576,8 @@ class IgwnScheddCpuFilter(BaseFilter):
             # else:
             #     row["Most Used Project"] = "UNKNOWN"
 
-            schedds = self.clean(data["ScheddName"])
-            if len(schedds) > 0:
-                row["Most Used Schedd"] = max(set(schedds), key=schedds.count)
-            else:
-                row["Most Used Schedd"] = "UNKNOWN"
+            row["Most Used Schedd"] = self.mode(data["ScheddName"])
         if agg == "Projects":
-            row["Num Users"] = len(set(data["User"]))
+            row["Num Users"] = self.count_distinct(data["User"])
 
         return row
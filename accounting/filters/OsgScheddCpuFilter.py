@@ -6,7 +6,15 @@ import statistics as stats
 from datetime import date
 from pathlib import Path
 from .BaseFilter import BaseFilter
+from accounting.condor_version import track_max_condor_version
+from accounting.distinct import track_distinct
+from accounting.ospool_query import OspoolQueryMixin
+from accounting.array_columns import np
+from accounting.columns import TotalColumns
+from accounting.column_specs import ColumnSpecs, Field, Reducer, Sum, Count, Max, Median, Mean, Stdev, Percentile, Quantiles, Mode, Distinct, DistinctCount, Ratio
+from accounting.job_times import TIME_STATS_QUANTILES
 from accounting.functions import get_job_units, get_topology_project_data, get_topology_resource_data, get_institution_database
+from accounting.transfer_stats import parse_transfer_stats
 
 
 DEFAULT_COLUMNS = {
@@ -98,16 +106,297 @@ DEFAULT_FILTER_ATTRS = [
     "SingularityImage",
     "ActivationDuration",
     "ActivationSetupDuration",
-    "CondorVersion",
 ]
 
 
+def cpu_time(time, cpus):
+    # Assume at least 1 CPU even if 0 CPUs were stored in Elasticsearch
+    if None in [time, cpus]:
+        return None
+    return time * max(cpus, 1)
+
+
+def cpu_time_array(time, cpus):
+    return time * np.maximum(cpus, 1)
+
+
+def is_short_job(goodput_time, record_date, start_date):
+    # Short jobs are jobs that ran for < 1 minute
+    if (goodput_time is not None) and (goodput_time > 0):
+        return goodput_time < 60
+    elif None in (record_date, start_date):
+        return None
+    return (record_date - start_date) < 60
+
+
+def is_short_job_array(goodput_time, record_date, start_date):
+    # NaN (None) goodput times fail goodput_time > 0
+    return np.where(
+        goodput_time > 0,
+        goodput_time < 60,
+        np.where(np.isnan(record_date) | np.isnan(start_date), np.nan, (record_date - start_date) < 60),
+    )
+
+
+def long_job_time(is_short, goodput_time, job_status):
+    # "Long" (i.e. "normal") jobs ran >= 1 minute,
+    # only these (minus removed jobs) go into the time percentiles
+    if (is_short is False) and (job_status != 3):
+        return goodput_time
+    return None
+
+
+def long_job_time_array(is_short, goodput_time, job_status):
+    return np.where((is_short == 0) & (job_status != 3), goodput_time, np.nan)
+
+
+def has_activation_metrics(start_date, current_start_date, activation_duration, setup_duration):
+    # Activation metrics added in 9.4.1
+    # Added to the OSG Connect access points at 1640100600
+    act_cutoff_date = 1_640_100_600  # 2021-12-21 09:30:00
+    start_date = current_start_date or start_date
+    if None in [start_date, activation_duration, setup_duration]:
+        return False
+    return ((start_date > act_cutoff_date) and
+        (activation_duration < (act_cutoff_date - 24*3600) and
+        (setup_duration < (act_cutoff_date - 24*3600))))
+
+
+def has_activation_metrics_array(start_date, current_start_date, activation_duration, setup_duration):
+    # Comparisons with NaN (None) are False
+    act_cutoff_date = 1_640_100_600  # 2021-12-21 09:30:00
+    start_date = np.where(np.isnan(current_start_date) | (current_start_date == 0), start_date, current_start_date)
+    return ((start_date > act_cutoff_date) &
+        (activation_duration < (act_cutoff_date - 24*3600)) &
+        (setup_duration < (act_cutoff_date - 24*3600)))
+
+
+class TransferColumns(Reducer):
+    # File transfer and OSDF columns (finish() reads the
+    # "_Max Condor Version" metric, metrics finish before reducers),
+    # from running totals so that states can be merged
+    attrs = ("JobStatus", "NumJobStarts", "TransferInputStats", "BytesRecvd", "TransferOutputStats", "BytesSent")
+    mergeable = True
+
+    def start(self):
+        return {
+            "input_files_total_count": 0,
+            "input_files_total_bytes": 0,
+            "input_files_total_job_starts": 0,
+            "input_files_any_job_starts": False,
+            "output_files_total_count": 0,
+            "output_files_total_bytes": 0,
+            "output_files_total_job_stops": 0,
+            "osdf_files_count": 0,
+            "osdf_bytes_total": 0,
+        }
+
+    def update(self, state, job_status, job_starts, input_stats, input_cedar_bytes, output_stats, output_cedar_bytes):
+        if input_stats is not None:
+            (input_files_count, input_files_bytes, osdf_files, osdf_bytes, got_cedar_bytes) = parse_transfer_stats(input_stats)
+            state["osdf_files_count"] += osdf_files
+            state["osdf_bytes_total"] += osdf_bytes
+            if not got_cedar_bytes:
+                input_files_bytes += input_cedar_bytes
+            state["input_files_total_count"] += input_files_count
+            state["input_files_total_bytes"] += input_files_bytes
+            if job_starts is not None:
+                state["input_files_total_job_starts"] += job_starts
+            if job_starts:
+                state["input_files_any_job_starts"] = True
+
+        if output_stats is not None:
+            (output_files_count, output_files_bytes, osdf_files, osdf_bytes, got_cedar_bytes) = parse_transfer_stats(output_stats)
+            state["osdf_files_count"] += osdf_files
+            state["osdf_bytes_total"] += osdf_bytes
+            if not got_cedar_bytes:
+                output_files_bytes += output_cedar_bytes
+            state["output_files_total_count"] += output_files_count
+            state["output_files_total_bytes"] += output_files_bytes
+            state["output_files_total_job_stops"] += 1
+
+    def merge(self, state, other):
+        for (key, value) in other.items():
+            if key.endswith("_any_job_starts"):
+                state[key] = state[key] or value
+            else:
+                state[key] += value
+        return state
+
+    def finish(self, state, row):
+        osdf_files_count = state["osdf_files_count"]
+        osdf_bytes_total = state["osdf_bytes_total"]
+
+        total_files = 0
+        total_bytes = 0
+        if state["input_files_any_job_starts"]:
+            exec_atts = state["input_files_total_job_starts"]
+            input_files = state["input_files_total_count"]
+            input_mb = state["input_files_total_bytes"] / 1e6
+
+            total_files += input_files
+            total_bytes += input_mb * 1e6
+
+            row["Total Input Files"] = input_files
+            if exec_atts > 0:
+                row["Input Files / Exec Att"] = input_files / exec_atts
+                row["Input MB / Exec Att"] = input_mb / exec_atts
+            if input_files > 0:
+                row["Input MB / File"] = input_mb / input_files
+                row["Total Files Xferd"] = row.get("Total Files Xferd", 0) + input_files
+
+        if state["output_files_total_job_stops"] > 0:
+            exec_ends = state["output_files_total_job_stops"]
+            output_files = state["output_files_total_count"]
+            output_mb = state["output_files_total_bytes"] / 1e6
+
+            total_files += output_files
+            total_bytes += output_mb * 1e6
+
+            row["Total Ouptut Files"] = output_files
+            if exec_ends > 0:
+                row["Output Files / Job"] = output_files / exec_ends
+                row["Output MB / Job"] = output_mb / exec_ends
+            if output_files > 0:
+                row["Output MB / File"] = output_mb / output_files
+                row["Total Files Xferd"] = row.get("Total Files Xferd", 0) + output_files
+
+        if osdf_files_count == 0 or osdf_bytes_total == 0:
+            condor_version = row["_Max Condor Version"]
+            if condor_version is None or condor_version < (9, 7, 0):
+                row["OSDF Files Xferd"] = row["% OSDF Files"] = row["% OSDF Bytes"] = "-"
+            else:
+                row["OSDF Files Xferd"] = row["% OSDF Files"] = row["% OSDF Bytes"] = 0
+        else:
+            row["OSDF Files Xferd"] = osdf_files_count or ""
+            if osdf_files_count > 0 and osdf_bytes_total > 0 and total_files > 0 and total_bytes > 0:
+                row["% OSDF Files"] = 100 * osdf_files_count / total_files
+                row["% OSDF Bytes"] = 100 * osdf_bytes_total / total_bytes
+            else:
+                row["% OSDF Files"] = row["% OSDF Bytes"] = ""
+
+        # Insert missing value if any missing
+        for key in ["Total Files Xferd", "Total Input Files", "Total Output Files",
+                    "Input Files / Exec Att", "Output Files / Job",
+                    "Input MB / Exec Att", "Output MB / Job",
+                    "Input MB / File", "Output MB / File"]:
+            row[key] = row.get(key, -999)
+
+
+# How to compute DEFAULT_COLUMNS (plus a few helper columns)
+DEFAULT_COLUMN_SPECS = [
+    # Derived job fields
+    Field("_TotalCpuTime", cpu_time, "RemoteWallClockTime", "RequestCpus", array_func=cpu_time_array),
+    Field("_GoodputCpuTime", cpu_time, "CommittedTime", "RequestCpus", array_func=cpu_time_array),
+    Field("_BadputCpuTime", cpu_time, "_BadWallClockTime", "RequestCpus", array_func=cpu_time_array),
+    Field("_IsShortJob", is_short_job, "CommittedTime", "RecordTime", "JobCurrentStartDate", array_func=is_short_job_array),
+    Field("_LongJobTime", long_job_time, "_IsShortJob", "CommittedTime", "JobStatus", array_func=long_job_time_array),
+    Field("_IsRemoved", lambda job_status: job_status == 3, "JobStatus",
+        array_func=lambda job_status: job_status == 3),
+    Field("_HasHolds", lambda holds: holds is not None and holds > 0, "NumHolds",
+        array_func=lambda holds: holds > 0),
+    Field("_HasMultipleStarts", lambda starts: starts is not None and starts > 1, "NumJobStarts",
+        array_func=lambda starts: starts > 1),
+    Field("_IsOverRqstDisk", lambda usage, request: (usage or 0) > (request or 1), "DiskUsage", "RequestDisk",
+        array_func=lambda usage, request: np.nan_to_num(usage) > np.where(np.isnan(request) | (request == 0), 1, request)),
+    Field("_HasActivationMetrics", has_activation_metrics, "JobStartDate", "JobCurrentStartDate", "ActivationDuration", "ActivationSetupDuration",
+        array_func=has_activation_metrics_array),
+    Field("_JobUnitHours", lambda job_units, wallclocktime: None if job_units is None else job_units*wallclocktime/3600, "NumJobUnits", "RemoteWallClockTime",
+        array_func=lambda job_units, wallclocktime: job_units*wallclocktime/3600),
+
+    # Counts and totals
+    Sum("All CPU Hours", "_TotalCpuTime", divide=3600),
+    Sum("Good CPU Hours", "_GoodputCpuTime", divide=3600),
+    Sum("_Bad CPU Hours", "_BadputCpuTime", divide=3600),
+    Sum("Num Uniq Job Ids", "_NumJobs"),
+    Sum("Num DAG Node Jobs", "_NumDAGNodes"),
+    Count("Num Rm'd Jobs", where="_IsRemoved"),
+    Sum("Num Job Holds", "NumHolds"),
+    Count("Num Jobs w/1+ Holds", where="_HasHolds"),
+    Count("Num Jobs Over Rqst Disk", where="_IsOverRqstDisk"),
+    Count("Num Jobs w/>1 Exec Att", where="_HasMultipleStarts"),
+    Count("Num Short Jobs", where="_IsShortJob"),
+    Max("Max Rqst Mem MB", "RequestMemory"),
+    Median("Med Used Mem MB", "MemoryUsage"),
+    Max("Max Used Mem MB", "MemoryUsage"),
+    Max("Max Rqst Disk GB", "RequestDisk", divide=1000*1000),
+    Max("Max Used Disk GB", "DiskUsage", divide=1000*1000),
+    Max("Max Rqst Cpus", "RequestCpus"),
+    Sum("Num Exec Atts", "NumJobStarts"),
+    Sum("Num Shadw Starts", "NumShadowStarts"),
+    Sum("Num Ckpt Able Jobs", "_NumCkptJobs"),
+    Count("Num S'ty Jobs", "SingularityImage"),
+    Sum("_Num Bad Exec Atts", "_NumBadJobStarts"),
+
+    # Derivative columns
+    Ratio("% Good CPU Hours", "Good CPU Hours", "All CPU Hours", scale=100),
+    Ratio("Shadw Starts / Job Id", "Num Shadw Starts", "Num Uniq Job Ids"),
+    Ratio("Holds / Job Id", "Num Job Holds", "Num Uniq Job Ids"),
+    Ratio("% Rm'd Jobs", "Num Rm'd Jobs", "Num Uniq Job Ids", scale=100),
+    Ratio("% Short Jobs", "Num Short Jobs", "Num Uniq Job Ids", scale=100),
+    Ratio("% Jobs w/>1 Exec Att", "Num Jobs w/>1 Exec Att", "Num Uniq Job Ids", scale=100),
+    Ratio("% Jobs w/1+ Holds", "Num Jobs w/1+ Holds", "Num Uniq Job Ids", scale=100),
+    Ratio("% Jobs Over Rqst Disk", "Num Jobs Over Rqst Disk", "Num Uniq Job Ids", scale=100),
+    Ratio("% Ckpt Able", "Num Ckpt Able Jobs", "Num Uniq Job Ids", scale=100),
+    Ratio("% Jobs using S'ty", "Num S'ty Jobs", "Num Uniq Job Ids", scale=100),
+    Ratio("Exec Atts / Shadw Start", "Num Exec Atts", "Num Shadw Starts"),
+    Ratio("CPU Hours / Bad Exec Att", "_Bad CPU Hours", "_Num Bad Exec Atts"),
+
+    # File transfer stats
+    Max("_Max Condor Version", "_MaxCondorVersion", fill=None, min_values=1),
+    TransferColumns(),
+
+    # Activation time stats
+    Mean("Mean Actv Hrs", "ActivationDuration", where="_HasActivationMetrics", divide=3600),
+    Mean("Mean Setup Secs", "ActivationSetupDuration", where="_HasActivationMetrics"),
+
+    # Job unit metrics
+    Median("Med Job Units", "NumJobUnits"),
+    Max("Max Job Units", "NumJobUnits"),
+    Sum("Job Unit Hours", "_JobUnitHours"),
+]
+
+# Time percentiles and stats, from the sorted long job times
+TIME_STATS_COLUMN_SPECS = [
+    Percentile("Min Hrs", "_LongJobTime", q=0, divide=3600),
+    Percentile("25% Hrs", "_LongJobTime", q=0.25, divide=3600),
+    Median("Med Hrs", "_LongJobTime", divide=3600, fill=None, empty=0, min_values=1),
+    Percentile("75% Hrs", "_LongJobTime", q=0.75, divide=3600),
+    Percentile("95% Hrs", "_LongJobTime", q=0.95, divide=3600),
+    Percentile("Max Hrs", "_LongJobTime", q=1, divide=3600),
+    Mean("Mean Hrs", "_LongJobTime", reduce=stats.mean, divide=3600, empty=0),
+    Stdev("Std Hrs", "_LongJobTime", divide=3600),
+]
+
+AGG_COLUMN_SPECS = {
+    # Mode for Project and Schedd columns in the Users table
+    "Users": [
+        Mode("Most Used Project", "ProjectName"),
+        Mode("Most Used Schedd", "ScheddName"),
+    ],
+    "Projects": [
+        Distinct("Num Users", "User"),
+        Distinct("Num Site Instns", "_Institutions"),
+        Distinct("Num Sites", "_Sites"),
+    ],
+}
+
+# Distinct job id and user counts, replacing the columns of
+# the same names with --distinct_counts
+DISTINCT_COUNT_SPECS = {
+    "Num Uniq Job Ids": DistinctCount("Num Uniq Job Ids", "_JobIds"),
+    "Num Users": DistinctCount("Num Users", "_Users"),
+}
+
+
 INSTITUTION_DB = get_institution_database()
 RESOURCE_DATA = get_topology_resource_data()
 
 
-class OsgScheddCpuFilter(BaseFilter):
+class OsgScheddCpuFilter(OspoolQueryMixin, BaseFilter):
     name = "OSG schedd job history"
+    use_job_records = True
+    categorical_attrs = frozenset({"ProjectName", "ScheddName", "User", "_Institutions", "_Sites"})
 
     def __init__(self, **kwargs):
         self.collector_hosts = {"cm-1.ospool.osg-htc.org", "cm-2.ospool.osg-htc.org", "flock.opensciencegrid.org"}
@@ -119,6 +408,8 @@ class OsgScheddCpuFilter(BaseFilter):
             except IOError:
                 pass
         self.schedd_collector_host_map_checked = set(self.schedd_collector_host_map)
+        self.column_specs = {}
+        self.total_summaries = {}
         # Recheck and update the collector map every Monday during the daily report
         if kwargs.get("report_period") == "daily" and date.today().weekday() == 0:
             self.schedd_collector_host_map_checked = set()
@@ -127,6 +418,12 @@ class OsgScheddCpuFilter(BaseFilter):
         self.topology_project_map = get_topology_project_data()
 
 
+    def get_query(self, index, start_ts, end_ts, **kwargs):
+        # Returns dict matching Elasticsearch.search() kwargs
+        # (Dict has same structure as the REST API query language)
+        query = super().get_query(index, start_ts, end_ts, **kwargs)
+        return self.add_ospool_query(query)
+
     def schedd_collector_host(self, schedd):
         # Query Schedd ad in Collector for its CollectorHost,
         # unless result previously cached or it's Monday
@@ -196,61 +493,71 @@ class OsgScheddCpuFilter(BaseFilter):
                 remote_pool = self.schedd_collector_host(schedd)
         return bool(remote_pool & self.collector_hosts)
 
+    def get_job_record(self, i):
+        # Derive the values shared by all of the filter methods once per job ad
+        job = super().get_job_record(i)
+
+        # Filter methods skip jobs that did not run in the OS pool
+        job.is_ospool_job = self.is_ospool_job(i)
+        if not job.is_ospool_job:
+            return job
+
+        # Compute job units
+        if i.get("RemoteWallClockTime", 0) > 0:
+            job.job_units = get_job_units(
+                cpus=i.get("RequestCpus", 1),
+                memory_gb=i.get("RequestMemory", 1024)/1024,
+                disk_gb=i.get("RequestDisk", 1024**2)/1024**2,
+            )
+
+        # Get the site and institution this job ran at
+        job.resource = i.get("MachineAttrGLIDEIN_ResourceName0", i.get("MATCH_EXP_JOBGLIDEIN_ResourceName"))
+        if (job.resource is None) or (not job.resource):
+            pass
+        elif "MachineAttrOSG_INSTITUTION_ID0" in i:
+            job.institution_id = (i.get("MachineAttrOSG_INSTITUTION_ID0") or "").split("_")[-1]
+            job.institution = INSTITUTION_DB.get(job.institution_id, {}).get("name")
+        else:
+            job.institution = RESOURCE_DATA.get(job.resource.lower(), {}).get("institution")
+
+        return job
+
     def schedd_filter(self, data, doc):
 
         # Get input dict
         i = doc["_source"]
+        job = doc["_job"]
 
         # Get output dict for this schedd
         schedd = i.get("ScheddName", "UNKNOWN") or "UNKNOWN"
         o = data["Schedds"][schedd]
 
         # Filter out jobs that did not run in the OS pool
-        if not self.is_ospool_job(i):
+        if not job.is_ospool_job:
             return
 
         # Get list of attrs
         filter_attrs = DEFAULT_FILTER_ATTRS.copy()
 
         # Count number of DAGNode Jobs
-        if i.get("DAGNodeName") is not None:
-            o["_NumDAGNodes"].append(1)
-        else:
-            o["_NumDAGNodes"].append(0)
+        o["_NumDAGNodes"].append(job.num_dag_nodes)
 
         # Count number of history ads (i.e. number of unique job ids)
         o["_NumJobs"].append(1)
+        self.track_distinct_counts(o, i)
 
         # Count number of checkpointable jobs
-        if  (
-                i.get("SuccessCheckpointExitBySignal", False) or
-                i.get("SuccessCheckpointExitCode") is not None
-            ):
-            o["_NumCkptJobs"].append(1)
-        else:
-            o["_NumCkptJobs"].append(0)
+        o["_NumCkptJobs"].append(job.num_ckpt_jobs)
 
         # Compute badput fields
-        if (
-                i.get("NumJobStarts", 0) > 1 and
-                i.get("RemoteWallClockTime", 0) > 0 and
-                i.get("RemoteWallClockTime") != i.get("CommittedTime")
-            ):
-            o["_BadWallClockTime"].append(i["RemoteWallClockTime"] - i.get("CommittedTime", 0))
-            o["_NumBadJobStarts"].append(i["NumJobStarts"] - 1)
-        else:
-            o["_BadWallClockTime"].append(0)
-            o["_NumBadJobStarts"].append(0)
+        o["_BadWallClockTime"].append(job.bad_wall_clock_time)
+        o["_NumBadJobStarts"].append(job.num_bad_job_starts)
 
         # Compute job units
-        if i.get("RemoteWallClockTime", 0) > 0:
-            o["NumJobUnits"].append(get_job_units(
-                cpus=i.get("RequestCpus", 1),
-                memory_gb=i.get("RequestMemory", 1024)/1024,
-                disk_gb=i.get("RequestDisk", 1024**2)/1024**2,
-            ))
-        else:
-            o["NumJobUnits"].append(None)
+        o["NumJobUnits"].append(job.job_units)
+
+        # Keep the highest CondorVersion instead of every job's version string
+        track_max_condor_version(o["_MaxCondorVersion"], i.get("CondorVersion"))
 
         # Add attr values to the output dict, use None if missing
         for attr in filter_attrs:
@@ -260,13 +567,14 @@ class OsgScheddCpuFilter(BaseFilter):
 
         # Get input dict
         i = doc["_source"]
+        job = doc["_job"]
 
         # Get output dict for this user
         user = i.get("User", "UNKNOWN") or "UNKNOWN"
         o = data["Users"][user]
 
         # Filter out jobs that did not run in the OS pool
-        if not self.is_ospool_job(i):
+        if not job.is_ospool_job:
             return
 
         # Add custom attrs to the list of attrs
@@ -274,50 +582,30 @@ class OsgScheddCpuFilter(BaseFilter):
         filter_attrs = filter_attrs + ["ScheddName", "ProjectName"]
 
         # Count number of DAGNode Jobs
-        if i.get("DAGNodeName") is not None:
-            o["_NumDAGNodes"].append(1)
-        else:
-            o["_NumDAGNodes"].append(0)
+        o["_NumDAGNodes"].append(job.num_dag_nodes)
 
         # Count number of history ads (i.e. number of unique job ids)
         o["_NumJobs"].append(1)
+        self.track_distinct_counts(o, i)
 
         # Count number of checkpointable jobs
-        if  (
-                i.get("SuccessCheckpointExitBySignal", False) or
-                i.get("SuccessCheckpointExitCode") is not None
-            ):
-            o["_NumCkptJobs"].append(1)
-        else:
-            o["_NumCkptJobs"].append(0)
+        o["_NumCkptJobs"].append(job.num_ckpt_jobs)
 
         # Compute badput fields
-        if (
-                i.get("NumJobStarts", 0) > 1 and
-                i.get("RemoteWallClockTime", 0) > 0 and
-                i.get("RemoteWallClockTime") != i.get("CommittedTime")
-            ):
-            o["_BadWallClockTime"].append(i["RemoteWallClockTime"] - i.get("CommittedTime", 0))
-            o["_NumBadJobStarts"].append(i["NumJobStarts"] - 1)
-        else:
-            o["_BadWallClockTime"].append(0)
-            o["_NumBadJobStarts"].append(0)
+        o["_BadWallClockTime"].append(job.bad_wall_clock_time)
+        o["_NumBadJobStarts"].append(job.num_bad_job_starts)
 
         # Compute job units
-        if i.get("RemoteWallClockTime", 0) > 0:
-            o["NumJobUnits"].append(get_job_units(
-                cpus=i.get("RequestCpus", 1),
-                memory_gb=i.get("RequestMemory", 1024)/1024,
-                disk_gb=i.get("RequestDisk", 1024**2)/1024**2,
-            ))
-        else:
-            o["NumJobUnits"].append(None)
+        o["NumJobUnits"].append(job.job_units)
+
+        # Keep the highest CondorVersion instead of every job's version string
+        track_max_condor_version(o["_MaxCondorVersion"], i.get("CondorVersion"))
 
         # Add attr values to the output dict, use None if missing
         for attr in filter_attrs:
             # Use UNKNOWN for missing or blank ProjectName and ScheddName
             if attr in {"ScheddName", "ProjectName"}:
-                o[attr].append(i.get(attr, i.get(attr.lower(), "UNKNOWN")) or "UNKNOWN")
+                o[attr].append(i.get(attr, "UNKNOWN") or "UNKNOWN")
             else:
                 o[attr].append(i.get(attr, None))
 
@@ -325,13 +613,14 @@ class OsgScheddCpuFilter(BaseFilter):
 
         # Get input dict
         i = doc["_source"]
+        job = doc["_job"]
 
         # Get output dict for this project
-        project = i.get("ProjectName", i.get("projectname", "UNKNOWN")) or "UNKNOWN"
+        project = i.get("ProjectName", "UNKNOWN") or "UNKNOWN"
         o = data["Projects"][project]
 
         # Filter out jobs that did not run in the OS pool
-        if not self.is_ospool_job(i):
+        if not job.is_ospool_job:
             return
 
         # Add custom attrs to the list of attrs
@@ -339,56 +628,31 @@ class OsgScheddCpuFilter(BaseFilter):
         filter_attrs = filter_attrs + ["User"]
 
         # Get list of sites and institutions this user has run at
-        resource = i.get("MachineAttrGLIDEIN_ResourceName0", i.get("MATCH_EXP_JOBGLIDEIN_ResourceName"))
-        if (resource is None) or (not resource):
+        institution = job.institution
+        if institution is None:
             institution = "UNKNOWN"
-        elif "MachineAttrOSG_INSTITUTION_ID0" in i:
-            osg_id_short = (i.get("MachineAttrOSG_INSTITUTION_ID0") or "").split("_")[-1]
-            institution = INSTITUTION_DB.get(osg_id_short, {}).get("name", "UNKNOWN")
-        else:
-            institution = RESOURCE_DATA.get(resource.lower(), {}).get("institution", "UNKNOWN")
         o["_Institutions"].append(institution)
-        o["_Sites"].append(resource)
+        o["_Sites"].append(job.resource)
 
         # Count number of DAGNode Jobs
-        if i.get("DAGNodeName") is not None:
-            o["_NumDAGNodes"].append(1)
-        else:
-            o["_NumDAGNodes"].append(0)
+        o["_NumDAGNodes"].append(job.num_dag_nodes)
 
         # Count number of history ads (i.e. number of unique job ids)
         o["_NumJobs"].append(1)
+        self.track_distinct_counts(o, i, users=True)
 
         # Count number of checkpointable jobs
-        if  (
-                i.get("SuccessCheckpointExitBySignal", False) or
-                i.get("SuccessCheckpointExitCode") is not None
-            ):
-            o["_NumCkptJobs"].append(1)
-        else:
-            o["_NumCkptJobs"].append(0)
+        o["_NumCkptJobs"].append(job.num_ckpt_jobs)
 
         # Compute job units
-        if i.get("RemoteWallClockTime", 0) > 0:
-            o["NumJobUnits"].append(get_job_units(
-                cpus=i.get("RequestCpus", 1),
-                memory_gb=i.get("RequestMemory", 1024)/1024,
-                disk_gb=i.get("RequestDisk", 1024**2)/1024**2,
-            ))
-        else:
-            o["NumJobUnits"].append(None)
+        o["NumJobUnits"].append(job.job_units)
 
         # Compute badput fields
-        if (
-                i.get("NumJobStarts", 0) > 1 and
-                i.get("RemoteWallClockTime", 0) > 0 and
-                i.get("RemoteWallClockTime") != i.get("CommittedTime")
-            ):
-            o["_BadWallClockTime"].append(i["RemoteWallClockTime"] - i.get("CommittedTime", 0))
-            o["_NumBadJobStarts"].append(i["NumJobStarts"] - 1)
-        else:
-            o["_BadWallClockTime"].append(0)
-            o["_NumBadJobStarts"].append(0)
+        o["_BadWallClockTime"].append(job.bad_wall_clock_time)
+        o["_NumBadJobStarts"].append(job.num_bad_job_starts)
+
+        # Keep the highest CondorVersion instead of every job's version string
+        track_max_condor_version(o["_MaxCondorVersion"], i.get("CondorVersion"))
 
         # Add attr values to the output dict, use None if missing
         for attr in filter_attrs:
@@ -399,9 +663,10 @@ class OsgScheddCpuFilter(BaseFilter):
 
         # Get input dict
         i = doc["_source"]
+        job = doc["_job"]
 
         # Filter out jobs that did not run in the OS pool
-        if not self.is_ospool_job(i):
+        if not job.is_ospool_job:
             return
 
         # Filter out jobs that were removed
@@ -409,44 +674,63 @@ class OsgScheddCpuFilter(BaseFilter):
             return
 
         # Get output dict for this institution
-        resource = i.get("MachineAttrGLIDEIN_ResourceName0", i.get("MATCH_EXP_JOBGLIDEIN_ResourceName"))
-        if (resource is None) or (not resource):
+        if (job.resource is None) or (not job.resource):
             institution = "Unknown (resource name missing)"
-        elif "MachineAttrOSG_INSTITUTION_ID0" in i:
-            osg_id_short = (i.get("MachineAttrOSG_INSTITUTION_ID0") or "").split("_")[-1]
-            institution = INSTITUTION_DB.get(osg_id_short, {}).get("name", f"Unmapped PRP resource: {osg_id_short}")
+        elif job.institution is not None:
+            institution = job.institution
+        elif job.institution_id is not None:
+            institution = f"Unmapped PRP resource: {job.institution_id}"
         else:
-            institution = RESOURCE_DATA.get(resource.lower(), {}).get("institution", f"Unmapped resource: {resource}")
+            institution = f"Unmapped resource: {job.resource}"
         o = data["Institution"][institution]
-        o["_Sites"].append(resource)
+        o["_Sites"].append(job.resource)
 
         # Add custom attrs to the list of attrs
         filter_attrs = DEFAULT_FILTER_ATTRS.copy()
         filter_attrs = filter_attrs + ["User"]
 
         # Count number of DAGNode Jobs
-        if i.get("DAGNodeName") is not None:
-            o["_NumDAGNodes"].append(1)
-        else:
-            o["_NumDAGNodes"].append(0)
+        o["_NumDAGNodes"].append(job.num_dag_nodes)
 
         # Count number of history ads (i.e. number of unique job ids)
         o["_NumJobs"].append(1)
+        self.track_distinct_counts(o, i, users=True)
 
         # Compute job units
-        if i.get("RemoteWallClockTime", 0) > 0:
-            o["NumJobUnits"].append(get_job_units(
-                cpus=i.get("RequestCpus", 1),
-                memory_gb=i.get("RequestMemory", 1024)/1024,
-                disk_gb=i.get("RequestDisk", 1024**2)/1024**2,
-            ))
-        else:
-            o["NumJobUnits"].append(None)
+        o["NumJobUnits"].append(job.job_units)
 
         # Add attr values to the output dict, use None if missing
         for attr in filter_attrs:
             o[attr].append(i.get(attr, None))
 
+    def track_distinct_counts(self, o, i, users=False):
+        # Keeps distinct counts of the job ids (and users) with --distinct_counts,
+        # so that job ads seen more than once are counted once
+        if self.distinct_counts is None:
+            return
+        track_distinct(o["_JobIds"], i.get("GlobalJobId"), self.make_distinct_count)
+        if users:
+            track_distinct(o["_Users"], i.get("User"), self.make_distinct_count)
+
+    def get_source_attrs(self):
+        # Job ad attributes read by the filter methods
+        source_attrs = DEFAULT_FILTER_ATTRS + [
+            "CondorVersion",
+            "DAGNodeName",
+            "LastRemotePool",
+            "MachineAttrGLIDEIN_ResourceName0",
+            "MachineAttrOSG_INSTITUTION_ID0",
+            "MATCH_EXP_JOBGLIDEIN_ResourceName",
+            "ProjectName",
+            "ScheddName",
+            "SuccessCheckpointExitBySignal",
+            "SuccessCheckpointExitCode",
+            "User",
+        ]
+        if self.distinct_counts is not None:
+            source_attrs.append("GlobalJobId")
+        return source_attrs
+
     def get_filters(self):
         # Add all filter methods to a list
         filters = [
@@ -476,6 +760,7 @@ class OsgScheddCpuFilter(BaseFilter):
         return columns
 
     def merge_filtered_data(self, data, agg):
+        self.total_summaries.pop(agg, None)
         rows = super().merge_filtered_data(data, agg)
         if agg == "Institution":
             columns_sorted = list(rows[0])
@@ -549,6 +834,8 @@ class OsgScheddCpuFilter(BaseFilter):
         # Compute columns
         row["All CPU Hours"]    = sum(self.clean(goodput_cpu_time)) / 3600
         row["Num Uniq Job Ids"] = sum(data['_NumJobs'])
+        if self.distinct_counts is not None:
+            row["Num Uniq Job Ids"] = DISTINCT_COUNT_SPECS["Num Uniq Job Ids"].finish(data["_JobIds"])
         row["Num Jobs Over Rqst Disk"] = sum([(usage or 0) > (request or 1)
             for (usage, request) in zip(data["DiskUsage"], data["RequestDisk"])])
         row["Num Short Jobs"]   = sum(self.clean(is_short_job))
@@ -558,7 +845,9 @@ class OsgScheddCpuFilter(BaseFilter):
         row["Max Rqst Disk GB"] = max(self.clean(data["RequestDisk"], allow_empty_list=False)) / (1000*1000)
         row["Max Used Disk GB"] = max(self.clean(data["DiskUsage"], allow_empty_list=False)) / (1000*1000)
         row["Max Rqst Cpus"]    = max(self.clean(data["RequestCpus"], allow_empty_list=False))
-        row["Num Users"]        = len(set(data["User"]))
+        row["Num Users"]        = self.count_distinct(data["User"])
+        if self.distinct_counts is not None:
+            row["Num Users"] = DISTINCT_COUNT_SPECS["Num Users"].finish(data["_Users"])
         row["Num S'ty Jobs"]    = len(self.clean(data["SingularityImage"]))
 
         if row["Num Uniq Job Ids"] > 0:
@@ -608,345 +897,43 @@ class OsgScheddCpuFilter(BaseFilter):
             if job_units is not None
         )
 
-        # Compute mode for Project and Schedd columns in the Users table
-        row["Num Users"] = len(set(data["User"]))
-
         # Compute number of unique Sites
-        row["Num Sites"] = len(set(data["_Sites"]))
+        row["Num Sites"] = self.count_distinct(data["_Sites"])
 
         return row
 
+    def get_column_specs(self, agg):
+        # Returns the specs of the columns of an aggregation level,
+        # with the time stats computed from a QuantileSummary if enabled
+        # and the job id and user counts from distinct counts if enabled
+        time_stats_specs = TIME_STATS_COLUMN_SPECS
+        if self.use_quantile_summaries():
+            time_stats_specs = [Quantiles(TIME_STATS_QUANTILES, "_LongJobTime", divide=3600, summary=self.make_quantiles)]
+        specs = DEFAULT_COLUMN_SPECS + time_stats_specs + AGG_COLUMN_SPECS.get(agg, [])
+        if self.distinct_counts is not None:
+            specs = [DISTINCT_COUNT_SPECS.get(getattr(spec, "column", None), spec) for spec in specs]
+        return specs
+
     def compute_custom_columns(self, data, agg, agg_name):
 
         if agg == "Institution":
             row = self.compute_institution_custom_columns(data, agg, agg_name)
             return row
 
-        # Output dictionary
-        row = {}
-
-        # Compute goodput and total CPU hours columns
-        goodput_cpu_time = []
-        badput_cpu_time = []
-        total_cpu_time = []
-        for (goodput_time, badput_time, total_time, cpus) in zip(
-                data["CommittedTime"],
-                data["_BadWallClockTime"],
-                data["RemoteWallClockTime"],
-                data["RequestCpus"]):
-            if cpus is not None:
-                cpus = max(cpus, 1)  # assume at least 1 CPU even if 0 CPUs were stored in Elasticsearch
-            if None in [goodput_time, cpus]:
-                goodput_cpu_time.append(None)
-            else:
-                goodput_cpu_time.append(goodput_time * cpus)
-            if None in [badput_time, cpus]:
-                badput_cpu_time.append(None)
-            else:
-                badput_cpu_time.append(badput_time * cpus)
-            if None in [total_time, cpus]:
-                total_cpu_time.append(None)
-            else:
-                total_cpu_time.append(total_time * cpus)
-
-        # Don't count starts and shadows for jobs that don't/shouldn't have shadows
-        num_exec_attempts = []
-        num_shadow_starts = []
-        for (job_starts, shadow_starts) in zip(
-                data["NumJobStarts"],
-                data["NumShadowStarts"]):
-            num_exec_attempts.append(job_starts)
-            num_shadow_starts.append(shadow_starts)
-
-        # Short jobs are jobs that ran for < 1 minute
-        is_short_job = []
-        for (goodput_time, record_date, start_date) in zip(
-                data["CommittedTime"],
-                data["RecordTime"],
-                data["JobCurrentStartDate"]):
-            if (goodput_time is not None) and (goodput_time > 0):
-                is_short_job.append(goodput_time < 60)
-            elif None in (record_date, start_date):
-                is_short_job.append(None)
-            else:
-                is_short_job.append((record_date - start_date) < 60)
-
-        # "Long" (i.e. "normal") jobs ran >= 1 minute
-        # We only want to use these when computing percentiles,
-        # so filter out short jobs and removed jobs,
-        # and sort them so we can easily grab the percentiles later
-        long_times_sorted = []
-        for (is_short, goodput_time, job_status) in zip(
-                is_short_job,
-                data["CommittedTime"],
-                data["JobStatus"]):
-            if (is_short is False) and (job_status != 3):
-                long_times_sorted.append(goodput_time)
-        long_times_sorted = self.clean(long_times_sorted)
-        long_times_sorted.sort()
-
-        # File transfer stats
-        input_files_total_count = []
-        input_files_total_bytes = []
-        input_files_total_job_starts = []
-        output_files_total_count = []
-        output_files_total_bytes = []
-        output_files_total_job_stops = []
-        osdf_files_count = 0
-        osdf_bytes_total = 0
-        for (
-                job_status,
-                job_starts,
-                input_stats,
-                input_cedar_bytes,
-                output_stats,
-                output_cedar_bytes,
-            ) in zip(
-                data["JobStatus"],
-                data["NumJobStarts"],
-                data["TransferInputStats"],
-                data["BytesRecvd"],
-                data["TransferOutputStats"],
-                data["BytesSent"],
-            ):
-
-            input_files_count = 0
-            input_files_bytes = 0
-            if input_stats is None:
-                input_files_total_count.append(None)
-                input_files_total_job_starts.append(None)
-            else:
-                got_cedar_bytes = False
-                for attr in input_stats:
-                    if attr.casefold() in {"stashfilescounttotal", "osdffilescounttotal"}:
-                        osdf_files_count += input_stats[attr]
-                    if attr.casefold() in {"stashsizebytestotal", "osdfsizebytestotal"}:
-                        osdf_bytes_total += input_stats[attr]
-                    if attr.casefold().endswith("FilesCountTotal".casefold()):
-                        input_files_count += input_stats[attr]
-                    elif attr.casefold().endswith("SizeBytesTotal".casefold()):
-                        input_files_bytes += input_stats[attr]
-                        if attr.casefold() == "CedarSizeBytesTotal".casefold():
-                            got_cedar_bytes = True
-                if not got_cedar_bytes:
-                    input_files_bytes += input_cedar_bytes
-                input_files_total_count.append(input_files_count)
-                input_files_total_bytes.append(input_files_bytes)
-                input_files_total_job_starts.append(job_starts)
-
-            output_files_count = 0
-            output_files_bytes = 0
-            if output_stats is None:
-                output_files_total_count.append(None)
-                output_files_total_job_stops.append(None)
-            else:
-                got_cedar_bytes = False
-                for attr in output_stats:
-                    if attr.casefold() in {"stashfilescounttotal", "osdffilescounttotal"}:
-                        osdf_files_count += output_stats[attr]
-                    if attr.casefold() in {"stashsizebytestotal", "osdfsizebytestotal"}:
-                        osdf_bytes_total += output_stats[attr]
-                    if attr.casefold().endswith("FilesCountTotal".casefold()):
-                        output_files_count += output_stats[attr]
-                    elif attr.casefold().endswith("SizeBytesTotal".casefold()):
-                        output_files_bytes += output_stats[attr]
-                        if attr.casefold() == "CedarSizeBytesTotal".casefold():
-                            got_cedar_bytes = True
-                if not got_cedar_bytes:
-                    output_files_bytes += output_cedar_bytes
-                output_files_total_count.append(output_files_count)
-                output_files_total_bytes.append(output_files_bytes)
-                output_files_total_job_stops.append(1)
-
-        # Activation metrics added in 9.4.1
-        # Added to the OSG Connect access points at 1640100600
-        activation_durations = []
-        setup_durations = []
-        act_cutoff_date = 1_640_100_600  # 2021-12-21 09:30:00
-        for (start_date, current_start_date, activation_duration, setup_duration) in zip(
-                data["JobStartDate"],
-                data["JobCurrentStartDate"],
-                data["ActivationDuration"],
-                data["ActivationSetupDuration"]):
-            start_date = current_start_date or start_date
-            if None in [start_date, activation_duration, setup_duration]:
-                continue
-            if ((start_date > act_cutoff_date) and
-                (activation_duration < (act_cutoff_date - 24*3600) and
-                (setup_duration < (act_cutoff_date - 24*3600)))):
-                activation_durations.append(activation_duration)
-                setup_durations.append(setup_duration)
-
-        # Compute columns
-        row["All CPU Hours"]    = sum(self.clean(total_cpu_time)) / 3600
-        row["Good CPU Hours"]   = sum(self.clean(goodput_cpu_time)) / 3600
-        row["Num Uniq Job Ids"] = sum(data['_NumJobs'])
-        row["Num DAG Node Jobs"] = sum(data['_NumDAGNodes'])
-        row["Num Rm'd Jobs"]    = sum([status == 3 for status in data["JobStatus"]])
-        row["Num Job Holds"]    = sum(self.clean(data["NumHolds"]))
-        row["Num Jobs w/1+ Holds"] = sum([holds > 0 for holds in self.clean(data["NumHolds"])])
-        row["Num Jobs Over Rqst Disk"] = sum([(usage or 0) > (request or 1)
-            for (usage, request) in zip(data["DiskUsage"], data["RequestDisk"])])
-        row["Num Jobs w/>1 Exec Att"] = sum([starts > 1 for starts in self.clean(data["NumJobStarts"])])
-        row["Num Short Jobs"]   = sum(self.clean(is_short_job))
-        row["Max Rqst Mem MB"]  = max(self.clean(data['RequestMemory'], allow_empty_list=False))
-        row["Med Used Mem MB"]  = stats.median(self.clean(data["MemoryUsage"], allow_empty_list=False))
-        row["Max Used Mem MB"]  = max(self.clean(data["MemoryUsage"], allow_empty_list=False))
-        row["Max Rqst Disk GB"] = max(self.clean(data["RequestDisk"], allow_empty_list=False)) / (1000*1000)
-        row["Max Used Disk GB"] = max(self.clean(data["DiskUsage"], allow_empty_list=False)) / (1000*1000)
-        row["Max Rqst Cpus"]    = max(self.clean(data["RequestCpus"], allow_empty_list=False))
-        row["Num Exec Atts"]    = sum(self.clean(num_exec_attempts))
-        row["Num Shadw Starts"] = sum(self.clean(num_shadow_starts))
-        row["Num Ckpt Able Jobs"]  = sum(data["_NumCkptJobs"])
-        row["Num S'ty Jobs"]       = len(self.clean(data["SingularityImage"]))
-
-        # Compute derivative columns
-        if row["All CPU Hours"] > 0:
-            row["% Good CPU Hours"] = 100 * row["Good CPU Hours"] / row["All CPU Hours"]
-        else:
-            row["% Good CPU Hours"] = 0
-        if row["Num Uniq Job Ids"] > 0:
-            row["Shadw Starts / Job Id"] = row["Num Shadw Starts"] / row["Num Uniq Job Ids"]
-            row["Holds / Job Id"] = row["Num Job Holds"] / row["Num Uniq Job Ids"]
-            row["% Rm'd Jobs"] = 100 * row["Num Rm'd Jobs"] / row["Num Uniq Job Ids"]
-            row["% Short Jobs"] = 100 * row["Num Short Jobs"] / row["Num Uniq Job Ids"]
-            row["% Jobs w/>1 Exec Att"] = 100 * row["Num Jobs w/>1 Exec Att"] / row["Num Uniq Job Ids"]
-            row["% Jobs w/1+ Holds"] = 100 * row["Num Jobs w/1+ Holds"] / row["Num Uniq Job Ids"]
-            row["% Jobs Over Rqst Disk"] = 100 * row["Num Jobs Over Rqst Disk"] / row["Num Uniq Job Ids"]
-            row["% Ckpt Able"] = 100 * row["Num Ckpt Able Jobs"] / row["Num Uniq Job Ids"]
-            row["% Jobs using S'ty"] = 100 * row["Num S'ty Jobs"] / row["Num Uniq Job Ids"]
-        else:
-            row["Shadw Starts / Job Id"] = 0
-            row["Holds / Job Id"] = 0
-            row["% Rm'd Jobs"] = 0
-            row["% Short Jobs"] = 0
-            row["% Jobs w/>1 Exec Att"] = 0
-            row["% Jobs w/1+ Holds"] = 0
-            row["% Jobs Over Rqst Disk"] = 0
-            row["% Jobs using S'ty"] = 0
-        if row["Num Shadw Starts"] > 0:
-            row["Exec Atts / Shadw Start"] = row["Num Exec Atts"] / row["Num Shadw Starts"]
-        else:
-            row["Exec Atts / Shadw Start"] = 0
-        if sum(data["_NumBadJobStarts"]) > 0:
-            row["CPU Hours / Bad Exec Att"] = (sum(self.clean(badput_cpu_time)) / 3600) / sum(data["_NumBadJobStarts"])
-        else:
-            row["CPU Hours / Bad Exec Att"] = 0
-
-        # File transfer stats
-        total_files = 0
-        total_bytes = 0
-        if any(input_files_total_job_starts):
-            exec_atts = sum(self.clean(input_files_total_job_starts))
-            input_files = sum(self.clean(input_files_total_count))
-            input_mb = sum(self.clean(input_files_total_bytes)) / 1e6
-
-            total_files += input_files
-            total_bytes += input_mb * 1e6
-
-            row["Total Input Files"] = input_files
-            if exec_atts > 0:
-                row["Input Files / Exec Att"] = input_files / exec_atts
-                row["Input MB / Exec Att"] = input_mb / exec_atts
-            if input_files > 0:
-                row["Input MB / File"] = input_mb / input_files
-                row["Total Files Xferd"] = row.get("Total Files Xferd", 0) + input_files
-
-        if any(output_files_total_job_stops):
-            exec_ends = sum(self.clean(output_files_total_job_stops))
-            output_files = sum(self.clean(output_files_total_count))
-            output_mb = sum(self.clean(output_files_total_bytes)) / 1e6
-
-            total_files += output_files
-            total_bytes += output_mb * 1e6
-
-            row["Total Ouptut Files"] = output_files
-            if exec_ends > 0:
-                row["Output Files / Job"] = output_files / exec_ends
-                row["Output MB / Job"] = output_mb / exec_ends
-            if output_files > 0:
-                row["Output MB / File"] = output_mb / output_files
-                row["Total Files Xferd"] = row.get("Total Files Xferd", 0) + output_files
-
-        if osdf_files_count == 0 or osdf_bytes_total == 0:
-            condor_versions_set = set(data["CondorVersion"])
-            condor_versions_set.discard(None)
-            condor_versions_tuples_list = []
-            for version in condor_versions_set:
-                condor_versions_tuples_list.append(tuple([int(x) for x in version.split()[1].split(".")]))
-            if all(condor_version_tuple < (9, 7, 0) for condor_version_tuple in condor_versions_tuples_list):
-                row["OSDF Files Xferd"] = row["% OSDF Files"] = row["% OSDF Bytes"] = "-"
-            else:
-                row["OSDF Files Xferd"] = row["% OSDF Files"] = row["% OSDF Bytes"] = 0                    
-        else:
-            row["OSDF Files Xferd"] = osdf_files_count or ""
-            if osdf_files_count > 0 and osdf_bytes_total > 0 and total_files > 0 and total_bytes > 0:
-                row["% OSDF Files"] = 100 * osdf_files_count / total_files
-                row["% OSDF Bytes"] = 100 * osdf_bytes_total / total_bytes
-            else:
-                row["% OSDF Files"] = row["% OSDF Bytes"] = ""
-
-        # Insert missing value if any missing
-        for key in ["Total Files Xferd", "Total Input Files", "Total Output Files",
-                    "Input Files / Exec Att", "Output Files / Job",
-                    "Input MB / Exec Att", "Output MB / Job",
-                    "Input MB / File", "Output MB / File"]:
-            row[key] = row.get(key, -999)
-
-        # Compute activation time stats
-        row["Mean Actv Hrs"] = ""
-        row["Mean Setup Secs"] = ""
-        if len(activation_durations) > 0:
-            row["Mean Actv Hrs"] = (sum(activation_durations) / len(activation_durations)) / 3600
-        if len(setup_durations) > 0:
-            row["Mean Setup Secs"] = sum(setup_durations) / len(setup_durations)
-
-        # Compute time percentiles and stats
-        if len(long_times_sorted) > 0:
-            row["Min Hrs"]  = long_times_sorted[ 0] / 3600
-            row["25% Hrs"]  = long_times_sorted[  len(long_times_sorted)//4] / 3600
-            row["Med Hrs"]  = stats.median(long_times_sorted) / 3600
-            row["75% Hrs"]  = long_times_sorted[3*len(long_times_sorted)//4] / 3600
-            row["95% Hrs"]  = long_times_sorted[int(0.95*len(long_times_sorted))] / 3600
-            row["Max Hrs"]  = long_times_sorted[-1] / 3600
-            row["Mean Hrs"] = stats.mean(long_times_sorted) / 3600
-        else:
-            for col in [f"{x} Hrs" for x in ["Min", "25%", "Med", "75%", "95%", "Max", "Mean"]]:
-                row[col] = 0
-        if len(long_times_sorted) > 1:
-            row["Std Hrs"] = stats.stdev(long_times_sorted) / 3600
+        # Compute all of the spec'd columns in one pass over the jobs,
+        # and the TOTAL (computed last) from the merged summaries
+        # of the other rows, reading only its unmergeable columns
+        if agg not in self.column_specs:
+            self.column_specs[agg] = ColumnSpecs(self.get_column_specs(agg))
+        specs = self.column_specs[agg]
+        if isinstance(data, TotalColumns) and agg in self.total_summaries:
+            row = specs.compute_total(self.total_summaries.pop(agg), data, use_arrays=self.use_arrays(data))
         else:
-            # There is no variance if there is only one value
-            row["Std Hrs"] = 0
+            summary = {}
+            row = specs.compute(data, use_arrays=self.use_arrays(data), summary=summary)
+            self.total_summaries[agg] = specs.merge_summaries(self.total_summaries.get(agg, {}), summary)
 
-        # Compute job unit metrics
-        row["Med Job Units"] = stats.median(self.clean(data["NumJobUnits"], allow_empty_list=False))
-        row["Max Job Units"] = max(self.clean(data["NumJobUnits"], allow_empty_list=False))
-        row["Job Unit Hours"] = sum(
-            job_units*wallclocktime/3600 for job_units, wallclocktime in zip(
-                data.get("NumJobUnits", []),
-                data.get("RemoteWallClockTime", []),
-            )
-            if job_units is not None
-        )
-
-        # Compute mode for Project and Schedd columns in the Users table
-        if agg == "Users":
-            projects = self.clean(data["ProjectName"])
-            if len(projects) > 0:
-                row["Most Used Project"] = max(set(projects), key=projects.count)
-            else:
-                row["Most Used Project"] = "UNKNOWN"
-
-            schedds = self.clean(data["ScheddName"])
-            if len(schedds) > 0:
-                row["Most Used Schedd"] = max(set(schedds), key=schedds.count)
-            else:
-                row["Most Used Schedd"] = "UNKNOWN"
         if agg == "Projects":
-            row["Num Users"] = len(set(data["User"]))
-            row["Num Site Instns"] = len(set(data["_Institutions"]))
-            row["Num Sites"] = len(set(data["_Sites"]))
             if agg_name != "TOTAL":
                 project_map = self.topology_project_map.get(agg_name.lower(), self.topology_project_map["UNKNOWN"])
                 row["PI Institution"] = project_map["institution"]
@@ -5,6 +5,7 @@ import pickle
 import statistics as stats
 from pathlib import Path
 from .BaseFilter import BaseFilter
+from accounting.ospool_query import OspoolQueryMixin
 
 
 HOLD_REASONS = [
@@ -125,8 +126,9 @@ DEFAULT_FILTER_ATTRS = [
 for i, reason in enumerate(HOLD_REASONS):
     DEFAULT_COLUMNS[101 + i] = f"% Holds for {reason}"
 
-class OsgScheddCpuHeldFilter(BaseFilter):
+class OsgScheddCpuHeldFilter(OspoolQueryMixin, BaseFilter):
     name = "OSG schedd held job history"
+    categorical_attrs = frozenset({"ProjectName", "ScheddName", "User"})
 
     def __init__(self, **kwargs):
         self.collector_hosts = {"cm-1.ospool.osg-htc.org", "cm-2.ospool.osg-htc.org", "flock.opensciencegrid.org"}
@@ -171,7 +173,7 @@ class OsgScheddCpuHeldFilter(BaseFilter):
                 }
             }
         })
-        return query
+        return self.add_ospool_query(query)
 
     def schedd_collector_host(self, schedd):
         # Query Schedd ad in Collector for its CollectorHost,
@@ -307,7 +309,7 @@ class OsgScheddCpuHeldFilter(BaseFilter):
         for attr in filter_attrs:
             # Use UNKNOWN for missing or blank ProjectName and ScheddName
             if attr in {"ScheddName", "ProjectName"}:
-                o[attr].append(i.get(attr, i.get(attr.lower(), "UNKNOWN")) or "UNKNOWN")
+                o[attr].append(i.get(attr, "UNKNOWN") or "UNKNOWN")
             else:
                 o[attr].append(i.get(attr, None))
 
@@ -317,7 +319,7 @@ class OsgScheddCpuHeldFilter(BaseFilter):
         i = doc["_source"]
 
         # Get output dict for this project
-        project = i.get("ProjectName", i.get("projectname", "UNKNOWN")) or "UNKNOWN"
+        project = i.get("ProjectName", "UNKNOWN") or "UNKNOWN"
         o = data["Projects"][project]
 
         # Filter out jobs that did not run in the OS pool
@@ -353,6 +355,16 @@ class OsgScheddCpuHeldFilter(BaseFilter):
         for attr in filter_attrs:
             o[attr].append(i.get(attr, None))
 
+    def get_source_attrs(self):
+        # Job ad attributes read by the filter methods
+        return DEFAULT_FILTER_ATTRS + [
+            "DAGNodeName",
+            "LastRemotePool",
+            "ProjectName",
+            "ScheddName",
+            "User",
+        ]
+
     def get_filters(self):
         # Add all filter methods to a list
         filters = [
@@ -521,18 +533,9 @@ class OsgScheddCpuHeldFilter(BaseFilter):
 
         # Compute mode for Project and Schedd columns in the Users table
         if agg == "Users":
-            projects = self.clean(data["ProjectName"])
-            if len(projects) > 0:
-                row["Most Used Project"] = max(set(projects), key=projects.count)
-            else:
-                row["Most Used Project"] = "UNKNOWN"
-
-            schedds = self.clean(data["ScheddName"])
-            if len(schedds) > 0:
-                row["Most Used Schedd"] = max(set(schedds), key=schedds.count)
-            else:
-                row["Most Used Schedd"] = "UNKNOWN"
+            row["Most Used Project"] = self.mode(data["ProjectName"])
+            row["Most Used Schedd"] = self.mode(data["ScheddName"])
         if agg == "Projects":
-            row["Num Users"] = len(set(data["User"]))  
+            row["Num Users"] = self.count_distinct(data["User"])  
 
         return row 
@@ -10,9 +10,11 @@ from elasticsearch import Elasticsearch
 import elasticsearch.helpers
 from functools import lru_cache
 from .BaseFilter import BaseFilter
+from accounting.ospool_query import OspoolQueryMixin
 from accounting.functions import get_job_units, get_topology_project_data, get_topology_resource_data, get_institution_database
-
-MAX_INT = 2**62
+from accounting.transfer_stats import parse_transfer_stats
+from accounting.quantiles import DEFAULT_QUANTILE_ACCURACY
+from accounting.job_times import get_time_stats_summary
 
 DEFAULT_COLUMNS = {
     10: "Num Uniq Job Ids",
@@ -37,8 +39,13 @@ DEFAULT_COLUMNS = {
     82: "% Jobs using S'ty",
 
     110: "Min Hrs",
+    120: "25% Hrs",
+    130: "Med Hrs",
+    140: "75% Hrs",
+    145: "95% Hrs",
     150: "Max Hrs",
     160: "Mean Hrs",
+    170: "Std Hrs",
 
     180: "Input Files / Exec Att",
 #    181: "Input MB / Exec Att",
@@ -74,8 +81,10 @@ INSTITUTION_DB = get_institution_database()
 RESOURCE_DATA = get_topology_resource_data()
 
 
-class OsgScheddCpuMonthlyFilter(BaseFilter):
+class OsgScheddCpuMonthlyFilter(OspoolQueryMixin, BaseFilter):
     name = "OSG schedd job history"
+    build_totals = False
+    default_quantile_accuracy = DEFAULT_QUANTILE_ACCURACY
 
     def __init__(self, **kwargs):
         self.collector_hosts = {"cm-1.ospool.osg-htc.org", "cm-2.ospool.osg-htc.org", "flock.opensciencegrid.org"}
@@ -90,6 +99,12 @@ class OsgScheddCpuMonthlyFilter(BaseFilter):
         self.sort_col = "Num Uniq Job Ids"
         self.topology_project_map = get_topology_project_data()
 
+    def get_query(self, index, start_ts, end_ts, **kwargs):
+        # Returns dict matching Elasticsearch.search() kwargs
+        # (Dict has same structure as the REST API query language)
+        query = super().get_query(index, start_ts, end_ts, **kwargs)
+        return self.add_ospool_query(query)
+
     def schedd_collector_host(self, schedd):
         # Query Schedd ad in Collector for its CollectorHost,
         # unless result previously cached
@@ -181,28 +196,10 @@ class OsgScheddCpuMonthlyFilter(BaseFilter):
             output_file_stats = i.get("TransferOutputStats", {})
             got_cedar_input_bytes = False
             got_cedar_output_bytes = False
-            for key, value in input_file_stats.items():
-                if key.casefold() in {"stashfilescounttotal", "osdffilescounttotal"}:
-                        osdf_files += value
-                elif key.casefold() in {"stashsizebytestotal", "osdfsizebytestotal"}:
-                        osdf_bytes += value
-                if key.casefold().endswith("FilesCountTotal".casefold()):
-                    input_files += value
-                elif key.casefold().endswith("SizeBytesTotal".casefold()):
-                    input_bytes += value
-                    if key.casefold() == "CedarSizeBytesTotal".casefold():
-                        got_cedar_input_bytes = True
-            for key, value in output_file_stats.items():
-                if key.casefold() in {"stashfilescounttotal", "osdffilescounttotal"}:
-                        osdf_files += value
-                elif key.casefold() in {"stashsizebytestotal", "osdfsizebytestotal"}:
-                        osdf_bytes += value
-                if key.casefold().endswith("FilesCountTotal".casefold()):
-                    output_files += value
-                elif key.casefold().endswith("SizeBytesTotal".casefold()):
-                    output_bytes += value
-                    if key.casefold() == "CedarSizeBytesTotal".casefold():
-                        got_cedar_output_bytes = True
+            (input_files, input_bytes, input_osdf_files, input_osdf_bytes, got_cedar_input_bytes) = parse_transfer_stats(input_file_stats)
+            (output_files, output_bytes, output_osdf_files, output_osdf_bytes, got_cedar_output_bytes) = parse_transfer_stats(output_file_stats)
+            osdf_files += input_osdf_files + output_osdf_files
+            osdf_bytes += input_osdf_bytes + output_osdf_bytes
             if not (got_cedar_input_bytes or got_cedar_output_bytes):
                 input_bytes += i.get("BytesRecvd", 0)
                 output_bytes += i.get("BytesSent", 0)
@@ -225,7 +222,6 @@ class OsgScheddCpuMonthlyFilter(BaseFilter):
         sum_cols["SingularityJobs"] = int(is_singularity)
         sum_cols["OverDiskJobs"] = int(is_over_disk_request)
 
-        sum_cols["TotalLongJobWallClockTime"] = long_job_wallclock_time
         sum_cols["GoodCpuTime"] = (goodput_time * max(i.get("RequestCpus", 1), 1))
         sum_cols["CpuTime"] = (i.get("RemoteWallClockTime", 0) * max(i.get("RequestCpus", 1), 1))
         sum_cols["BadCpuTime"] = ((i.get("RemoteWallClockTime", 0) - goodput_time) * max(i.get("RequestCpus", 1), 1))
@@ -248,7 +244,6 @@ class OsgScheddCpuMonthlyFilter(BaseFilter):
             sum_cols["OSDFBytes"] = osdf_bytes
 
         max_cols = {}
-        max_cols["MaxLongJobWallClockTime"] = long_job_wallclock_time
         max_cols["MaxRequestMemory"] = i.get("RequestMemory", 0)
         max_cols["MaxMemoryUsage"] = i.get("MemoryUsage", 0)
         max_cols["MaxRequestDisk"] = i.get("RequestDisk", 0)
@@ -256,18 +251,42 @@ class OsgScheddCpuMonthlyFilter(BaseFilter):
         max_cols["MaxRequestCpus"] = i.get("RequestCpus", 1)
         max_cols["MaxJobUnits"] = job_units
 
-        min_cols = {}
-        min_cols["MinLongJobWallClockTime"] = long_job_wallclock_time
-
         for col in sum_cols:
             o[col] = (o.get(col) or 0) + sum_cols[col]
             t[col] = (t.get(col) or 0) + sum_cols[col]
         for col in max_cols:
             o[col] = max([(o.get(col) or 0), max_cols[col]])
             t[col] = max([(t.get(col) or 0), max_cols[col]])
-        for col in min_cols:
-            o[col] = min([(o.get(col) or MAX_INT), min_cols[col]])
-            t[col] = min([(t.get(col) or MAX_INT), min_cols[col]])
+
+        # Summarize the long job times for the time percentiles
+        if is_long:
+            for d in [o, t]:
+                if d.get("LongJobTimes") is None:
+                    d["LongJobTimes"] = self.make_quantiles()
+                d["LongJobTimes"].add(long_job_wallclock_time)
+
+        # Count the distinct job ids with --distinct_counts
+        if self.distinct_counts is not None and i.get("GlobalJobId") is not None:
+            self.add_distinct(o, t, "JobIds", i["GlobalJobId"])
+
+    def add_distinct(self, o, t, col, value):
+        # Adds value to the distinct counts of col in o and t
+        for d in [o, t]:
+            if d.get(col) is None:
+                d[col] = self.make_distinct_count()
+            d[col].add(value)
+
+    def merge_field(self, field, values, partial_values):
+        # Merges the Max columns, the quantile summaries and the distinct counts like reduce_data()
+        # and takes the union of the dict columns
+        if field.startswith("Max"):
+            return max([(values or 0), partial_values])
+        if field == "LongJobTimes" or (field in {"JobIds", "Users"} and self.distinct_counts is not None):
+            return values.merge(partial_values)
+        if field in {"Users", "Institutions", "Sites"}:
+            values.update(partial_values)
+            return values
+        return super().merge_field(field, values, partial_values)
 
     def schedd_filter(self, data, doc):
 
@@ -303,7 +322,7 @@ class OsgScheddCpuMonthlyFilter(BaseFilter):
 
         counter_cols = {}
         counter_cols["ScheddNames"] = i.get("ScheddName", "UNKNOWN") or "UNKNOWN"
-        counter_cols["ProjectNames"] = i.get("ProjectName", i.get("projectname", "UNKNOWN")) or "UNKNOWN"
+        counter_cols["ProjectNames"] = i.get("ProjectName", "UNKNOWN") or "UNKNOWN"
 
         for col in counter_cols:
             if not col in output:
@@ -323,7 +342,7 @@ class OsgScheddCpuMonthlyFilter(BaseFilter):
             return
 
         # Get output dict for this project
-        project = i.get("ProjectName", i.get("projectname", "UNKNOWN")) or "UNKNOWN"
+        project = i.get("ProjectName", "UNKNOWN") or "UNKNOWN"
         output = data["Projects"][project]
         total = data["Projects"]["TOTAL"]
 
@@ -343,6 +362,10 @@ class OsgScheddCpuMonthlyFilter(BaseFilter):
         dict_cols["Institutions"] = institution
         dict_cols["Sites"] = resource
 
+        # Count the distinct users in distinct counts instead with --distinct_counts
+        if self.distinct_counts is not None:
+            self.add_distinct(output, total, "Users", dict_cols.pop("Users"))
+
         for col in dict_cols:
             output[col] = output.get(col) or {}
             output[col][dict_cols[col]] = 1
@@ -380,12 +403,53 @@ class OsgScheddCpuMonthlyFilter(BaseFilter):
         dict_cols["Users"] = i.get("User", "UNKNOWN") or "UNKNOWN"
         dict_cols["Sites"] = resource
 
+        # Count the distinct users in distinct counts instead with --distinct_counts
+        if self.distinct_counts is not None:
+            self.add_distinct(output, total, "Users", dict_cols.pop("Users"))
+
         for col in dict_cols:
             output[col] = output.get(col) or {}
             output[col][dict_cols[col]] = 1
             total[col] = total.get(col) or {}
             total[col][dict_cols[col]] = 1
 
+    def get_source_attrs(self):
+        # Job ad attributes read by the filter methods
+        source_attrs = [
+            "BytesRecvd",
+            "BytesSent",
+            "CommittedTime",
+            "DAGNodeName",
+            "DiskUsage",
+            "JobCurrentStartDate",
+            "JobStatus",
+            "LastRemotePool",
+            "LastRemoteWallClockTime",
+            "MachineAttrGLIDEIN_ResourceName0",
+            "MachineAttrOSG_INSTITUTION_ID0",
+            "MATCH_EXP_JOBGLIDEIN_ResourceName",
+            "MemoryUsage",
+            "NumHolds",
+            "NumJobStarts",
+            "NumShadowStarts",
+            "ProjectName",
+            "RecordTime",
+            "RemoteWallClockTime",
+            "RequestCpus",
+            "RequestDisk",
+            "RequestMemory",
+            "ScheddName",
+            "SingularityImage",
+            "SuccessCheckpointExitBySignal",
+            "SuccessCheckpointExitCode",
+            "TransferInputStats",
+            "TransferOutputStats",
+            "User",
+        ]
+        if self.distinct_counts is not None:
+            source_attrs.append("GlobalJobId")
+        return source_attrs
+
     def get_filters(self):
         # Add all filter methods to a list
         filters = [
@@ -423,6 +487,8 @@ class OsgScheddCpuMonthlyFilter(BaseFilter):
         row["All CPU Hours"]    = data["GoodCpuTime"] / 3600
         row["Job Unit Hours"]    = data["JobUnitTime"] / 3600
         row["Num Uniq Job Ids"] = data["Jobs"]
+        if "JobIds" in data:
+            row["Num Uniq Job Ids"] = len(data["JobIds"])
         row["Num Jobs Over Rqst Disk"] = data["OverDiskJobs"]
         row["Num Short Jobs"]   = data["ShortJobs"]
         row["Max Rqst Mem MB"]  = data["MaxRequestMemory"]
@@ -442,12 +508,8 @@ class OsgScheddCpuMonthlyFilter(BaseFilter):
             row["% Jobs Over Rqst Disk"] = 0
             row["% Jobs using S'ty"] = 0
 
-        if data["LongJobs"] > 0:
-            row["Min Hrs"]  = data["MinLongJobWallClockTime"] / 3600
-            row["Max Hrs"]  = data["MaxLongJobWallClockTime"] / 3600
-            row["Mean Hrs"] = (data["TotalLongJobWallClockTime"] / data["LongJobs"]) / 3600
-        else:
-            row["Min Hrs"] = row["Max Hrs"] = row["Mean Hrs"] = 0
+        # Compute time percentiles and stats from the summary of long job times
+        row.update(get_time_stats_summary(data.get("LongJobTimes")))
 
         row["Num Users"]        = len(data["Users"])
         row["Num Sites"]        = len(data["Sites"])
@@ -468,6 +530,8 @@ class OsgScheddCpuMonthlyFilter(BaseFilter):
         row["Good CPU Hours"]    = data["GoodCpuTime"] / 3600
         row["Job Unit Hours"]    = data["JobUnitTime"] / 3600
         row["Num Uniq Job Ids"]  = data["Jobs"]
+        if "JobIds" in data:
+            row["Num Uniq Job Ids"] = len(data["JobIds"])
         row["Num DAG Node Jobs"] = data["DAGNodeJobs"]
         row["Num Rm'd Jobs"]     = data["RmJobs"]
         row["Num Job Holds"]    = data["NumJobHolds"]
@@ -538,12 +602,8 @@ class OsgScheddCpuMonthlyFilter(BaseFilter):
         else:
             row["CPU Hours / Bad Exec Att"] = 0
 
-        if data["LongJobs"] > 0:
-            row["Min Hrs"]  = data["MinLongJobWallClockTime"] / 3600
-            row["Max Hrs"]  = data["MaxLongJobWallClockTime"] / 3600
-            row["Mean Hrs"] = (data["TotalLongJobWallClockTime"] / data["LongJobs"]) / 3600
-        else:
-            row["Min Hrs"] = row["Max Hrs"] = row["Mean Hrs"] = 0
+        # Compute time percentiles and stats from the summary of long job times
+        row.update(get_time_stats_summary(data.get("LongJobTimes")))
 
         # Compute mode for Project and Schedd columns in the Users table
         if agg == "Users":
@@ -570,9 +630,6 @@ class OsgScheddCpuMonthlyFilter(BaseFilter):
 
         return row
 
-    def scan_and_filter(self, es_index, start_ts, end_ts, **kwargs):
-        return super().scan_and_filter(es_index, start_ts, end_ts, build_totals=False, **kwargs)
-
     def merge_filtered_data(self, data, agg):
         # Takes filtered data and an aggregation level (e.g. Users, Schedds,
         # Projects) and returns a list of tuples, with the first item
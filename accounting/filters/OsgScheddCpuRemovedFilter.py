@@ -5,6 +5,7 @@ import pickle
 import statistics as stats
 from pathlib import Path
 from .BaseFilter import BaseFilter
+from accounting.ospool_query import OspoolQueryMixin
 
 
 DEFAULT_COLUMNS = {
@@ -54,8 +55,9 @@ DEFAULT_FILTER_ATTRS = [
 ]
 
 
-class OsgScheddCpuRemovedFilter(BaseFilter):
+class OsgScheddCpuRemovedFilter(OspoolQueryMixin, BaseFilter):
     name = "OSG schedd removed job history"
+    categorical_attrs = frozenset({"ProjectName", "ScheddName", "User"})
 
     def __init__(self, **kwargs):
         self.collector_hosts = {"cm-1.ospool.osg-htc.org", "cm-2.ospool.osg-htc.org", "flock.opensciencegrid.org"}
@@ -98,7 +100,7 @@ class OsgScheddCpuRemovedFilter(BaseFilter):
                 }
             }
         })
-        return query
+        return self.add_ospool_query(query)
 
     def schedd_collector_host(self, schedd):
         # Query Schedd ad in Collector for its CollectorHost,
@@ -249,7 +251,7 @@ class OsgScheddCpuRemovedFilter(BaseFilter):
         for attr in filter_attrs:
             # Use UNKNOWN for missing or blank ProjectName and ScheddName
             if attr in {"ScheddName", "ProjectName"}:
-                o[attr].append(i.get(attr, i.get(attr.lower(), "UNKNOWN")) or "UNKNOWN")
+                o[attr].append(i.get(attr, "UNKNOWN") or "UNKNOWN")
             else:
                 o[attr].append(i.get(attr, None))
 
@@ -259,7 +261,7 @@ class OsgScheddCpuRemovedFilter(BaseFilter):
         i = doc["_source"]
 
         # Get output dict for this project
-        project = i.get("ProjectName", i.get("projectname", "UNKNOWN")) or "UNKNOWN"
+        project = i.get("ProjectName", "UNKNOWN") or "UNKNOWN"
         o = data["Projects"][project]
 
         # Filter out jobs that were not removed
@@ -303,6 +305,16 @@ class OsgScheddCpuRemovedFilter(BaseFilter):
         for attr in filter_attrs:
             o[attr].append(i.get(attr, None))
 
+    def get_source_attrs(self):
+        # Job ad attributes read by the filter methods
+        return DEFAULT_FILTER_ATTRS + [
+            "DAGNodeName",
+            "LastRemotePool",
+            "ProjectName",
+            "ScheddName",
+            "User",
+        ]
+
     def get_filters(self):
         # Add all filter methods to a list
         filters = [
@@ -430,18 +442,9 @@ class OsgScheddCpuRemovedFilter(BaseFilter):
 
         # Compute mode for Project and Schedd columns in the Users table
         if agg == "Users":
-            projects = self.clean(data["ProjectName"])
-            if len(projects) > 0:
-                row["Most Used Project"] = max(set(projects), key=projects.count)
-            else:
-                row["Most Used Project"] = "UNKNOWN"
-
-            schedds = self.clean(data["ScheddName"])
-            if len(schedds) > 0:
-                row["Most Used Schedd"] = max(set(schedds), key=schedds.count)
-            else:
-                row["Most Used Schedd"] = "UNKNOWN"
+            row["Most Used Project"] = self.mode(data["ProjectName"])
+            row["Most Used Schedd"] = self.mode(data["ScheddName"])
         if agg == "Projects":
-            row["Num Users"] = len(set(data["User"]))
+            row["Num Users"] = self.count_distinct(data["User"])
 
         return row
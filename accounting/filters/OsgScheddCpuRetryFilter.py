@@ -4,6 +4,7 @@ import htcondor
 import pickle
 from pathlib import Path
 from .BaseFilter import BaseFilter
+from accounting.ospool_query import OspoolQueryMixin
 from accounting.pull_hold_reasons import get_hold_reasons
 
 
@@ -24,8 +25,9 @@ DEFAULT_FILTER_ATTRS = [
     "JobStatus",
 ]
 
-class OsgScheddCpuRetryFilter(BaseFilter):
+class OsgScheddCpuRetryFilter(OspoolQueryMixin, BaseFilter):
     name = "OSG schedd retried job history"
+    categorical_attrs = frozenset({"ProjectName", "ScheddName", "User"})
 
     def __init__(self, **kwargs):
         self.collector_hosts = {"cm-1.ospool.osg-htc.org", "cm-2.ospool.osg-htc.org", "flock.opensciencegrid.org"}
@@ -70,7 +72,7 @@ class OsgScheddCpuRetryFilter(BaseFilter):
                 }
             }
         })
-        return query
+        return self.add_ospool_query(query)
 
     def schedd_collector_host(self, schedd):
         # Query Schedd ad in Collector for its CollectorHost,
@@ -169,7 +171,7 @@ class OsgScheddCpuRetryFilter(BaseFilter):
         for attr in filter_attrs:
             # Use UNKNOWN for missing or blank ProjectName and ScheddName
             if attr in {"ScheddName", "ProjectName"}:
-                o[attr].append(i.get(attr, i.get(attr.lower(), "UNKNOWN")) or "UNKNOWN")
+                o[attr].append(i.get(attr, "UNKNOWN") or "UNKNOWN")
             else:
                 o[attr].append(i.get(attr, None))
 
@@ -179,7 +181,7 @@ class OsgScheddCpuRetryFilter(BaseFilter):
         i = doc["_source"]
 
         # Get output dict for this project
-        project = i.get("ProjectName", i.get("projectname", "UNKNOWN")) or "UNKNOWN"
+        project = i.get("ProjectName", "UNKNOWN") or "UNKNOWN"
         o = data["Projects"][project]
 
         # Filter out jobs that did not run in the OS pool
@@ -197,6 +199,22 @@ class OsgScheddCpuRetryFilter(BaseFilter):
         for attr in filter_attrs:
             o[attr].append(i.get(attr, None))
 
+    def get_source_attrs(self):
+        # Job ad attributes read by the filter methods
+        return DEFAULT_FILTER_ATTRS + [
+            "LastRemotePool",
+            "ProjectName",
+            "ScheddName",
+            "User",
+        ]
+
+    def get_docvalue_fields(self):
+        # Doc values fields for the job ad attributes read by the filter methods
+        string_attrs = {"LastRemotePool", "ProjectName", "ScheddName", "User"}
+        fields = {attr: f"{attr}.keyword" if attr in string_attrs else attr for attr in self.get_source_attrs()}
+        fields["NumHoldsByReason"] = "NumHoldsByReason.*"
+        return fields
+
     def get_filters(self):
         # Add all filter methods to a list
         filters = [
@@ -280,18 +298,9 @@ class OsgScheddCpuRetryFilter(BaseFilter):
 
         # Compute mode for Project and Schedd columns in the Users table
         if agg == "Users":
-            projects = self.clean(data["ProjectName"])
-            if len(projects) > 0:
-                row["Most Used Project"] = max(set(projects), key=projects.count)
-            else:
-                row["Most Used Project"] = "UNKNOWN"
-
-            schedds = self.clean(data["ScheddName"])
-            if len(schedds) > 0:
-                row["Most Used Schedd"] = max(set(schedds), key=schedds.count)
-            else:
-                row["Most Used Schedd"] = "UNKNOWN"
+            row["Most Used Project"] = self.mode(data["ProjectName"])
+            row["Most Used Schedd"] = self.mode(data["ScheddName"])
         if agg == "Projects":
-            row["Num Users"] = len(set(data["User"]))
+            row["Num Users"] = self.count_distinct(data["User"])
 
         return row
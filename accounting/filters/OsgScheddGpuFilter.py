@@ -6,7 +6,10 @@ import statistics as stats
 from datetime import date
 from pathlib import Path
 from .BaseFilter import BaseFilter
+from accounting.condor_version import track_max_condor_version, max_condor_version
+from accounting.ospool_query import OspoolQueryMixin
 from accounting.functions import get_topology_resource_data, get_institution_database
+from accounting.transfer_stats import parse_transfer_stats
 
 
 DEFAULT_COLUMNS = {
@@ -94,7 +97,6 @@ DEFAULT_FILTER_ATTRS = [
     "SingularityImage",
     "ActivationDuration",
     "ActivationSetupDuration",
-    "CondorVersion",
 ]
 
 
@@ -102,8 +104,10 @@ INSTITUTION_DB = get_institution_database()
 RESOURCE_DATA = get_topology_resource_data()
 
 
-class OsgScheddGpuFilter(BaseFilter):
+class OsgScheddGpuFilter(OspoolQueryMixin, BaseFilter):
     name = "OSPool GPU schedd job history"
+    use_job_records = True
+    categorical_attrs = frozenset({"ProjectName", "ScheddName", "User", "_Institutions", "_Sites"})
 
     def __init__(self, **kwargs):
         self.collector_hosts = {"cm-1.ospool.osg-htc.org", "cm-2.ospool.osg-htc.org", "flock.opensciencegrid.org"}
@@ -148,7 +152,7 @@ class OsgScheddGpuFilter(BaseFilter):
                 }
             }
         })
-        return query
+        return self.add_ospool_query(query)
 
     def schedd_collector_host(self, schedd):
         # Query Schedd ad in Collector for its CollectorHost,
@@ -200,51 +204,59 @@ class OsgScheddGpuFilter(BaseFilter):
                 remote_pool = self.schedd_collector_host(schedd)
         return bool(remote_pool & self.collector_hosts)
 
+    def get_job_record(self, i):
+        # Derive the values shared by all of the filter methods once per job ad
+        job = super().get_job_record(i)
+
+        # Filter methods skip jobs that did not run in the OS pool
+        job.is_ospool_job = self.is_ospool_job(i)
+        if not job.is_ospool_job:
+            return job
+
+        # Get the site and institution this job ran at
+        job.resource = i.get("MachineAttrGLIDEIN_ResourceName0", i.get("MATCH_EXP_JOBGLIDEIN_ResourceName"))
+        if (job.resource is None) or (not job.resource):
+            pass
+        elif "MachineAttrOSG_INSTITUTION_ID0" in i:
+            job.institution_id = (i.get("MachineAttrOSG_INSTITUTION_ID0") or "").split("_")[-1]
+            job.institution = INSTITUTION_DB.get(job.institution_id, {}).get("name")
+        else:
+            job.institution = RESOURCE_DATA.get(job.resource.lower(), {}).get("institution")
+
+        return job
+
     def schedd_filter(self, data, doc):
 
         # Get input dict
         i = doc["_source"]
+        job = doc["_job"]
 
         # Get output dict for this schedd
         schedd = i.get("ScheddName", "UNKNOWN") or "UNKNOWN"
         o = data["Schedds"][schedd]
 
         # Filter out jobs that did not run in the OS pool
-        if not self.is_ospool_job(i):
+        if not job.is_ospool_job:
             return
 
         # Get list of attrs
         filter_attrs = DEFAULT_FILTER_ATTRS.copy()
 
         # Count number of DAGNode Jobs
-        if i.get("DAGNodeName") is not None:
-            o["_NumDAGNodes"].append(1)
-        else:
-            o["_NumDAGNodes"].append(0)
+        o["_NumDAGNodes"].append(job.num_dag_nodes)
 
         # Count number of history ads (i.e. number of unique job ids)
         o["_NumJobs"].append(1)
 
         # Count number of checkpointable jobs
-        if  (
-                i.get("SuccessCheckpointExitBySignal", False) or
-                i.get("SuccessCheckpointExitCode") is not None
-            ):
-            o["_NumCkptJobs"].append(1)
-        else:
-            o["_NumCkptJobs"].append(0)
+        o["_NumCkptJobs"].append(job.num_ckpt_jobs)
 
         # Compute badput fields
-        if (
-                i.get("NumJobStarts", 0) > 1 and
-                i.get("RemoteWallClockTime", 0) > 0 and
-                i.get("RemoteWallClockTime") != i.get("CommittedTime")
-            ):
-            o["_BadWallClockTime"].append(i["RemoteWallClockTime"] - i.get("CommittedTime", 0))
-            o["_NumBadJobStarts"].append(i["NumJobStarts"] - 1)
-        else:
-            o["_BadWallClockTime"].append(0)
-            o["_NumBadJobStarts"].append(0)
+        o["_BadWallClockTime"].append(job.bad_wall_clock_time)
+        o["_NumBadJobStarts"].append(job.num_bad_job_starts)
+
+        # Keep the highest CondorVersion instead of every job's version string
+        track_max_condor_version(o["_MaxCondorVersion"], i.get("CondorVersion"))
 
         # Add attr values to the output dict, use None if missing
         for attr in filter_attrs:
@@ -254,13 +266,14 @@ class OsgScheddGpuFilter(BaseFilter):
 
         # Get input dict
         i = doc["_source"]
+        job = doc["_job"]
 
         # Get output dict for this user
         user = i.get("User", "UNKNOWN") or "UNKNOWN"
         o = data["Users"][user]
 
         # Filter out jobs that did not run in the OS pool
-        if not self.is_ospool_job(i):
+        if not job.is_ospool_job:
             return
 
         # Add custom attrs to the list of attrs
@@ -268,40 +281,26 @@ class OsgScheddGpuFilter(BaseFilter):
         filter_attrs = filter_attrs + ["ScheddName", "ProjectName"]
 
         # Count number of DAGNode Jobs
-        if i.get("DAGNodeName") is not None:
-            o["_NumDAGNodes"].append(1)
-        else:
-            o["_NumDAGNodes"].append(0)
+        o["_NumDAGNodes"].append(job.num_dag_nodes)
 
         # Count number of history ads (i.e. number of unique job ids)
         o["_NumJobs"].append(1)
 
         # Count number of checkpointable jobs
-        if  (
-                i.get("SuccessCheckpointExitBySignal", False) or
-                i.get("SuccessCheckpointExitCode") is not None
-            ):
-            o["_NumCkptJobs"].append(1)
-        else:
-            o["_NumCkptJobs"].append(0)
+        o["_NumCkptJobs"].append(job.num_ckpt_jobs)
 
         # Compute badput fields
-        if (
-                i.get("NumJobStarts", 0) > 1 and
-                i.get("RemoteWallClockTime", 0) > 0 and
-                i.get("RemoteWallClockTime") != i.get("CommittedTime")
-            ):
-            o["_BadWallClockTime"].append(i["RemoteWallClockTime"] - i.get("CommittedTime", 0))
-            o["_NumBadJobStarts"].append(i["NumJobStarts"] - 1)
-        else:
-            o["_BadWallClockTime"].append(0)
-            o["_NumBadJobStarts"].append(0)
+        o["_BadWallClockTime"].append(job.bad_wall_clock_time)
+        o["_NumBadJobStarts"].append(job.num_bad_job_starts)
+
+        # Keep the highest CondorVersion instead of every job's version string
+        track_max_condor_version(o["_MaxCondorVersion"], i.get("CondorVersion"))
 
         # Add attr values to the output dict, use None if missing
         for attr in filter_attrs:
             # Use UNKNOWN for missing or blank ProjectName and ScheddName
             if attr in {"ScheddName", "ProjectName"}:
-                o[attr].append(i.get(attr, i.get(attr.lower(), "UNKNOWN")) or "UNKNOWN")
+                o[attr].append(i.get(attr, "UNKNOWN") or "UNKNOWN")
             else:
                 o[attr].append(i.get(attr, None))
 
@@ -309,13 +308,14 @@ class OsgScheddGpuFilter(BaseFilter):
 
         # Get input dict
         i = doc["_source"]
+        job = doc["_job"]
 
         # Get output dict for this project
-        project = i.get("ProjectName", i.get("projectname", "UNKNOWN")) or "UNKNOWN"
+        project = i.get("ProjectName", "UNKNOWN") or "UNKNOWN"
         o = data["Projects"][project]
 
         # Filter out jobs that did not run in the OS pool
-        if not self.is_ospool_job(i):
+        if not job.is_ospool_job:
             return
 
         # Add custom attrs to the list of attrs
@@ -323,46 +323,27 @@ class OsgScheddGpuFilter(BaseFilter):
         filter_attrs = filter_attrs + ["User"]
 
         # Get list of sites and institutions this user has run at
-        resource = i.get("MachineAttrGLIDEIN_ResourceName0", i.get("MATCH_EXP_JOBGLIDEIN_ResourceName"))
-        if (resource is None) or (not resource):
+        institution = job.institution
+        if institution is None:
             institution = "UNKNOWN"
-        elif "MachineAttrOSG_INSTITUTION_ID0" in i:
-            osg_id_short = (i.get("MachineAttrOSG_INSTITUTION_ID0") or "").split("_")[-1]
-            institution = INSTITUTION_DB.get(osg_id_short, {}).get("name", "UNKNOWN")
-        else:
-            institution = RESOURCE_DATA.get(resource.lower(), {}).get("institution", "UNKNOWN")
         o["_Institutions"].append(institution)
-        o["_Sites"].append(resource)
+        o["_Sites"].append(job.resource)
 
         # Count number of DAGNode Jobs
-        if i.get("DAGNodeName") is not None:
-            o["_NumDAGNodes"].append(1)
-        else:
-            o["_NumDAGNodes"].append(0)
+        o["_NumDAGNodes"].append(job.num_dag_nodes)
 
         # Count number of history ads (i.e. number of unique job ids)
         o["_NumJobs"].append(1)
 
         # Count number of checkpointable jobs
-        if  (
-                i.get("SuccessCheckpointExitBySignal", False) or
-                i.get("SuccessCheckpointExitCode") is not None
-            ):
-            o["_NumCkptJobs"].append(1)
-        else:
-            o["_NumCkptJobs"].append(0)
+        o["_NumCkptJobs"].append(job.num_ckpt_jobs)
 
         # Compute badput fields
-        if (
-                i.get("NumJobStarts", 0) > 1 and
-                i.get("RemoteWallClockTime", 0) > 0 and
-                i.get("RemoteWallClockTime") != i.get("CommittedTime")
-            ):
-            o["_BadWallClockTime"].append(i["RemoteWallClockTime"] - i.get("CommittedTime", 0))
-            o["_NumBadJobStarts"].append(i["NumJobStarts"] - 1)
-        else:
-            o["_BadWallClockTime"].append(0)
-            o["_NumBadJobStarts"].append(0)
+        o["_BadWallClockTime"].append(job.bad_wall_clock_time)
+        o["_NumBadJobStarts"].append(job.num_bad_job_starts)
+
+        # Keep the highest CondorVersion instead of every job's version string
+        track_max_condor_version(o["_MaxCondorVersion"], i.get("CondorVersion"))
 
         # Add attr values to the output dict, use None if missing
         for attr in filter_attrs:
@@ -373,9 +354,10 @@ class OsgScheddGpuFilter(BaseFilter):
 
         # Get input dict
         i = doc["_source"]
+        job = doc["_job"]
 
         # Filter out jobs that did not run in the OS pool
-        if not self.is_ospool_job(i):
+        if not job.is_ospool_job:
             return
 
         # Filter out jobs that were removed
@@ -383,26 +365,23 @@ class OsgScheddGpuFilter(BaseFilter):
             return
 
         # Get output dict for this institution
-        resource = i.get("MachineAttrGLIDEIN_ResourceName0", i.get("MATCH_EXP_JOBGLIDEIN_ResourceName"))
-        if (resource is None) or (not resource):
+        if (job.resource is None) or (not job.resource):
             institution = "Unknown (resource name missing)"
-        elif "MachineAttrOSG_INSTITUTION_ID0" in i:
-            osg_id_short = (i.get("MachineAttrOSG_INSTITUTION_ID0") or "").split("_")[-1]
-            institution = INSTITUTION_DB.get(osg_id_short, {}).get("name", f"Unmapped PRP resource: {osg_id_short}")
+        elif job.institution is not None:
+            institution = job.institution
+        elif job.institution_id is not None:
+            institution = f"Unmapped PRP resource: {job.institution_id}"
         else:
-            institution = RESOURCE_DATA.get(resource.lower(), {}).get("institution", f"Unmapped resource: {resource}")
+            institution = f"Unmapped resource: {job.resource}"
         o = data["Institution"][institution]
-        o["_Sites"].append(resource)
+        o["_Sites"].append(job.resource)
 
         # Add custom attrs to the list of attrs
         filter_attrs = DEFAULT_FILTER_ATTRS.copy()
         filter_attrs = filter_attrs + ["User"]
 
         # Count number of DAGNode Jobs
-        if i.get("DAGNodeName") is not None:
-            o["_NumDAGNodes"].append(1)
-        else:
-            o["_NumDAGNodes"].append(0)
+        o["_NumDAGNodes"].append(job.num_dag_nodes)
 
         # Count number of history ads (i.e. number of unique job ids)
         o["_NumJobs"].append(1)
@@ -411,6 +390,22 @@ class OsgScheddGpuFilter(BaseFilter):
         for attr in filter_attrs:
             o[attr].append(i.get(attr, None))
 
+    def get_source_attrs(self):
+        # Job ad attributes read by the filter methods
+        return DEFAULT_FILTER_ATTRS + [
+            "CondorVersion",
+            "DAGNodeName",
+            "LastRemotePool",
+            "MachineAttrGLIDEIN_ResourceName0",
+            "MachineAttrOSG_INSTITUTION_ID0",
+            "MATCH_EXP_JOBGLIDEIN_ResourceName",
+            "ProjectName",
+            "ScheddName",
+            "SuccessCheckpointExitBySignal",
+            "SuccessCheckpointExitCode",
+            "User",
+        ]
+
     def get_filters(self):
         # Add all filter methods to a list
         filters = [
@@ -527,7 +522,7 @@ class OsgScheddGpuFilter(BaseFilter):
         row["Max Used Disk GB"] = max(self.clean(data["DiskUsage"], allow_empty_list=False)) / (1000*1000)
         row["Max Rqst Cpus"]    = max(self.clean(data["RequestCpus"], allow_empty_list=False))
         row["Max Rqst Gpus"]    = max(self.clean(data["RequestGpus"], allow_empty_list=False))
-        row["Num Users"]        = len(set(data["User"]))
+        row["Num Users"]        = self.count_distinct(data["User"])
         row["Num S'ty Jobs"]    = len(self.clean(data["SingularityImage"]))
 
         if row["Num Uniq Job Ids"] > 0:
@@ -566,11 +561,8 @@ class OsgScheddGpuFilter(BaseFilter):
             # There is no variance if there is only one value
             row["Std Hrs"] = 0
 
-        # Compute mode for Project and Schedd columns in the Users table
-        row["Num Users"] = len(set(data["User"]))
-
         # Compute number of unique Sites
-        row["Num Sites"] = len(set(data["_Sites"]))
+        row["Num Sites"] = self.count_distinct(data["_Sites"])
 
         return row
 
@@ -583,39 +575,9 @@ class OsgScheddGpuFilter(BaseFilter):
         # Output dictionary
         row = {}
 
-        # Compute goodput and total CPU and GPU hours columns
-        goodput_cpu_time = []
-        badput_cpu_time = []
-        total_cpu_time = []
-        goodput_gpu_time = []
-        badput_gpu_time = []
-        total_gpu_time = []
-        for (goodput_time, badput_time, total_time, cpus, gpus) in zip(
-                data["CommittedTime"],
-                data["_BadWallClockTime"],
-                data["RemoteWallClockTime"],
-                data["RequestCpus"],
-                data["RequestGpus"]):
-            if cpus is not None:
-                cpus = max(cpus, 1)  # assume at least 1 CPU even if 0 CPUs were stored in Elasticsearch
-            if None in [goodput_time, cpus, gpus]:
-                goodput_cpu_time.append(None)
-                goodput_gpu_time.append(None)
-            else:
-                goodput_cpu_time.append(goodput_time * cpus)
-                goodput_gpu_time.append(goodput_time * gpus)
-            if None in [badput_time, cpus, gpus]:
-                badput_cpu_time.append(None)
-                badput_gpu_time.append(None)
-            else:
-                badput_cpu_time.append(badput_time * cpus)
-                badput_gpu_time.append(badput_time * gpus)
-            if None in [total_time, cpus, gpus]:
-                total_cpu_time.append(None)
-                total_gpu_time.append(None)
-            else:
-                total_cpu_time.append(total_time * cpus)
-                total_gpu_time.append(total_time * gpus)
+        # Compute goodput, badput and total CPU and GPU time, short jobs
+        # and long job time stats
+        job_times = self.compute_job_times(data, gpus=True)
 
         # Don't count starts and shadows for jobs that don't/shouldn't have shadows
         num_exec_attempts = []
@@ -626,33 +588,6 @@ class OsgScheddGpuFilter(BaseFilter):
             num_exec_attempts.append(job_starts)
             num_shadow_starts.append(shadow_starts)
 
-        # Short jobs are jobs that ran for < 1 minute
-        is_short_job = []
-        for (goodput_time, record_date, start_date) in zip(
-                data["CommittedTime"],
-                data["RecordTime"],
-                data["JobCurrentStartDate"]):
-            if (goodput_time is not None) and (goodput_time > 0):
-                is_short_job.append(goodput_time < 60)
-            elif None in (record_date, start_date):
-                is_short_job.append(None)
-            else:
-                is_short_job.append((record_date - start_date) < 60)
-
-        # "Long" (i.e. "normal") jobs ran >= 1 minute
-        # We only want to use these when computing percentiles,
-        # so filter out short jobs and removed jobs,
-        # and sort them so we can easily grab the percentiles later
-        long_times_sorted = []
-        for (is_short, goodput_time, job_status) in zip(
-                is_short_job,
-                data["CommittedTime"],
-                data["JobStatus"]):
-            if (is_short is False) and (job_status != 3):
-                long_times_sorted.append(goodput_time)
-        long_times_sorted = self.clean(long_times_sorted)
-        long_times_sorted.sort()
-
         # File transfer stats
         input_files_total_count = []
         input_files_total_bytes = []
@@ -678,48 +613,26 @@ class OsgScheddGpuFilter(BaseFilter):
                 data["BytesSent"],
             ):
 
-            input_files_count = 0
-            input_files_bytes = 0
             if input_stats is None:
                 input_files_total_count.append(None)
                 input_files_total_job_starts.append(None)
             else:
-                got_cedar_bytes = False
-                for attr in input_stats:
-                    if attr.casefold() in {"stashfilescounttotal", "osdffilescounttotal"}:
-                        osdf_files_count += input_stats[attr]
-                    if attr.casefold() in {"stashsizebytestotal", "osdfsizebytestotal"}:
-                        osdf_bytes_total += input_stats[attr]
-                    if attr.casefold().endswith("FilesCountTotal".casefold()):
-                        input_files_count += input_stats[attr]
-                    elif attr.casefold().endswith("SizeBytesTotal".casefold()):
-                        input_files_bytes += input_stats[attr]
-                        if attr.casefold() == "CedarSizeBytesTotal".casefold():
-                            got_cedar_bytes = True
+                (input_files_count, input_files_bytes, osdf_files, osdf_bytes, got_cedar_bytes) = parse_transfer_stats(input_stats)
+                osdf_files_count += osdf_files
+                osdf_bytes_total += osdf_bytes
                 if not got_cedar_bytes:
                     input_files_bytes += input_cedar_bytes
                 input_files_total_count.append(input_files_count)
                 input_files_total_bytes.append(input_files_bytes)
                 input_files_total_job_starts.append(job_starts)
 
-            output_files_count = 0
-            output_files_bytes = 0
             if output_stats is None:
                 output_files_total_count.append(None)
                 output_files_total_job_stops.append(None)
             else:
-                got_cedar_bytes = False
-                for attr in output_stats:
-                    if attr.casefold() in {"stashfilescounttotal", "osdffilescounttotal"}:
-                        osdf_files_count += output_stats[attr]
-                    if attr.casefold() in {"stashsizebytestotal", "osdfsizebytestotal"}:
-                        osdf_bytes_total += output_stats[attr]
-                    if attr.casefold().endswith("FilesCountTotal".casefold()):
-                        output_files_count += output_stats[attr]
-                    elif attr.casefold().endswith("SizeBytesTotal".casefold()):
-                        output_files_bytes += output_stats[attr]
-                        if attr.casefold() == "CedarSizeBytesTotal".casefold():
-                            got_cedar_bytes = True
+                (output_files_count, output_files_bytes, osdf_files, osdf_bytes, got_cedar_bytes) = parse_transfer_stats(output_stats)
+                osdf_files_count += osdf_files
+                osdf_bytes_total += osdf_bytes
                 if not got_cedar_bytes:
                     output_files_bytes += output_cedar_bytes
                 output_files_total_count.append(output_files_count)
@@ -746,10 +659,10 @@ class OsgScheddGpuFilter(BaseFilter):
                 setup_durations.append(setup_duration)
 
         # Compute columns
-        row["All CPU Hours"]    = sum(self.clean(total_cpu_time)) / 3600
-        row["All GPU Hours"]    = sum(self.clean(total_gpu_time)) / 3600
-        row["Good CPU Hours"]   = sum(self.clean(goodput_cpu_time)) / 3600
-        row["Good GPU Hours"]   = sum(self.clean(goodput_gpu_time)) / 3600
+        row["All CPU Hours"]    = job_times["total_cpu_time"] / 3600
+        row["All GPU Hours"]    = job_times["total_gpu_time"] / 3600
+        row["Good CPU Hours"]   = job_times["goodput_cpu_time"] / 3600
+        row["Good GPU Hours"]   = job_times["goodput_gpu_time"] / 3600
         row["Num Uniq Job Ids"] = sum(data['_NumJobs'])
         row["Num DAG Node Jobs"] = sum(data['_NumDAGNodes'])
         row["Num Rm'd Jobs"]    = sum([status == 3 for status in data["JobStatus"]])
@@ -758,7 +671,7 @@ class OsgScheddGpuFilter(BaseFilter):
         row["Num Jobs Over Rqst Disk"] = sum([(usage or 0) > (request or 1)
             for (usage, request) in zip(data["DiskUsage"], data["RequestDisk"])])
         row["Num Jobs w/>1 Exec Att"] = sum([starts > 1 for starts in self.clean(data["NumJobStarts"])])
-        row["Num Short Jobs"]   = sum(self.clean(is_short_job))
+        row["Num Short Jobs"]   = job_times["num_short_jobs"]
         row["Max Rqst Mem MB"]  = max(self.clean(data['RequestMemory'], allow_empty_list=False))
         row["Med Used Mem MB"]  = stats.median(self.clean(data["MemoryUsage"], allow_empty_list=False))
         row["Max Used Mem MB"]  = max(self.clean(data["MemoryUsage"], allow_empty_list=False))
@@ -804,8 +717,8 @@ class OsgScheddGpuFilter(BaseFilter):
         else:
             row["Exec Atts / Shadw Start"] = 0
         if sum(data["_NumBadJobStarts"]) > 0:
-            row["CPU Hours / Bad Exec Att"] = (sum(self.clean(badput_cpu_time)) / 3600) / sum(data["_NumBadJobStarts"])
-            row["GPU Hours / Bad Exec Att"] = (sum(self.clean(badput_gpu_time)) / 3600) / sum(data["_NumBadJobStarts"])
+            row["CPU Hours / Bad Exec Att"] = (job_times["badput_cpu_time"] / 3600) / sum(data["_NumBadJobStarts"])
+            row["GPU Hours / Bad Exec Att"] = (job_times["badput_gpu_time"] / 3600) / sum(data["_NumBadJobStarts"])
         else:
             row["CPU Hours / Bad Exec Att"] = 0
             row["GPU Hours / Bad Exec Att"] = 0
@@ -846,11 +759,8 @@ class OsgScheddGpuFilter(BaseFilter):
                 row["Total Files Xferd"] = row.get("Total Files Xferd", 0) + output_files
 
         if osdf_files_count == 0 or osdf_bytes_total == 0:
-            condor_versions_set = set(data["CondorVersion"])
-            condor_versions_tuples_list = []
-            for version in condor_versions_set:
-                condor_versions_tuples_list.append(tuple([int(x) for x in version.split()[1].split(".")]))
-            if all(condor_version_tuple < (9, 7, 0) for condor_version_tuple in condor_versions_tuples_list):
+            condor_version = max_condor_version(data["_MaxCondorVersion"])
+            if condor_version is None or condor_version < (9, 7, 0):
                 row["OSDF Files Xferd"] = row["% OSDF Files"] = row["% OSDF Bytes"] = "-"
             else:
                 row["OSDF Files Xferd"] = row["% OSDF Files"] = row["% OSDF Bytes"] = 0                    
@@ -878,39 +788,15 @@ class OsgScheddGpuFilter(BaseFilter):
             row["Mean Setup Secs"] = sum(setup_durations) / len(setup_durations)
 
         # Compute time percentiles and stats
-        if len(long_times_sorted) > 0:
-            row["Min Hrs"]  = long_times_sorted[ 0] / 3600
-            row["25% Hrs"]  = long_times_sorted[  len(long_times_sorted)//4] / 3600
-            row["Med Hrs"]  = stats.median(long_times_sorted) / 3600
-            row["75% Hrs"]  = long_times_sorted[3*len(long_times_sorted)//4] / 3600
-            row["95% Hrs"]  = long_times_sorted[int(0.95*len(long_times_sorted))] / 3600
-            row["Max Hrs"]  = long_times_sorted[-1] / 3600
-            row["Mean Hrs"] = stats.mean(long_times_sorted) / 3600
-        else:
-            for col in [f"{x} Hrs" for x in ["Min", "25%", "Med", "75%", "95%", "Max", "Mean"]]:
-                row[col] = 0
-        if len(long_times_sorted) > 1:
-            row["Std Hrs"] = stats.stdev(long_times_sorted) / 3600
-        else:
-            # There is no variance if there is only one value
-            row["Std Hrs"] = 0
+        row.update(job_times["time_stats"])
 
         # Compute mode for Project and Schedd columns in the Users table
         if agg == "Users":
-            projects = self.clean(data["ProjectName"])
-            if len(projects) > 0:
-                row["Most Used Project"] = max(set(projects), key=projects.count)
-            else:
-                row["Most Used Project"] = "UNKNOWN"
-
-            schedds = self.clean(data["ScheddName"])
-            if len(schedds) > 0:
-                row["Most Used Schedd"] = max(set(schedds), key=schedds.count)
-            else:
-                row["Most Used Schedd"] = "UNKNOWN"
+            row["Most Used Project"] = self.mode(data["ProjectName"])
+            row["Most Used Schedd"] = self.mode(data["ScheddName"])
         if agg == "Projects":
-            row["Num Users"] = len(set(data["User"]))
-            row["Num Site Instns"] = len(set(data["_Institutions"]))
-            row["Num Sites"] = len(set(data["_Sites"]))
+            row["Num Users"] = self.count_distinct(data["User"])
+            row["Num Site Instns"] = self.count_distinct(data["_Institutions"])
+            row["Num Sites"] = self.count_distinct(data["_Sites"])
 
         return row
@@ -6,6 +6,8 @@ from pathlib import Path
 from elasticsearch import Elasticsearch
 import elasticsearch.helpers
 from .BaseFilter import BaseFilter
+from accounting.ospool_query import OspoolQueryMixin
+from accounting.columns import merge_values
 from functools import lru_cache
 from collections import defaultdict
 
@@ -35,8 +37,9 @@ MEMORY_ROWS[8] = "(8,)"
 MEMORY_QUANTILES = list(MEMORY_ROWS.keys())
 MEMORY_QUANTILES.sort()
 
-class OsgScheddJobDistroFilter(BaseFilter):
+class OsgScheddJobDistroFilter(OspoolQueryMixin, BaseFilter):
     name = "OSG schedd job distribution"
+    build_totals = False
 
 
     def __init__(self, **kwargs):
@@ -80,7 +83,7 @@ class OsgScheddJobDistroFilter(BaseFilter):
                 }
             }
         })
-        return query
+        return self.add_ospool_query(query)
 
 
     def schedd_collector_host(self, schedd):
@@ -136,54 +139,17 @@ class OsgScheddJobDistroFilter(BaseFilter):
         return False
 
 
-    def scan_and_filter(self, es_index, start_ts, end_ts, build_totals=False, **kwargs):
-        # Returns a 3-level dictionary that contains data gathered from
-        # Elasticsearch and filtered through whatever methods have been
-        # defined in self.get_filters()
-
-        # Create a data structure for storing filtered data:
-        filtered_data = {
+    def get_empty_filtered_data(self):
+        return {
             "JobRequests": {},
             "JobUsages": {}
         }
 
-        # Get list of indices so we can use one at a time
-        indices = list(self.client.indices.get_alias(index=es_index).keys())
-        indices.sort(reverse=True)
-        indices.insert(0, indices.pop())  # make sure the first index gets checked first
-        self.logger.debug(f"Querying at most {len(indices)} indices matching {es_index}.")
-        got_initial_data = False  # only stop after we've seen data
-
-        for index in indices:
-
-            query = self.get_query(
-                index=index,
-                start_ts=start_ts,
-                end_ts=end_ts,
-            )
-
-            # Use the scan() helper function, which automatically scrolls results. Nice!
-            self.logger.debug(f"Querying {index}.")
-            got_index_data = False
-            for doc in elasticsearch.helpers.scan(
-                    client=self.client,
-                    query=query.pop("body"),
-                    **query,
-                    ):
-                got_initial_data = True
-                got_index_data = True
-
-                # Send the doc through the various filters,
-                # which mutate filtered_data in place
-                for filtr in self.get_filters():
-                    filtr(filtered_data, doc)
-
-            # Break early if not finding more results
-            if got_initial_data and not got_index_data:
-                self.logger.debug(f"Exiting scan early since no docs were found")
-                break
 
-        return filtered_data
+    def merge_partial_data(self, data, partial_data):
+        # Sums the job counts and histograms of each table
+        for table, partial_table in partial_data.items():
+            data[table] = merge_values(data[table], partial_table)
 
 
     @lru_cache(maxsize=1024)
@@ -263,6 +229,27 @@ class OsgScheddJobDistroFilter(BaseFilter):
                 usages["SingleCoreJobs"] = jobs + 1
 
 
+    def get_source_attrs(self):
+        # Job ad attributes read by the filter methods
+        return [
+            "DiskUsage",
+            "DiskUsage_RAW",
+            "LastRemotePool",
+            "MemoryUsage",
+            "MemoryUsage_RAW",
+            "RequestCpus",
+            "RequestDisk",
+            "RequestMemory",
+            "ScheddName",
+        ]
+
+
+    def get_docvalue_fields(self):
+        # Doc values fields for the job ad attributes read by the filter methods
+        string_attrs = {"LastRemotePool", "ScheddName"}
+        return {attr: f"{attr}.keyword" if attr in string_attrs else attr for attr in self.get_source_attrs()}
+
+
     def get_filters(self):
         # Add all filter methods to a list
         filters = [
@@ -4,6 +4,7 @@ import htcondor
 import pickle
 from pathlib import Path
 from .BaseFilter import BaseFilter
+from accounting.ospool_query import OspoolQueryMixin
 
 
 DEFAULT_COLUMNS = {
@@ -64,8 +65,9 @@ DEFAULT_FILTER_ATTRS = [
 ]
 
 
-class OsgScheddLongJobFilter(BaseFilter):
+class OsgScheddLongJobFilter(OspoolQueryMixin, BaseFilter):
     name = "OSG schedd long job history"
+    build_totals = False
 
     def __init__(self, **kwargs):
         self.collector_hosts = {"cm-1.ospool.osg-htc.org", "cm-2.ospool.osg-htc.org", "flock.opensciencegrid.org"}
@@ -110,10 +112,16 @@ class OsgScheddLongJobFilter(BaseFilter):
                 }
             }
         })
-        return query
+        return self.add_ospool_query(query)
 
-    def scan_and_filter(self, es_index, start_ts, end_ts, **kwargs):
-        return super().scan_and_filter(es_index, start_ts, end_ts, build_totals=False, **kwargs)
+    def merge_partial_data(self, data, partial_data):
+        # Keep only the longest job for each user
+        for user, o in partial_data["Users"].items():
+            current = data["Users"][user]
+            if len(o["_NumJobs"]) == 0:
+                continue
+            if len(current["_NumJobs"]) == 0 or (o["CommittedTime"][0] or 0) >= (current["CommittedTime"][0] or 0):
+                data["Users"][user] = o
 
     def schedd_collector_host(self, schedd):
         # Query Schedd ad in Collector for its CollectorHost,
@@ -196,7 +204,7 @@ class OsgScheddLongJobFilter(BaseFilter):
             if attr in {"GlobalJobId", "ScheddName", "ProjectName",
                             "MATCH_EXP_JOBGLIDEIN_ResourceName",
                             "LastRemoteHost"}:
-                o[attr][0] = i.get(attr, i.get(attr.lower(), "UNKNOWN")) or "UNKNOWN"
+                o[attr][0] = i.get(attr, "UNKNOWN") or "UNKNOWN"
             elif attr in {"RequestGpus"}:
                 o[attr][0] = i.get(attr, 0)
             else:
@@ -205,6 +213,26 @@ class OsgScheddLongJobFilter(BaseFilter):
         if "_NumJobs" not in o:
             o["_NumJobs"] = [1]
 
+    def get_source_attrs(self):
+        # Job ad attributes read by the filter methods
+        return DEFAULT_FILTER_ATTRS + [
+            "LastRemotePool",
+            "User",
+        ]
+
+    def get_docvalue_fields(self):
+        # Doc values fields for the job ad attributes read by the filter methods
+        string_attrs = {
+            "GlobalJobId",
+            "LastRemoteHost",
+            "LastRemotePool",
+            "MATCH_EXP_JOBGLIDEIN_ResourceName",
+            "ProjectName",
+            "ScheddName",
+            "User",
+        }
+        return {attr: f"{attr}.keyword" if attr in string_attrs else attr for attr in self.get_source_attrs()}
+
     def get_filters(self):
         # Add all filter methods to a list
         filters = [
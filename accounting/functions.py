@@ -17,6 +17,17 @@ from email.mime.base import MIMEBase
 from email.utils import formatdate
 from email import encoders
 from dns.resolver import query as dns_query
+from elasticsearch.serializer import JSONSerializer
+from elasticsearch.exceptions import SerializationError
+
+try:
+    import orjson
+except ModuleNotFoundError:
+    orjson = None
+try:
+    import msgspec
+except ModuleNotFoundError:
+    msgspec = None
 
 
 INSTITUTION_DATABASE_URL = "https://topology-institutions.osg-htc.org/api/institution_ids"
@@ -24,6 +35,58 @@ TOPOLOGY_PROJECT_DATA_URL = "https://topology.opensciencegrid.org/miscproject/xm
 TOPOLOGY_RESOURCE_DATA_URL = "https://topology.opensciencegrid.org/rgsummary/xml"
 
 
+class OrjsonSerializer(JSONSerializer):
+    # Elasticsearch serializer that uses orjson instead of the json module
+
+    def loads(self, s):
+        try:
+            return orjson.loads(s)
+        except orjson.JSONDecodeError as e:
+            raise SerializationError(s, e)
+
+    def dumps(self, data):
+        if isinstance(data, str):
+            return data
+        try:
+            return orjson.dumps(
+                data,
+                default=self.default,
+                option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY,
+            ).decode("utf-8")
+        except (TypeError, orjson.JSONEncodeError) as e:
+            raise SerializationError(data, e)
+
+
+class MsgspecSerializer(JSONSerializer):
+    # Elasticsearch serializer that uses msgspec instead of the json module
+
+    def loads(self, s):
+        try:
+            return msgspec.json.decode(s)
+        except msgspec.DecodeError as e:
+            raise SerializationError(s, e)
+
+    def dumps(self, data):
+        if isinstance(data, str):
+            return data
+        try:
+            return msgspec.json.encode(data, enc_hook=self.default).decode("utf-8")
+        except (TypeError, msgspec.EncodeError) as e:
+            raise SerializationError(data, e)
+
+
+def get_es_serializer(serializer="auto"):
+    # Returns Elasticsearch serializer kwargs for the requested JSON library,
+    # "auto" picks the fastest one available, "json" keeps the client default
+    if serializer in {"auto", "orjson"} and orjson is not None:
+        return {"serializer": OrjsonSerializer()}
+    if serializer in {"auto", "msgspec"} and msgspec is not None:
+        return {"serializer": MsgspecSerializer()}
+    if serializer not in {"auto", "json"}:
+        logging.getLogger("accounting").warning(f"{serializer} is not installed, using default JSON serializer")
+    return {}
+
+
 def get_institution_database(cache_file=Path("./institution_database.pickle")) -> dict:
     institution_db = {}
 
@@ -0,0 +1,215 @@
+import statistics as stats
+from itertools import repeat
+from accounting.column_specs import clean
+from accounting.array_columns import np, ArrayColumns, is_true, nansum, not_missing, order_stats
+
+
+TIME_STATS_COLUMNS = [f"{x} Hrs" for x in ["Min", "25%", "Med", "75%", "95%", "Max", "Mean", "Std"]]
+
+# QuantileSummary.stat() of the long job times behind each time stats column
+TIME_STATS_QUANTILES = dict(zip(TIME_STATS_COLUMNS, [0, 0.25, "median", 0.75, 0.95, 1, "mean", "stdev"]))
+
+
+def get_job_times(data, gpus=False, make_quantiles=None):
+    """Returns a dict of an aggregate's goodput, badput and total CPU
+    (and GPU) time, its number of short jobs and the time stats
+    columns of its long jobs, computed from the stored columns.
+    The time stats are computed from a QuantileSummary returned
+    by make_quantiles() if set, instead of sorting the times."""
+
+    # Compute goodput and total CPU time
+    # (skipping jobs without a RequestGpus when counting GPUs)
+    goodput_cpu_time = []
+    badput_cpu_time = []
+    total_cpu_time = []
+    for (goodput_time, badput_time, total_time, cpus, job_gpus) in zip(
+            data["CommittedTime"],
+            data["_BadWallClockTime"],
+            data["RemoteWallClockTime"],
+            data["RequestCpus"],
+            data["RequestGpus"] if gpus else repeat(0)):
+        if cpus is not None:
+            cpus = max(cpus, 1)  # assume at least 1 CPU even if 0 CPUs were stored in Elasticsearch
+        if None in [goodput_time, cpus, job_gpus]:
+            goodput_cpu_time.append(None)
+        else:
+            goodput_cpu_time.append(goodput_time * cpus)
+        if None in [badput_time, cpus, job_gpus]:
+            badput_cpu_time.append(None)
+        else:
+            badput_cpu_time.append(badput_time * cpus)
+        if None in [total_time, cpus, job_gpus]:
+            total_cpu_time.append(None)
+        else:
+            total_cpu_time.append(total_time * cpus)
+
+    # Compute goodput and total GPU time
+    goodput_gpu_time = []
+    badput_gpu_time = []
+    total_gpu_time = []
+    if gpus:
+        for (goodput_time, badput_time, total_time, cpus, job_gpus) in zip(
+                data["CommittedTime"],
+                data["_BadWallClockTime"],
+                data["RemoteWallClockTime"],
+                data["RequestCpus"],
+                data["RequestGpus"]):
+            if None in [goodput_time, cpus, job_gpus]:
+                goodput_gpu_time.append(None)
+            else:
+                goodput_gpu_time.append(goodput_time * job_gpus)
+            if None in [badput_time, cpus, job_gpus]:
+                badput_gpu_time.append(None)
+            else:
+                badput_gpu_time.append(badput_time * job_gpus)
+            if None in [total_time, cpus, job_gpus]:
+                total_gpu_time.append(None)
+            else:
+                total_gpu_time.append(total_time * job_gpus)
+
+    # Short jobs are jobs that ran for < 1 minute
+    is_short_job = []
+    for (goodput_time, record_date, start_date) in zip(
+            data["CommittedTime"],
+            data["RecordTime"],
+            data["JobCurrentStartDate"]):
+        if (goodput_time is not None) and (goodput_time > 0):
+            is_short_job.append(goodput_time < 60)
+        elif None in (record_date, start_date):
+            is_short_job.append(None)
+        else:
+            is_short_job.append((record_date - start_date) < 60)
+
+    # "Long" (i.e. "normal") jobs ran >= 1 minute
+    # We only want to use these when computing percentiles,
+    # so filter out short jobs and removed jobs,
+    # and sort them so we can easily grab the percentiles later
+    long_times_sorted = []
+    for (is_short, goodput_time, job_status) in zip(
+            is_short_job,
+            data["CommittedTime"],
+            data["JobStatus"]):
+        if (is_short is False) and (job_status != 3):
+            long_times_sorted.append(goodput_time)
+    long_times_sorted = clean(long_times_sorted)
+    if make_quantiles is not None:
+        long_times = make_quantiles()
+        long_times.extend(long_times_sorted)
+        time_stats = get_time_stats_summary(long_times)
+    else:
+        long_times_sorted.sort()
+        time_stats = get_time_stats(long_times_sorted)
+
+    job_times = {
+        "goodput_cpu_time": sum(clean(goodput_cpu_time)),
+        "badput_cpu_time": sum(clean(badput_cpu_time)),
+        "total_cpu_time": sum(clean(total_cpu_time)),
+        "num_short_jobs": sum(clean(is_short_job)),
+        "time_stats": time_stats,
+    }
+    if gpus:
+        job_times["goodput_gpu_time"] = sum(clean(goodput_gpu_time))
+        job_times["badput_gpu_time"] = sum(clean(badput_gpu_time))
+        job_times["total_gpu_time"] = sum(clean(total_gpu_time))
+    return job_times
+
+
+def get_time_stats(long_times_sorted):
+    """Returns the time percentiles and stats columns
+    of a sorted list of long job times"""
+    row = {}
+    if len(long_times_sorted) > 0:
+        row["Min Hrs"]  = long_times_sorted[ 0] / 3600
+        row["25% Hrs"]  = long_times_sorted[  len(long_times_sorted)//4] / 3600
+        row["Med Hrs"]  = stats.median(long_times_sorted) / 3600
+        row["75% Hrs"]  = long_times_sorted[3*len(long_times_sorted)//4] / 3600
+        row["95% Hrs"]  = long_times_sorted[int(0.95*len(long_times_sorted))] / 3600
+        row["Max Hrs"]  = long_times_sorted[-1] / 3600
+        row["Mean Hrs"] = stats.mean(long_times_sorted) / 3600
+    else:
+        for col in [f"{x} Hrs" for x in ["Min", "25%", "Med", "75%", "95%", "Max", "Mean"]]:
+            row[col] = 0
+    if len(long_times_sorted) > 1:
+        row["Std Hrs"] = stats.stdev(long_times_sorted) / 3600
+    else:
+        # There is no variance if there is only one value
+        row["Std Hrs"] = 0
+    return row
+
+
+def get_time_stats_summary(long_times):
+    """Same as get_time_stats(), from a QuantileSummary
+    (e.g. a QuantileSketch) of the long job times, or None"""
+    if long_times is None or len(long_times) == 0:
+        return {col: 0 for col in TIME_STATS_COLUMNS}
+    values = long_times.get_stats(list(TIME_STATS_QUANTILES.values()))
+    return {col: value / 3600 for (col, value) in zip(TIME_STATS_QUANTILES, values)}
+
+
+def get_job_times_array(data, gpus=False, make_quantiles=None):
+    """Same as get_job_times(), computed with NumPy
+    from arrays of the stored columns"""
+    arrays = ArrayColumns(data)
+    goodput_time = arrays["CommittedTime"]
+
+    # NaN (missing) CPUs or GPUs propagate to the products
+    cpus = np.maximum(arrays["RequestCpus"], 1)
+    if gpus:
+        request_gpus = arrays["RequestGpus"]
+        cpus = np.where(np.isnan(request_gpus), np.nan, cpus)
+
+    # Short jobs are jobs that ran for < 1 minute
+    record_date = arrays["RecordTime"]
+    start_date = arrays["JobCurrentStartDate"]
+    with np.errstate(invalid="ignore"):
+        is_short_job = np.where(
+            goodput_time > 0,
+            goodput_time < 60,
+            np.where(np.isnan(record_date) | np.isnan(start_date), np.nan, (record_date - start_date) < 60),
+        )
+
+    # "Long" (i.e. "normal") jobs ran >= 1 minute and were not removed
+    is_long_job = (is_short_job == 0) & (arrays["JobStatus"] != 3)
+    long_times = not_missing(goodput_time[is_long_job])
+    if make_quantiles is not None:
+        long_times_summary = make_quantiles()
+        long_times_summary.extend(long_times.tolist())
+        time_stats = get_time_stats_summary(long_times_summary)
+    else:
+        time_stats = get_time_stats_array(long_times)
+
+    job_times = {
+        "goodput_cpu_time": nansum(goodput_time * cpus),
+        "badput_cpu_time": nansum(arrays["_BadWallClockTime"] * cpus),
+        "total_cpu_time": nansum(arrays["RemoteWallClockTime"] * cpus),
+        "num_short_jobs": int(np.count_nonzero(is_true(is_short_job))),
+        "time_stats": time_stats,
+    }
+    if gpus:
+        request_gpus = np.where(np.isnan(cpus), np.nan, request_gpus)
+        job_times["goodput_gpu_time"] = nansum(goodput_time * request_gpus)
+        job_times["badput_gpu_time"] = nansum(arrays["_BadWallClockTime"] * request_gpus)
+        job_times["total_gpu_time"] = nansum(arrays["RemoteWallClockTime"] * request_gpus)
+    return job_times
+
+
+def get_time_stats_array(long_times):
+    """Same as get_time_stats(), from an unsorted array of long job times,
+    using np.partition() for the percentiles instead of sorting"""
+    n = len(long_times)
+    if n == 0:
+        return {col: 0 for col in TIME_STATS_COLUMNS}
+    (min_time, q25_time, q75_time, q95_time, max_time, med_low, med_high) = order_stats(
+        long_times,
+        [0, n//4, 3*n//4, int(0.95*n), n - 1, (n - 1)//2, n//2],
+    )
+    row = {}
+    row["Min Hrs"]  = min_time / 3600
+    row["25% Hrs"]  = q25_time / 3600
+    row["Med Hrs"]  = ((med_low + med_high) / 2 if n % 2 == 0 else med_high) / 3600
+    row["75% Hrs"]  = q75_time / 3600
+    row["95% Hrs"]  = q95_time / 3600
+    row["Max Hrs"]  = max_time / 3600
+    row["Mean Hrs"] = float(np.mean(long_times)) / 3600
+    row["Std Hrs"]  = float(np.std(long_times, ddof=1)) / 3600 if n > 1 else 0
+    return row
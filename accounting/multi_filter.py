@@ -0,0 +1,122 @@
+from accounting.filters.BaseFilter import BaseFilter, SourceAttrChecker
+
+
+class MultiFilter(BaseFilter):
+    """Runs several filters from a single scan of Elasticsearch
+
+    The scan's query is the union of the filters' queries, each one
+    named so that every hit comes back with the matched_queries of
+    the filters that it belongs to. Each doc is only sent through the
+    filter methods of those filters, and each filter keeps its own
+    filtered data (and TOTAL rows), which is stored in its data
+    attribute when the scan finishes. The filters must be created
+    with skip_init=True."""
+
+    name = "multiple job histories"
+
+    def __init__(self, report_filters, skip_init=False, **kwargs):
+        self.filters = list(report_filters)
+        self.query_names = {f"{n}_{type(filtr).__name__}": n for (n, filtr) in enumerate(self.filters)}
+        self.supports_partial_merge = all(filtr.supports_partial_merge for filtr in self.filters)
+        super().__init__(skip_init=skip_init, **kwargs)
+        if skip_init:
+            return
+        for (n, filtr) in enumerate(self.filters):
+            filtr.data = self.data[n]
+
+    def get_query(self, index, start_ts, end_ts, **kwargs):
+        # Returns the first filter's query with its body replaced by
+        # a bool/should over all of the filters' named queries
+        queries = [filtr.get_query(index, start_ts, end_ts, **kwargs) for filtr in self.filters]
+        query = queries[0]
+        query["body"] = {
+            "query": {
+                "bool": {
+                    "should": [
+                        {"bool": {
+                            "filter": [filter_query["body"]["query"]],
+                            "_name": name,
+                        }}
+                        for (name, filter_query) in zip(self.query_names, queries)
+                    ],
+                    "minimum_should_match": 1,
+                }
+            }
+        }
+
+        # Fetch the union of the filters' attributes,
+        # or entire job ads if any filter needs them
+        query.pop("_source_includes", None)
+        if all("_source_includes" in filter_query for filter_query in queries):
+            source_includes = set()
+            for filter_query in queries:
+                source_includes.update(filter_query["_source_includes"])
+            query["_source_includes"] = sorted(source_includes)
+
+        return query
+
+    def plan_query(self, indices, start_ts, end_ts):
+        # The filters were created without connecting to Elasticsearch,
+        # so they plan their queries using this filter's client
+        for filtr in self.filters:
+            filtr.client = self.client
+            filtr.plan_query(indices, start_ts, end_ts)
+
+    def get_source_attrs(self):
+        source_attrs = set()
+        for filtr in self.filters:
+            filter_source_attrs = filtr.get_source_attrs()
+            if filter_source_attrs is None:
+                return None
+            source_attrs.update(filter_source_attrs)
+        return sorted(source_attrs)
+
+    def get_docvalue_fields(self):
+        docvalue_fields = {}
+        for filtr in self.filters:
+            filter_docvalue_fields = filtr.get_docvalue_fields()
+            if filter_docvalue_fields is None:
+                return None
+            docvalue_fields.update(filter_docvalue_fields)
+        return docvalue_fields
+
+    def get_filter_path(self, pit=False):
+        return f"{super().get_filter_path(pit=pit)},hits.hits.matched_queries"
+
+    def get_empty_filtered_data(self):
+        # One filtered data structure per filter, in filter order
+        return [filtr.get_empty_filtered_data() for filtr in self.filters]
+
+    def merge_partial_data(self, data, partial_data):
+        for (filtr, filter_data, filter_partial_data) in zip(self.filters, data, partial_data):
+            filtr.merge_partial_data(filter_data, filter_partial_data)
+
+    def add_totals(self, filtered_data):
+        for (filtr, filter_data) in zip(self.filters, filtered_data):
+            if filtr.build_totals:
+                filtr.add_totals(filter_data)
+
+    def apply_filters(self, filtered_data, docs):
+        # Send each doc through the filter methods of
+        # the filters whose queries it matched
+        filters = [filtr.get_filters() for filtr in self.filters]
+        normalize = self.attr_schema.compile(self.get_source_attrs())
+        declared_attrs = [None] * len(self.filters)
+        if self.check_source_attrs:
+            for (n, filtr) in enumerate(self.filters):
+                if filtr.get_source_attrs() is not None:
+                    declared_attrs[n] = set(filtr.get_source_attrs()) | filtr.attr_schema.compile(filtr.get_source_attrs()).attrs
+        for doc in docs:
+            normalize(doc["_source"])
+            for name in doc.get("matched_queries", []):
+                n = self.query_names.get(name)
+                if n is None:
+                    continue
+                filtr = self.filters[n]
+                filter_doc = dict(doc)
+                if declared_attrs[n] is not None:
+                    filter_doc["_source"] = SourceAttrChecker(doc["_source"], declared_attrs[n], filtr.undeclared_attrs, filtr.logger)
+                if filtr.use_job_records:
+                    filter_doc["_job"] = filtr.get_job_record(doc["_source"])
+                for filter_method in filters[n]:
+                    filter_method(filtered_data[n], filter_doc)
@@ -0,0 +1,62 @@
+import elasticsearch
+
+
+# is_ospool_job() ignores a blank LastRemotePool
+NONBLANK_LAST_REMOTE_POOL = {"regexp": {"LastRemotePool.keyword": ".*[^ ].*"}}
+
+
+class OspoolQueryMixin:
+    """Narrows an OSPool filter's query to the job ads that
+    its is_ospool_job() can accept, so that ads that ran elsewhere
+    are not fetched just to be thrown away
+
+    An ad is from the OSPool if its LastRemotePool is one of
+    the filter's collector_hosts, or, if it has no LastRemotePool,
+    if its schedd reports to one of them. The OSPool schedds are
+    looked up before the scan using the filter's schedd_collector_host(),
+    only for the schedds of ads without a LastRemotePool in the report
+    period. The filter methods keep checking is_ospool_job(),
+    so a query that can't be narrowed is safe."""
+
+    ospool_schedds = None
+
+    def plan_query(self, indices, start_ts, end_ts):
+        super().plan_query(indices, start_ts, end_ts)
+        self.ospool_schedds = None
+        try:
+            schedd_names = self.get_schedd_names(indices, start_ts, end_ts, must_not=[NONBLANK_LAST_REMOTE_POOL])
+        except elasticsearch.exceptions.TransportError as err:
+            self.logger.warning(f"Could not get ScheddNames, filtering out non-OSPool jobs after scanning: {err}")
+            return
+        if schedd_names is None:
+            self.logger.warning("Got too many ScheddNames, filtering out non-OSPool jobs after scanning")
+            return
+        self.ospool_schedds = {schedd for schedd in schedd_names if self.schedd_collector_host(schedd) & self.collector_hosts}
+        self.logger.debug(f"Found {len(self.ospool_schedds)} OSPool schedds out of {len(schedd_names)} schedds with ads without a LastRemotePool.")
+
+    def add_ospool_query(self, query):
+        # Adds the OSPool test to the query's filters
+        # if the OSPool schedds have been looked up
+        if self.ospool_schedds is None:
+            return query
+        query["body"]["query"]["bool"]["filter"].append(
+            {"bool": {
+                "should": [
+                    {"terms": {
+                        "LastRemotePool.keyword": sorted(self.collector_hosts)
+                    }},
+                    {"bool": {
+                        "filter": [
+                            {"terms": {
+                                "ScheddName.keyword": sorted(self.ospool_schedds)
+                            }},
+                        ],
+                        "must_not": [
+                            NONBLANK_LAST_REMOTE_POOL,
+                        ],
+                    }},
+                ],
+                "minimum_should_match": 1,
+            }}
+        )
+        return query
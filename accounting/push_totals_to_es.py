@@ -3,6 +3,7 @@ import elasticsearch
 import logging
 from pathlib import Path
 import importlib
+from accounting.functions import get_es_serializer
 
 logger = logging.getLogger("accounting.push_totals_to_es")
 
@@ -73,7 +74,7 @@ def push_totals_to_es(csv_files, index_name, **kwargs):
             es_client["use_ssl"] = True
             es_client["verify_certs"] = True
 
-        return elasticsearch.Elasticsearch([es_client])
+        return elasticsearch.Elasticsearch([es_client], **get_es_serializer(kwargs.get("es_serializer", "auto")))
 
     def make_index(client, index):
         index_client = elasticsearch.client.IndicesClient(client)
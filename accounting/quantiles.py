@@ -0,0 +1,315 @@
+import math
+import heapq
+import tempfile
+from array import array
+
+
+DEFAULT_QUANTILE_ACCURACY = 0.01
+DEFAULT_SPILL_VALUES = 1_000_000
+MAX_SPILL_RUNS = 16
+
+MASK_64 = 2**64 - 1
+
+
+class QuantileSummary:
+    """Base class of summaries of a stream of numbers that answer
+    quantile queries. The count, total, min, max, mean and (with
+    Welford's algorithm) the variance of the stream are kept exactly,
+    subclasses store the values and implement add(), merge() and
+    values_at()."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.mean = 0.
+        self.m2 = 0.
+
+    def __len__(self):
+        return self.count
+
+    def add_stats(self, value):
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def merge_stats(self, other):
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta**2 * self.count * other.count / count
+        self.count = count
+        self.total += other.total
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def extend(self, values):
+        for value in values:
+            self.add(value)
+
+    def values_at(self, ranks):
+        # Returns the values at the given (sorted) indices of the sorted stream
+        raise NotImplementedError
+
+    def get_ranks(self, stat):
+        # Returns the indices of the sorted stream that a stat is computed from
+        n = self.count
+        if stat in {"mean", "stdev"}:
+            return []
+        if stat == "median":
+            return [n // 2] if n % 2 == 1 else [n//2 - 1, n // 2]
+        return [min(int(stat * n), n - 1)]
+
+    def get_stats(self, stats):
+        # Returns a list of stat()s, reading the values they need all at once
+        if self.count == 0:
+            return [0 for stat in stats]
+        ranks = sorted({rank for stat in stats for rank in self.get_ranks(stat)})
+        inner_ranks = [rank for rank in ranks if 0 < rank < self.count - 1]
+        values = dict(zip(inner_ranks, self.values_at(inner_ranks)))
+        values[0] = self.min
+        values[self.count - 1] = self.max
+        row = []
+        for stat in stats:
+            if stat == "mean":
+                row.append(self.total / self.count)
+            elif stat == "stdev":
+                row.append(math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0)
+            elif stat == "median" and self.count % 2 == 0:
+                (low, high) = self.get_ranks(stat)
+                row.append((values[low] + values[high]) / 2)
+            else:
+                row.append(values[self.get_ranks(stat)[0]])
+        return row
+
+    def stat(self, stat):
+        # Returns a quantile (0 <= stat <= 1, the value at index
+        # int(stat*count) of the sorted stream, like Percentile),
+        # the "median" (like statistics.median()), "mean" or "stdev",
+        # or 0 for an empty stream
+        return self.get_stats([stat])[0]
+
+
+class QuantileSketch(QuantileSummary):
+    """Mergeable KLL sketch of a stream of numbers, which answers
+    quantile queries within about accuracy * count ranks of the
+    exact answer in memory that does not grow with the count.
+
+    Values are kept in levels of "compactors", where each value at
+    level h stands for 2**h values of the stream. When the sketch is
+    full, a level is sorted and every other value (starting at a
+    random offset) is promoted to the next level. Sketches of
+    disjoint streams can be merged into a sketch of their union.
+    Streams of up to k values are kept whole, so their quantiles are
+    exact."""
+
+    c = 2/3  # capacity ratio between consecutive levels
+
+    def __init__(self, accuracy=DEFAULT_QUANTILE_ACCURACY, seed=1):
+        super().__init__()
+        self.accuracy = accuracy
+        self.k = max(8, int(math.ceil(2.3 / accuracy)))
+        self.levels = [[]]
+        self.size = 0
+        self.max_size = self.capacity(0)
+        self.seed = seed
+        self.sorted_values = None
+
+    def capacity(self, h):
+        # Lower levels get exponentially smaller capacities
+        depth = len(self.levels) - h - 1
+        return int(math.ceil(self.k * self.c**depth)) + 1
+
+    def add(self, value):
+        self.add_stats(value)
+        self.levels[0].append(value)
+        self.size += 1
+        self.sorted_values = None
+        if self.size >= self.max_size:
+            self.compress()
+
+    def merge(self, other):
+        # Merges other (a sketch of a disjoint stream) into this sketch in place
+        if other.count == 0:
+            return self
+        self.merge_stats(other)
+        while len(self.levels) < len(other.levels):
+            self.grow()
+        for (level, other_level) in zip(self.levels, other.levels):
+            level.extend(other_level)
+        self.size = sum(len(level) for level in self.levels)
+        self.sorted_values = None
+        while self.size >= self.max_size:
+            self.compress()
+        return self
+
+    def grow(self):
+        self.levels.append([])
+        self.max_size = sum(self.capacity(h) for h in range(len(self.levels)))
+
+    def coin(self):
+        # Returns a pseudorandom bit from a xorshift generator, which
+        # keeps sketches of the same stream identical from run to run
+        x = self.seed
+        x ^= (x << 13) & MASK_64
+        x ^= x >> 7
+        x ^= (x << 17) & MASK_64
+        self.seed = x
+        return x & 1
+
+    def compress(self):
+        # Compacts the lowest full level into the next level
+        for h in range(len(self.levels)):
+            level = self.levels[h]
+            if len(level) < self.capacity(h):
+                continue
+            if h + 1 == len(self.levels):
+                self.grow()
+            leftover = [level.pop()] if len(level) % 2 else []
+            level.sort()
+            self.levels[h + 1].extend(level[self.coin()::2])
+            self.levels[h] = leftover
+            self.size = sum(len(level) for level in self.levels)
+            if self.size < self.max_size:
+                break
+
+    def get_sorted_values(self):
+        # Returns the sorted (value, cumulative weight) pairs of the sketch
+        if self.sorted_values is None:
+            weighted = sorted((value, 2**h) for (h, level) in enumerate(self.levels) for value in level)
+            cumulative = 0
+            self.sorted_values = []
+            for (value, weight) in weighted:
+                cumulative += weight
+                self.sorted_values.append((value, cumulative))
+        return self.sorted_values
+
+    def values_at(self, ranks):
+        # Returns the estimated values at the given indices of the sorted stream
+        sorted_values = self.get_sorted_values()
+        values = []
+        for rank in ranks:
+            (lo, hi) = (0, len(sorted_values) - 1)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if sorted_values[mid][1] > rank:
+                    hi = mid
+                else:
+                    lo = mid + 1
+            values.append(sorted_values[lo][0])
+        return values
+
+
+class ExternalQuantiles(QuantileSummary):
+    """Exact quantiles of a stream of numbers in bounded memory.
+
+    Up to max_values values are buffered in memory, then sorted and
+    spilled as a run of doubles to a temp file in spill_dir. Once
+    there are more than MAX_SPILL_RUNS runs, they are merged into one
+    run to bound the number of open files. The values at the requested
+    ranks are selected by a single k-way merge of the sorted runs and
+    the sorted buffer. Merging adopts the other summary's runs, and
+    pickling (e.g. when filter worker processes send back partial
+    data) reads the runs back into the buffer."""
+
+    def __init__(self, max_values=DEFAULT_SPILL_VALUES, spill_dir=None):
+        super().__init__()
+        self.max_values = max_values
+        self.spill_dir = spill_dir
+        self.values = []
+        self.runs = []
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["values"] = list(self.iter_sorted())
+        state["runs"] = []
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if len(self.values) >= self.max_values:
+            self.spill()
+
+    def add(self, value):
+        self.add_stats(value)
+        self.values.append(value)
+        if len(self.values) >= self.max_values:
+            self.spill()
+
+    def merge(self, other):
+        # Merges other (a summary of a disjoint stream) into this one in place
+        if other.count == 0:
+            return self
+        self.merge_stats(other)
+        self.runs.extend(other.runs)
+        other.runs = []
+        self.values.extend(other.values)
+        if len(self.values) >= self.max_values:
+            self.spill()
+        elif len(self.runs) > MAX_SPILL_RUNS:
+            self.merge_runs()
+        return self
+
+    def spill(self):
+        # Writes the buffered values to a temp file as a sorted run,
+        # the file is deleted once it is closed or garbage collected
+        self.values.sort()
+        run = tempfile.TemporaryFile(dir=self.spill_dir)
+        array("d", self.values).tofile(run)
+        self.runs.append(run)
+        self.values = []
+        if len(self.runs) > MAX_SPILL_RUNS:
+            self.merge_runs()
+
+    def merge_runs(self, chunk_size=65536):
+        # Merges all of the runs into a single sorted run
+        run = tempfile.TemporaryFile(dir=self.spill_dir)
+        chunk = array("d")
+        for value in heapq.merge(*[self.iter_run(old_run) for old_run in self.runs]):
+            chunk.append(value)
+            if len(chunk) >= chunk_size:
+                chunk.tofile(run)
+                chunk = array("d")
+        chunk.tofile(run)
+        for old_run in self.runs:
+            old_run.close()
+        self.runs = [run]
+
+    def iter_run(self, run, chunk_size=65536):
+        run.seek(0)
+        while True:
+            chunk = array("d")
+            try:
+                chunk.fromfile(run, chunk_size)
+            except EOFError:
+                pass  # chunk holds the rest of the run
+            if len(chunk) == 0:
+                return
+            yield from chunk
+
+    def iter_sorted(self):
+        # Returns an iterator over all of the values in sorted order
+        self.values.sort()
+        return heapq.merge(self.values, *[self.iter_run(run) for run in self.runs])
+
+    def values_at(self, ranks):
+        # Returns the exact values at the given sorted indices of the sorted stream
+        values = []
+        wanted = iter(ranks)
+        rank = next(wanted, None)
+        if rank is None:
+            return values
+        for (n, value) in enumerate(self.iter_sorted()):
+            while rank == n:
+                values.append(value)
+                rank = next(wanted, None)
+            if rank is None:
+                break
+        return values
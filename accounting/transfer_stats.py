@@ -0,0 +1,68 @@
+# Key class bits
+FILES = 1  # *FilesCountTotal
+BYTES = 2  # *SizeBytesTotal
+OSDF_FILES = 4  # OSDF/Stash FilesCountTotal
+OSDF_BYTES = 8  # OSDF/Stash SizeBytesTotal
+CEDAR_BYTES = 16  # CedarSizeBytesTotal
+
+OSDF_FILES_KEYS = {"stashfilescounttotal", "osdffilescounttotal"}
+OSDF_BYTES_KEYS = {"stashsizebytestotal", "osdfsizebytestotal"}
+
+# Only a few dozen distinct keys show up in practice,
+# so keep the cache bounded in case of garbage keys
+TRANSFER_KEY_CLASSES = {}
+MAX_CACHED_KEYS = 4096
+
+
+def classify_transfer_key(key):
+    """Returns the class bits for a TransferInputStats/TransferOutputStats key"""
+    key_class = TRANSFER_KEY_CLASSES.get(key)
+    if key_class is not None:
+        return key_class
+
+    folded_key = key.casefold()
+    key_class = 0
+    if folded_key in OSDF_FILES_KEYS:
+        key_class |= OSDF_FILES
+    if folded_key in OSDF_BYTES_KEYS:
+        key_class |= OSDF_BYTES
+    if folded_key.endswith("filescounttotal"):
+        key_class |= FILES
+    elif folded_key.endswith("sizebytestotal"):
+        key_class |= BYTES
+        if folded_key == "cedarsizebytestotal":
+            key_class |= CEDAR_BYTES
+
+    if len(TRANSFER_KEY_CLASSES) < MAX_CACHED_KEYS:
+        TRANSFER_KEY_CLASSES[key] = key_class
+    return key_class
+
+
+def parse_transfer_stats(stats):
+    """Totals up one TransferInputStats or TransferOutputStats dict in a
+    single pass and returns a tuple of
+    (files, bytes, osdf_files, osdf_bytes, got_cedar_bytes)"""
+    files = 0
+    size_bytes = 0
+    osdf_files = 0
+    osdf_bytes = 0
+    got_cedar_bytes = False
+    key_classes = TRANSFER_KEY_CLASSES
+    for (key, value) in stats.items():
+        key_class = key_classes.get(key)
+        if key_class is None:
+            key_class = classify_transfer_key(key)
+        if not key_class:
+            continue
+        if key_class & OSDF_FILES:
+            osdf_files += value
+        elif key_class & OSDF_BYTES:
+            osdf_bytes += value
+        if key_class & FILES:
+            files += value
+        elif key_class & BYTES:
+            size_bytes += value
+            if key_class & CEDAR_BYTES:
+                got_cedar_bytes = True
+    return (files, size_bytes, osdf_files, osdf_bytes, got_cedar_bytes)
+
@@ -0,0 +1,70 @@
+import time
+
+from accounting.transfer_stats import parse_transfer_stats
+
+
+def parse_transfer_stats_uncached(stats):
+    # The per-key casefold()/endswith() checks that
+    # parse_transfer_stats replaced in the filters
+    files = 0
+    size_bytes = 0
+    osdf_files = 0
+    osdf_bytes = 0
+    got_cedar_bytes = False
+    for attr in stats:
+        if attr.casefold() in {"stashfilescounttotal", "osdffilescounttotal"}:
+            osdf_files += stats[attr]
+        if attr.casefold() in {"stashsizebytestotal", "osdfsizebytestotal"}:
+            osdf_bytes += stats[attr]
+        if attr.casefold().endswith("FilesCountTotal".casefold()):
+            files += stats[attr]
+        elif attr.casefold().endswith("SizeBytesTotal".casefold()):
+            size_bytes += stats[attr]
+            if attr.casefold() == "CedarSizeBytesTotal".casefold():
+                got_cedar_bytes = True
+    return (files, size_bytes, osdf_files, osdf_bytes, got_cedar_bytes)
+
+
+BENCHMARK_STATS = [
+    # Input stats for a job pulling from OSDF and the AP
+    {
+        "CedarFilesCount": 3, "CedarFilesCountTotal": 3,
+        "CedarSizeBytes": 52_428, "CedarSizeBytesTotal": 52_428,
+        "OSDFFilesCount": 2, "OSDFFilesCountTotal": 4,
+        "OSDFSizeBytes": 1_073_741_824, "OSDFSizeBytesTotal": 2_147_483_648,
+        "OSDFTransferTimeTotal": 38, "OSDFTransferTime": 19,
+    },
+    # Input stats for a job with an HTTP download and older Stash keys
+    {
+        "CedarFilesCountTotal": 1, "CedarSizeBytesTotal": 4_096,
+        "HttpFilesCount": 1, "HttpFilesCountTotal": 1,
+        "HttpSizeBytes": 10_485_760, "HttpSizeBytesTotal": 10_485_760,
+        "StashFilesCountTotal": 1, "StashSizeBytesTotal": 524_288_000,
+    },
+    # Output stats for a job writing back to the AP only
+    {
+        "CedarFilesCount": 1, "CedarFilesCountTotal": 2,
+        "CedarSizeBytes": 20_480, "CedarSizeBytesTotal": 40_960,
+    },
+]
+
+
+def main(num_jobs=200_000):
+    """Times parse_transfer_stats against the uncached per-key checks"""
+    stats_dicts = [BENCHMARK_STATS[n % len(BENCHMARK_STATS)] for n in range(num_jobs)]
+    results = {}
+    for parse in [parse_transfer_stats_uncached, parse_transfer_stats]:
+        best = float("inf")
+        for _ in range(3):
+            start = time.perf_counter()
+            for stats in stats_dicts:
+                parse(stats)
+            best = min(best, time.perf_counter() - start)
+        results[parse.__name__] = best
+        print(f"{parse.__name__}: {1e6 * best / num_jobs:.2f} us/dict")
+    print(f"speedup: {results['parse_transfer_stats_uncached'] / results['parse_transfer_stats']:.1f}x")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,17 @@ from datetime import datetime, timedelta
 from pathlib import Path
 
 import elasticsearch
+from elasticsearch.serializer import JSONSerializer
+from elasticsearch.exceptions import SerializationError
+
+try:
+    import orjson
+except ModuleNotFoundError:
+    orjson = None
+try:
+    import msgspec
+except ModuleNotFoundError:
+    msgspec = None
 
 
 LOG_SCHEDD_ENTRY_RE = re.compile(r"(?P<datetime>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})(,\d+)? : (?P<logger>[^:]+):(?P<log_level>\S+) - Schedd\s+(?P<schedd>\S+)\s+history:\s+response count:\s+(?P<num_ads>\d+);\s+last completion\s+(?P<last_job_seen>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2});")
@@ -19,6 +30,58 @@ LINE_REGEXES = {
 }
 
 
+class OrjsonSerializer(JSONSerializer):
+    # Elasticsearch serializer that uses orjson instead of the json module
+
+    def loads(self, s):
+        try:
+            return orjson.loads(s)
+        except orjson.JSONDecodeError as e:
+            raise SerializationError(s, e)
+
+    def dumps(self, data):
+        if isinstance(data, str):
+            return data
+        try:
+            return orjson.dumps(
+                data,
+                default=self.default,
+                option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY,
+            ).decode("utf-8")
+        except (TypeError, orjson.JSONEncodeError) as e:
+            raise SerializationError(data, e)
+
+
+class MsgspecSerializer(JSONSerializer):
+    # Elasticsearch serializer that uses msgspec instead of the json module
+
+    def loads(self, s):
+        try:
+            return msgspec.json.decode(s)
+        except msgspec.DecodeError as e:
+            raise SerializationError(s, e)
+
+    def dumps(self, data):
+        if isinstance(data, str):
+            return data
+        try:
+            return msgspec.json.encode(data, enc_hook=self.default).decode("utf-8")
+        except (TypeError, msgspec.EncodeError) as e:
+            raise SerializationError(data, e)
+
+
+def get_es_serializer(serializer="auto"):
+    # Returns Elasticsearch serializer kwargs for the requested JSON library,
+    # "auto" picks the fastest one available, "json" keeps the client default
+    if serializer in {"auto", "orjson"} and orjson is not None:
+        return {"serializer": OrjsonSerializer()}
+    if serializer in {"auto", "msgspec"} and msgspec is not None:
+        return {"serializer": MsgspecSerializer()}
+    if serializer not in {"auto", "json"}:
+        print(f"WARNING: {serializer} is not installed, using default JSON serializer")
+    return {}
+
+
 def valid_date(date_str: str) -> datetime:
     try:
         return datetime.strptime(date_str, "%Y-%m-%d")
@@ -114,7 +177,7 @@ def connect(es_host, es_user, es_pass, es_use_https, es_ca_certs, **kwargs) -> e
         es_client["use_ssl"] = True
         es_client["verify_certs"] = True
 
-    return elasticsearch.Elasticsearch([es_client])
+    return elasticsearch.Elasticsearch([es_client], **get_es_serializer(kwargs.get("es_serializer", "auto")))
 
 
 def make_index(client, index):
@@ -17,6 +17,7 @@ import elasticsearch
 os.environ["CONDOR_CONFIG"] = os.environ.get("CONDOR_CONFIG", "/dev/null")
 import accounting
 from accounting.push_totals_to_es import push_totals_to_es
+from accounting.multi_filter import MultiFilter
 
 args = accounting.parse_args(sys.argv[1:])
 
@@ -38,12 +39,19 @@ if not args.quiet:
     sh.setLevel(logger.getEffectiveLevel())
     logger.addHandler(sh)
 
+# Each filter is only run once, even if several reports use it
+filter_classes = list(dict.fromkeys(args.filters))
+
 if args.report_period != "daily" or not args.restart:
     for tries in range(3):
         try:
-            logger.info(f"Filtering data using {args.filter.__name__}")
-            filtr = args.filter(**vars(args))
-            raw_data = filtr.get_filtered_data()
+            if len(filter_classes) == 1:
+                logger.info(f"Filtering data using {args.filter.__name__}")
+                filtrs = [args.filter(**vars(args))]
+            else:
+                logger.info(f"Filtering data using {', '.join(filter_class.__name__ for filter_class in filter_classes)} in a single scan")
+                filtrs = [filter_class(**vars(args), skip_init=True) for filter_class in filter_classes]
+                MultiFilter(filtrs, **vars(args))
         except elasticsearch.exceptions.ConnectionTimeout:
             logger.info(f"Elasticsearch connection timed out, trying again (try {tries+1})")
             time.sleep(4**(tries+1))
@@ -54,69 +62,79 @@ if args.report_period != "daily" or not args.restart:
         sys.exit(1)
 
     if args.report_period == "daily":
-        last_data_file = Path(f"last_data_{args.filter.__name__}.pickle")
-        logger.debug(f"Dumping data to {last_data_file}")
-        with last_data_file.open("wb") as f:
-            pickle.dump(raw_data, f, pickle.HIGHEST_PROTOCOL)
+        for filtr in filtrs:
+            last_data_file = Path(f"last_data_{type(filtr).__name__}.pickle")
+            logger.debug(f"Dumping data to {last_data_file}")
+            with last_data_file.open("wb") as f:
+                pickle.dump(filtr.get_filtered_data(), f, pickle.HIGHEST_PROTOCOL)
 
 else:
-    last_data_file = Path(f"last_data_{args.filter.__name__}.pickle")
-    logger.debug(f"Reading data from {last_data_file}")
-    with last_data_file.open("rb") as f:
-        raw_data = pickle.load(f)
-    logger.info(f"Filtering data using {args.filter.__name__}")
-    filtr = args.filter(**vars(args), skip_init=True)
-    filtr.data = raw_data
-
-table_names = list(raw_data.keys())
-logger.debug(f"Got {len(table_names)} tables: {', '.join(table_names)}")
-csv_files = {}
-for table_name in table_names:
-    logger.debug(f"Collapsing data for {table_name} table")
-    table_data = filtr.merge_filtered_data(filtr.get_filtered_data(), table_name)
-    logger.debug(f"{table_name} table has {len(table_data)} rows")
-    logger.debug(f"Generating CSV for {table_name}")
-    csv_files[table_name] = accounting.write_csv(table_data, filtr.name, table_name, **vars(args))
-
-table_files = [csv_files[name] for name in ["Projects", "Users", "Schedds", "Site", "Institution", "Machine", "Jobs", "JobRequests", "JobUsages"] if name in csv_files]
-logger.info(f"Formatting data using {args.formatter.__name__}")
-formatter = args.formatter(table_files, **vars(args))
-logger.debug(f"Generating HTML")
-html = formatter.get_html()
-
-last_html_file = Path(f"last_html_{args.formatter.__name__}.html")
-logger.debug(f"Dumping HTML to {last_html_file}")
-with last_html_file.open("w") as f:
-    f.write(html)
-
-logger.info("Sending email")
-try:
-    accounting.send_email(
-        subject=formatter.get_subject(**vars(args)),
-        html=html,
-        table_files=table_files,
-        **vars(args))
-except Exception:
-    logger.exception("Caught exception while sending email")
-    if args.quiet:
-        print_exc(file=sys.stderr)
-
-if args.report_period in ["daily", "weekly", "monthly"] and not args.do_not_upload:
-    logger.info("Pushing daily totals to Elasticsearch")
+    filtrs = []
+    for filter_class in filter_classes:
+        last_data_file = Path(f"last_data_{filter_class.__name__}.pickle")
+        logger.debug(f"Reading data from {last_data_file}")
+        with last_data_file.open("rb") as f:
+            raw_data = pickle.load(f)
+        logger.info(f"Filtering data using {filter_class.__name__}")
+        filtr = filter_class(**vars(args), skip_init=True)
+        filtr.data = raw_data
+        filtrs.append(filtr)
+
+filtrs = dict(zip(filter_classes, filtrs))
+for (filter_class, formatter_class) in zip(args.filters, args.formatters):
+    filtr = filtrs[filter_class]
+    report_args = dict(vars(args), filter=filter_class, formatter=formatter_class)
+
+    raw_data = filtr.get_filtered_data()
+    table_names = list(raw_data.keys())
+    logger.debug(f"Got {len(table_names)} tables: {', '.join(table_names)}")
+    csv_files = {}
+    for table_name in table_names:
+        logger.debug(f"Collapsing data for {table_name} table")
+        table_data = filtr.merge_filtered_data(filtr.get_filtered_data(), table_name)
+        logger.debug(f"{table_name} table has {len(table_data)} rows")
+        logger.debug(f"Generating CSV for {table_name}")
+        csv_files[table_name] = accounting.write_csv(table_data, filtr.name, table_name, **report_args)
+
+    table_files = [csv_files[name] for name in ["Projects", "Users", "Schedds", "Site", "Institution", "Machine", "Jobs", "JobRequests", "JobUsages"] if name in csv_files]
+    logger.info(f"Formatting data using {formatter_class.__name__}")
+    formatter = formatter_class(table_files, **report_args)
+    logger.debug(f"Generating HTML")
+    html = formatter.get_html()
+
+    last_html_file = Path(f"last_html_{formatter_class.__name__}.html")
+    logger.debug(f"Dumping HTML to {last_html_file}")
+    with last_html_file.open("w") as f:
+        f.write(html)
+
+    logger.info("Sending email")
     try:
-        push_totals_to_es(table_files, "daily_totals", **vars(args))
-    except Exception as e:
-        logger.error("Could not push daily totals to Elasticsearch")
-        if args.debug:
-            logger.exception("Error follows")
-
-    # Push summary data to tables in Tiger
-    if Path("tiger-es-summary-config.json").exists():
-        logger.info("Pushing daily totals to Tiger Elasticsearch")
+        accounting.send_email(
+            subject=formatter.get_subject(**report_args),
+            html=html,
+            table_files=table_files,
+            **report_args)
+    except Exception:
+        logger.exception("Caught exception while sending email")
+        if args.quiet:
+            print_exc(file=sys.stderr)
+
+    if args.report_period in ["daily", "weekly", "monthly"] and not args.do_not_upload:
+        logger.info("Pushing daily totals to Elasticsearch")
         try:
-            tiger_args = json.load(Path("tiger-es-summary-config.json").open("r"))
-            push_totals_to_es(table_files, "usage-summary-000001", **tiger_args)
+            push_totals_to_es(table_files, "daily_totals", **report_args)
         except Exception as e:
-            logger.error("Could not push daily totals to Tiger Elasticsearch")
+            logger.error("Could not push daily totals to Elasticsearch")
             if args.debug:
                 logger.exception("Error follows")
+
+        # Push summary data to tables in Tiger
+        if Path("tiger-es-summary-config.json").exists():
+            logger.info("Pushing daily totals to Tiger Elasticsearch")
+            try:
+                tiger_args = json.load(Path("tiger-es-summary-config.json").open("r"))
+                push_totals_to_es(table_files, "usage-summary-000001", **tiger_args)
+            except Exception as e:
+                logger.error("Could not push daily totals to Tiger Elasticsearch")
+                if args.debug:
+                    logger.exception("Error follows")